@@ -0,0 +1,630 @@
+"""
+Zebra Print Server for Pharmacy RX Manager - asyncio engine
+Serves the same API as print_server.py from a single event loop (aiohttp),
+so browser tabs polling /status and /jobs hold a cheap connection instead of
+a worker thread. Network printers are written to with non-blocking TCP, and
+Windows spooler calls run on a small bounded thread pool.
+
+Run with:  python async_print_server.py
+"""
+
+import asyncio
+import logging
+import os
+import socket
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from aiohttp import web
+from print_queue import AsyncPrintQueue, parse_priority, DEFAULT_COALESCE_MAX_BYTES, DEFAULT_BULK_EVERY
+from job_journal import JobJournal, QUERY_PARAMS as JOURNAL_QUERY_PARAMS
+from job_events import (JobEvents, parse_last_event_id, parse_filter, HEADERS as EVENT_STREAM_HEADERS,
+                        HEARTBEAT_INTERVAL, DEFAULT_BUFFER_SIZE as DEFAULT_EVENT_BUFFER_SIZE)
+from idempotency import idempotency_cache, request_keys as idempotency_keys, HEADER as IDEMPOTENCY_HEADER
+from job_store import JobRegistry, DEFAULT_CAPACITY
+from print_intake import PrintIntake, PrintRequestError
+from print_batch import parse_batch_labels, parse_copies, build_batch_document
+from zpl_utils import set_copies
+from label_archive import archive_label, ARCHIVE_DIR
+from stored_formats import stored_formats, build_prescription_recall
+from label_templates import render_prescription_labels
+from printer_registry import PrinterRegistry, DEFAULT_REFRESH_INTERVAL
+from tcp_printer import network_printers, AsyncTcpConnectionPool, DEFAULT_WRITE_TIMEOUT, DEFAULT_IDLE_TIMEOUT
+from print_metrics import print_metrics, CONTENT_TYPE as METRICS_CONTENT_TYPE
+from server_logging import configure_logging
+from simulated_printer import simulated_printers
+from circuit_breaker import circuit_breakers
+from printer_health import (PrinterHealth, parse_host_status, HOST_STATUS_COMMAND, HOST_STATUS_FRAMES,
+                            DEFAULT_INTERVAL as DEFAULT_HEALTH_INTERVAL, DEFAULT_TIMEOUT as DEFAULT_HEALTH_TIMEOUT)
+from production_server import DEFAULT_BACKLOG, DEFAULT_MAX_REQUEST_SIZE, DEFAULT_DRAIN_TIMEOUT
+from printer_groups import PrinterGroups, parse_groups, affinity_key, EARLIEST_COMPLETION, DEFAULT_AFFINITY_TTL
+
+if sys.platform == 'win32':
+    from win32_spooler import spool_raw, enumerate_printers, handle_pool, printer_status as spooler_status
+
+# Configure logging
+configure_logging()
+
+logger = logging.getLogger(__name__)
+
+# Threads for blocking spooler calls; more jobs than this wait their turn
+DEFAULT_SPOOL_THREADS = 4
+
+# Seconds an idle keep-alive connection is held open
+DEFAULT_KEEPALIVE_TIMEOUT = 75
+
+CORS_HEADERS = {
+    'Access-Control-Allow-Origin': '*',
+    'Access-Control-Allow-Headers': 'Content-Type,Authorization,Idempotency-Key',
+    'Access-Control-Allow-Methods': 'GET,POST,OPTIONS'
+}
+
+# Print job history
+job_registry = JobRegistry(int(os.environ.get('MAX_STORED_JOBS', DEFAULT_CAPACITY)))
+
+# Optional durable job history for audits
+job_journal = JobJournal(os.environ['JOB_JOURNAL_PATH']) if os.environ.get('JOB_JOURNAL_PATH') else None
+
+# Job and printer changes pushed to /jobs/stream; an open stream is only an idle connection here
+job_events = JobEvents(
+    capacity=int(os.environ.get('EVENT_BUFFER_SIZE', DEFAULT_EVENT_BUFFER_SIZE)),
+    max_streams=0,
+    stream_max_age=0
+)
+
+# Blocking spooler calls run here so they never stall the event loop
+spool_executor = ThreadPoolExecutor(
+    max_workers=int(os.environ.get('SPOOL_THREADS', DEFAULT_SPOOL_THREADS)),
+    thread_name_prefix="spooler"
+)
+
+# Persistent non-blocking connections to network printers
+tcp_pool = AsyncTcpConnectionPool(
+    write_timeout=float(os.environ.get('PRINTER_WRITE_TIMEOUT', DEFAULT_WRITE_TIMEOUT)),
+    idle_timeout=int(os.environ.get('PRINTER_CONNECTION_IDLE_TIMEOUT', DEFAULT_IDLE_TIMEOUT))
+)
+
+def get_available_printers():
+    """Enumerate printers and pick the default. Raises if the list can't be read."""
+    if sys.platform == 'win32':
+        printers, default_printer = enumerate_printers()
+    else:
+        # For development on non-Windows platforms, return simulated list
+        # (unless real network printers are configured)
+        printers = [] if network_printers.names() else ["ZDesigner GK420d (Copy 1)", "Zebra GK420D (Simulated)", "Microsoft Print to PDF"]
+        default_printer = None
+
+    # Networked printers are reached over raw TCP on any platform
+    printers = list(printers) + [name for name in network_printers.names() if name not in printers]
+
+    # Find default Zebra printer if none is set
+    if default_printer not in printers:
+        default_printer = next(
+            (printer for printer in printers if 'zebra' in printer.lower() or 'zdesigner' in printer.lower()),
+            printers[0] if printers else None
+        )
+    return printers, default_printer
+
+# Cached printer list, refreshed in the background
+printer_registry = PrinterRegistry(
+    get_available_printers,
+    refresh_interval=int(os.environ.get('PRINTER_REFRESH_INTERVAL', DEFAULT_REFRESH_INTERVAL))
+)
+printer_registry.start()
+
+HEALTH_TIMEOUT = float(os.environ.get('PRINTER_HEALTH_TIMEOUT', DEFAULT_HEALTH_TIMEOUT))
+
+# The server's event loop, set on startup; tcp_pool's streams belong to it
+app_loop = None
+
+def printer_status(printer_name):
+    """Health flags for one printer, read on the health monitor's threads"""
+    address = network_printers.address(printer_name)
+    if address:
+        if app_loop is None:
+            return None
+        # Asked over the same stream the printer's jobs use, between jobs
+        query = tcp_pool.query(address, HOST_STATUS_COMMAND, HOST_STATUS_FRAMES, HEALTH_TIMEOUT)
+        response = asyncio.run_coroutine_threadsafe(query, app_loop).result()
+        return parse_host_status(response) if response else None
+    if sys.platform == 'win32':
+        return spooler_status(printer_name)
+    return parse_host_status(simulated_printers.get(printer_name).host_status())
+
+# Paper-out, paused and head-open flags for each printer, polled in the background
+printer_health = PrinterHealth(
+    printer_status,
+    printer_registry.printers,
+    interval=float(os.environ.get('PRINTER_HEALTH_INTERVAL', DEFAULT_HEALTH_INTERVAL))
+)
+printer_health.add_listener(job_events.record_health)
+# A printer that was offline or stopped may have been power-cycled and lost its formats
+stored_formats.follow(printer_health)
+printer_health.start()
+
+def printer_available(printer_name):
+    """Whether a printer can take jobs right now"""
+    known = bool(network_printers.address(printer_name)) or printer_name in printer_registry
+    return known and printer_health.is_ready(printer_name) and not circuit_breakers.is_open(printer_name)
+
+async def prefetch_printer(printer_name):
+    """
+    Look up a printer name the cache doesn't hold before print_intake
+    resolves it. A miss may re-enumerate printers, which blocks, so it is
+    done off the loop; the lookup print_intake then makes is answered
+    without enumerating again.
+    """
+    if (printer_name and printer_name not in printer_groups and printer_name not in printer_registry
+            and not network_printers.address(printer_name)):
+        await asyncio.get_running_loop().run_in_executor(None, printer_registry.lookup, printer_name)
+
+async def spool_label(printer_name, data, job):
+    """Send one queued job's ZPL bytes to the printer (runs on the printer's worker task)"""
+    loop = asyncio.get_running_loop()
+    # A paused or empty printer would take the job and never print it
+    printer_health.ensure_ready(printer_name)
+    # Prepend the stored-format download if this printer doesn't hold it yet
+    data = stored_formats.prepare(printer_name, job, data)
+
+    try:
+        address = network_printers.address(printer_name)
+        if address:
+            # Networked printers are written to directly on port 9100
+            with print_metrics.stage(printer_name, "write"):
+                await tcp_pool.send(address, data)
+            message = f"Print job sent to {printer_name}"
+        elif sys.platform == 'win32':
+            doc_name = "Test Print" if job.get("type") == "test_print" else "Prescription Labels"
+            job["spool_job_id"] = await loop.run_in_executor(spool_executor, spool_raw, printer_name, data, doc_name)
+            message = f"Print job sent to {printer_name}"
+        else:
+            # For development on non-Windows platforms
+            logger.info(f"Simulating print to {printer_name} (non-Windows environment)")
+            with print_metrics.stage(printer_name, "write"):
+                await loop.run_in_executor(spool_executor, simulated_printers.send, printer_name, data)
+            message = f"Simulated print job sent to {printer_name}"
+    except Exception:
+        # The printer may have lost its formats along with the job
+        stored_formats.invalidate(printer_name)
+        raise
+
+    stored_formats.confirm(printer_name, job)
+    if ARCHIVE_DIR:
+        await loop.run_in_executor(None, archive_label, job, data)
+    return message
+
+# Per-printer queues drained by tasks on the event loop
+print_queue = AsyncPrintQueue(
+    print_metrics.instrument_async(circuit_breakers.guard_async(spool_label)),
+    # Jobs for the same printer within this many ms go out as one write; 0 is off
+    coalesce_window=float(os.environ.get('PRINT_COALESCE_MS', 0)) / 1000,
+    coalesce_max_bytes=int(os.environ.get('PRINT_COALESCE_MAX_BYTES', DEFAULT_COALESCE_MAX_BYTES)),
+    # Interactive jobs in a row before a waiting bulk job gets a turn
+    bulk_every=int(os.environ.get('PRINT_BULK_EVERY', DEFAULT_BULK_EVERY))
+)
+print_queue.add_listener(print_metrics.record_job)
+print_queue.add_listener(job_events.record_job)
+if job_journal:
+    print_queue.add_listener(job_journal.record)
+
+# Values read when /metrics is scraped
+print_metrics.add_callback("print_queue_depth", "gauge", "Jobs waiting or spooling per printer", "printer", print_queue.depths)
+print_metrics.add_callback("printer_lookup_total", "counter", "Printer name lookups by cache result", "result", printer_registry.lookup_counts)
+print_metrics.add_callback("print_retries_total", "counter", "Print attempts retried after a transient error", "printer", circuit_breakers.retry_counts)
+print_metrics.add_callback("printer_circuit_open", "gauge", "1 while a printer's circuit breaker is open", "printer", circuit_breakers.open_circuits)
+print_metrics.add_callback("print_duplicates_total", "counter", "Repeated print requests answered with the original job", None,
+                           lambda: idempotency_cache.hits)
+
+# Named groups of printers that share the load, e.g. "counter"
+printer_groups = PrinterGroups(
+    parse_groups(os.environ.get('PRINTER_GROUPS', '')),
+    print_queue,
+    available_func=printer_available,
+    strategy=os.environ.get('PRINTER_GROUP_STRATEGY', EARLIEST_COMPLETION),
+    affinity_ttl=int(os.environ.get('PRINTER_GROUP_AFFINITY_TTL', DEFAULT_AFFINITY_TTL))
+)
+
+# Printer resolution, readiness checks and duplicate suppression for the print endpoints
+print_intake = PrintIntake(printer_registry, printer_groups, printer_health, job_registry, print_queue)
+
+# Looked up once; /status is polled before every print
+HOSTNAME = socket.gethostname()
+
+def error_response(error, status, **extra):
+    return web.json_response({"success": False, "error": error, **extra}, status=status)
+
+def request_error_response(error):
+    """The response for a print request turned away before queueing"""
+    return web.json_response(error.to_dict(), status=error.status, headers=error.headers)
+
+
+async def read_json(request):
+    """The request's JSON object, or None if the body is missing or not an object"""
+    try:
+        data = await request.json()
+    except ValueError:
+        return None
+    return data if isinstance(data, dict) else None
+
+def queued_response(job, queue_position, message, **extra):
+    return web.json_response({
+        "success": True,
+        "job_id": job["id"],
+        "status": job["status"],
+        "queue_position": queue_position,
+        "printer": job["printer"],
+        **extra,
+        "message": message
+    }, status=202)
+
+def duplicate_response(job):
+    """The original job for a repeated print request, which is not printed again"""
+    return web.json_response({
+        "success": True,
+        "duplicate": True,
+        "job_id": job["id"],
+        "status": job["status"],
+        "printer": job["printer"],
+        "message": f"Duplicate of print job {job['id']}, not printed again"
+    }, headers={"Idempotent-Replayed": "true"})
+
+@web.middleware
+async def cors_middleware(request, handler):
+    """Answer preflight requests and add CORS headers to every response"""
+    if request.method == 'OPTIONS':
+        return web.Response(headers=CORS_HEADERS)
+    try:
+        response = await handler(request)
+    except web.HTTPException as e:
+        e.headers.update(CORS_HEADERS)
+        raise
+    except Exception as e:
+        logger.error(f"Error processing {request.method} {request.path}: {str(e)}")
+        response = error_response(str(e), 500)
+    response.headers.update(CORS_HEADERS)
+    return response
+
+async def status(request):
+    """Check if the print server is online"""
+    return web.json_response({
+        "status": "online",
+        "version": "1.0.0",
+        "hostname": HOSTNAME,
+        "engine": "asyncio",
+        "timestamp": time.time(),
+        "printers": printer_health.summary()
+    })
+
+async def get_printers(request):
+    """Get a list of available printers"""
+    logger.debug("Printer list requested")
+
+    # Re-enumerate only when asked, otherwise serve the cached list
+    if request.query.get('refresh') in ('1', 'true'):
+        await asyncio.get_running_loop().run_in_executor(None, printer_registry.refresh)
+
+    return web.json_response({
+        "printers": printer_registry.printers(),
+        "default": printer_registry.default,
+        "refreshed_at": printer_registry.refreshed_at,
+        "groups": printer_groups.to_dict(),
+        "health": printer_health.to_dict(),
+        "circuits": circuit_breakers.to_dict()
+    })
+
+async def print_label(request):
+    """Print a label to the specified printer"""
+    started = time.perf_counter()
+    data = await read_json(request)
+    if not data:
+        print_metrics.reject("no_data")
+        return error_response("No data provided", 400)
+
+    zpl = data.get('zpl')
+    formats = []
+
+    # Stored-format mode: only the field values are sent and the layout
+    # is recalled from printer memory
+    if not zpl and data.get('fields'):
+        try:
+            zpl, format_name = build_prescription_recall(data.get('fields'))
+        except ValueError as e:
+            print_metrics.reject("invalid_fields")
+            return error_response(str(e), 400)
+        formats.append(format_name)
+
+    if not zpl:
+        print_metrics.reject("no_zpl")
+        return error_response("No ZPL code provided", 400)
+
+    # Copies are made by the printer from one ^PQ label, not sent again
+    try:
+        copies = parse_copies(data.get('copies', 1))
+        zpl = set_copies(zpl, copies)
+    except ValueError as e:
+        print_metrics.reject("invalid_copies")
+        return error_response(str(e), 400)
+
+    # Walk-in labels go ahead of bulk reprints
+    try:
+        priority = parse_priority(data.get('priority'))
+    except ValueError as e:
+        print_metrics.reject("invalid_priority")
+        return error_response(str(e), 400)
+
+    fields = {"priority": priority}
+    if formats:
+        fields["formats"] = formats
+    if copies > 1:
+        fields["copies"] = copies
+
+    # A repeat of a request that already printed (or is queued) gets the original job
+    keys = idempotency_keys(request.headers.get(IDEMPOTENCY_HEADER), data, data.get('printer'), zpl)
+
+    await prefetch_printer(data.get('printer'))
+    try:
+        job, queue_position = print_intake.queue(
+            data.get('printer'), zpl, affinity_key(data), keys, started=started, **fields)
+    except PrintRequestError as e:
+        return request_error_response(e)
+    if queue_position is None:
+        return duplicate_response(job)
+    return queued_response(job, queue_position, f"Print job queued for {job['printer']}")
+
+async def print_batch(request):
+    """Print several labels as one spooler job"""
+    data = await read_json(request)
+    if not data:
+        return error_response("No data provided", 400)
+
+    try:
+        accepted, results = parse_batch_labels(data.get('labels'))
+        priority = parse_priority(data.get('priority'))
+    except ValueError as e:
+        return error_response(str(e), 400)
+
+    if not accepted:
+        return error_response("No valid labels in batch", 400, results=results)
+
+    # All labels go to the printer as a single RAW document, already encoded
+    zpl = build_batch_document(accepted)
+    keys = idempotency_keys(request.headers.get(IDEMPOTENCY_HEADER), data, data.get('printer'), zpl)
+    await prefetch_printer(data.get('printer'))
+    try:
+        job, queue_position = print_intake.queue(
+            data.get('printer'), zpl, affinity_key(data), keys,
+            type="batch",
+            label_count=len(accepted),
+            copies=sum(copies for _, _, copies in accepted),
+            priority=priority
+        )
+    except PrintRequestError as e:
+        return request_error_response(e)
+    if queue_position is None:
+        return duplicate_response(job)
+    return queued_response(job, queue_position, f"Batch of {len(accepted)} label(s) queued for {job['printer']}",
+                           results=results)
+
+async def print_prescription(request):
+    """Render prescription labels on the server and print them as one spooler job"""
+    data = await read_json(request)
+    if not data:
+        return error_response("No data provided", 400)
+
+    labels = data.get('labels')
+    if labels is None and data.get('label'):
+        labels = [data.get('label')]
+
+    try:
+        accepted, results, formats = render_prescription_labels(
+            labels,
+            stored_format=bool(data.get('stored_format')),
+            version=data.get('template_version')
+        )
+        priority = parse_priority(data.get('priority'))
+    except ValueError as e:
+        return error_response(str(e), 400)
+
+    if not accepted:
+        return error_response("No valid labels in request", 400, results=results)
+
+    zpl = build_batch_document(accepted)
+    fields = {"type": "prescription", "label_count": len(accepted), "copies": len(accepted), "priority": priority}
+    if formats:
+        fields["formats"] = formats
+    keys = idempotency_keys(request.headers.get(IDEMPOTENCY_HEADER), data, data.get('printer'), zpl)
+    await prefetch_printer(data.get('printer'))
+    try:
+        job, queue_position = print_intake.queue(
+            data.get('printer'), zpl, affinity_key(data), keys, **fields)
+    except PrintRequestError as e:
+        return request_error_response(e)
+    if queue_position is None:
+        return duplicate_response(job)
+    return queued_response(job, queue_position, f"{len(accepted)} prescription label(s) queued for {job['printer']}",
+                           results=results)
+
+async def metrics(request):
+    """Prometheus metrics"""
+    return web.Response(body=print_metrics.render().encode(), headers={"Content-Type": METRICS_CONTENT_TYPE})
+
+async def get_jobs(request):
+    """Get a list of print jobs"""
+    # Time range, printer and status filters are answered from the journal
+    if job_journal and any(name in request.query for name in JOURNAL_QUERY_PARAMS):
+        try:
+            jobs, next_cursor = await asyncio.get_running_loop().run_in_executor(
+                None, job_journal.query_args, request.query)
+        except ValueError as e:
+            return web.json_response({"error": str(e)}, status=400)
+
+        return web.json_response({
+            "jobs": jobs,
+            "next_cursor": next_cursor
+        })
+
+    # Optionally filter by count
+    try:
+        count = int(request.query.get('count') or 0)
+    except ValueError:
+        count = 0
+    jobs = job_registry.recent(count or None)
+
+    return web.json_response({
+        "jobs": [job.to_dict() for job in jobs],
+        "total": len(job_registry)
+    })
+
+async def job_stream(request):
+    """Push job state and printer health changes as Server-Sent Events"""
+    # EventSource sends Last-Event-ID when it reconnects
+    last_id = parse_last_event_id(request.headers.get('Last-Event-ID') or request.query.get('last_event_id'))
+    job_ids = parse_filter(request.query.get('job_id'))
+    printers = parse_filter(request.query.get('printer'))
+
+    # Headers go out with prepare(), before the CORS middleware would see the response
+    response = web.StreamResponse(headers={**EVENT_STREAM_HEADERS, **CORS_HEADERS})
+    await response.prepare(request)
+
+    # Events are published from worker and monitor threads as well as the loop
+    loop = asyncio.get_running_loop()
+    changed = asyncio.Event()
+    wakeup = lambda: loop.call_soon_threadsafe(changed.set)
+    job_events.add_wakeup(wakeup)
+    try:
+        chunk, last_id = job_events.preamble(last_id)
+        await response.write(chunk)
+        while not job_events.closed:
+            changed.clear()
+            events, missed = job_events.since(last_id)
+            if events:
+                last_id = events[-1].id
+            chunk = job_events.encode(events, missed, job_ids, printers)
+            if chunk:
+                await response.write(chunk)
+                continue
+            try:
+                await asyncio.wait_for(changed.wait(), HEARTBEAT_INTERVAL)
+            except asyncio.TimeoutError:
+                await response.write(b": keepalive\n\n")
+    except (ConnectionResetError, asyncio.CancelledError):
+        # The page was closed or the server is stopping
+        pass
+    finally:
+        job_events.remove_wakeup(wakeup)
+    return response
+
+async def get_job(request):
+    """Get details of a specific print job"""
+    job_id = request.match_info['job_id']
+    job = job_registry.get(job_id)
+
+    if job:
+        return web.json_response(job.to_dict())
+
+    # Older jobs may only be left in the journal
+    journal_job = None
+    if job_journal:
+        journal_job = await asyncio.get_running_loop().run_in_executor(None, job_journal.get, job_id)
+    if not journal_job:
+        return web.json_response({"error": "Job not found"}, status=404)
+
+    return web.json_response(journal_job)
+
+async def test_print(request):
+    """Send a test print job to verify printer connectivity"""
+    data = await read_json(request) or {}
+
+    await prefetch_printer(data.get('printer'))
+    try:
+        printer_name = print_intake.resolve(data.get('printer'))
+    except PrintRequestError as e:
+        return request_error_response(e)
+
+    # Simple test ZPL code - optimized for 3x2 inch label
+    test_zpl = """^XA
+^CF0,30
+^FO20,20^GB760,380,2^FS
+^FO30,30^FDTest Print^FS
+^FO30,80^FDZDesigner GK420d^FS
+^FO30,130^FDPharmacy RX Manager^FS
+^FO30,180^FD{timestamp}^FS
+^FO30,250^FDIf you can read this, printing works!^FS
+^XZ""".format(timestamp=datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+
+    # Test prints skip the readiness check, so they can show what is wrong
+    job, queue_position = print_intake.submit(printer_name, test_zpl, type="test_print")
+    return queued_response(job, queue_position, f"Test print queued for {printer_name}")
+
+async def drain_queue(app):
+    """On shutdown, after new connections stop, print everything still queued"""
+    timeout = float(os.environ.get('SHUTDOWN_DRAIN_TIMEOUT', DEFAULT_DRAIN_TIMEOUT))
+    pending = print_queue.pending()
+    if pending:
+        logger.info(f"Shutting down, waiting for {pending} queued print job(s)")
+        if not await print_queue.drain(timeout):
+            logger.warning(f"{print_queue.pending()} print job(s) still queued after {timeout}s, exiting anyway")
+
+async def set_app_loop(app):
+    """Let the health monitor's threads query printers over tcp_pool"""
+    global app_loop
+    app_loop = asyncio.get_running_loop()
+
+async def close_streams(app):
+    """End open /jobs/stream responses so shutdown doesn't wait on them"""
+    job_events.close()
+
+async def close_resources(app):
+    """Release printer connections and flush the job journal"""
+    printer_health.stop()
+    tcp_pool.close_all()
+    loop = asyncio.get_running_loop()
+    if job_journal:
+        await loop.run_in_executor(None, job_journal.close)
+    if sys.platform == 'win32':
+        handle_pool.close_all()
+    spool_executor.shutdown(wait=False)
+    logger.info("Zebra Print Server stopped")
+
+def create_app():
+    """Build the aiohttp application"""
+    app = web.Application(
+        middlewares=[cors_middleware],
+        client_max_size=int(os.environ.get('MAX_REQUEST_SIZE', DEFAULT_MAX_REQUEST_SIZE))
+    )
+    app.router.add_get('/status', status)
+    app.router.add_get('/printers', get_printers)
+    app.router.add_post('/print', print_label)
+    app.router.add_post('/print/batch', print_batch)
+    app.router.add_post('/print/prescription', print_prescription)
+    app.router.add_get('/metrics', metrics)
+    app.router.add_get('/jobs', get_jobs)
+    app.router.add_get('/jobs/stream', job_stream)
+    app.router.add_get('/job/{job_id}', get_job)
+    app.router.add_post('/test_print', test_print)
+    app.on_startup.append(set_app_loop)
+    app.on_shutdown.append(drain_queue)
+    app.on_shutdown.append(close_streams)
+    app.on_cleanup.append(close_resources)
+    return app
+
+if __name__ == '__main__':
+    port = int(os.environ.get('PORT', 5000))
+    host = os.environ.get('HOST', '0.0.0.0')
+
+    # Log startup information
+    logger.info(f"Starting Zebra Print Server (asyncio) on {host}:{port}")
+    logger.info(f"Platform: {sys.platform}")
+    logger.info(f"Available printers: {printer_registry.printers()}")
+
+    web.run_app(
+        create_app(),
+        host=host,
+        port=port,
+        backlog=int(os.environ.get('SERVER_BACKLOG', DEFAULT_BACKLOG)),
+        keepalive_timeout=float(os.environ.get('KEEPALIVE_TIMEOUT', DEFAULT_KEEPALIVE_TIMEOUT)),
+        # Per-request access lines would dominate the log with /status polling
+        access_log=None,
+        print=None
+    )
@@ -0,0 +1,379 @@
+"""
+Benchmark for the Zebra print server.
+Drives /print, /print/batch and /status with a configurable mix, concurrency
+and request rate, using labels shaped like label_template.zpl, and writes a
+JSON report with latency percentiles, throughput and error rates so runs can
+be compared between versions.
+
+Usage:
+  python benchmark.py [options]                      against http://localhost:5000
+  python benchmark.py --url http://192.168.1.20:5000 [options]
+  python benchmark.py --in-process [options]         print_server.py in this process
+
+Examples:
+  # 30 labels a minute per counter, three counters, for five minutes
+  python benchmark.py --rate 1.5 --duration 300 --mix print=80,batch=10,status=10
+  # Flat out with 20 concurrent clients, then wait for every job to print
+  # (start the server with MAX_STORED_JOBS=1000 so it still has the early jobs)
+  python benchmark.py --requests 1000 --concurrency 20 --wait-jobs --job-capacity 1000 --output run.json
+"""
+
+import argparse
+import itertools
+import json
+import os
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+LABEL_TEMPLATE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "label_template.zpl")
+
+OPERATIONS = ("print", "fields", "batch", "status")
+DEFAULT_MIX = "print=70,fields=10,batch=10,status=10"
+
+# Jobs print_server.py keeps for /job/<job_id> unless MAX_STORED_JOBS says otherwise
+DEFAULT_JOB_CAPACITY = 100
+
+# Sample data swapped into label_template.zpl so label sizes vary like real ones
+PATIENTS = ["KEN JONES", "MARIA RAMPERSAD", "ANIL MOHAMMED", "SARAH-JANE DE FREITAS", "JO LEE"]
+MEDICATIONS = ["GLUCOPHAGE", "AMOXICILLIN 500MG", "LISINOPRIL 10MG", "ATORVASTATIN 20MG", "METFORMIN XR 750MG"]
+SIGS = [
+    ("TAKE 1 TABLETS ORAL ONCE DAILY", "WITH FOOD FOR 30 DAYS"),
+    ("TAKE 2 CAPSULES EVERY 8 HOURS", "UNTIL FINISHED"),
+    ("APPLY TWICE DAILY", ""),
+    ("TAKE 1 TABLET AT BEDTIME", "AVOID ALCOHOL"),
+]
+
+
+def load_label_template(path=LABEL_TEMPLATE):
+    with open(path, encoding="utf-8") as f:
+        return f.read()
+
+
+def make_label(template, rng):
+    """A label_template.zpl label with randomised patient, drug and directions"""
+    sig_line1, sig_line2 = rng.choice(SIGS)
+    return (template
+            .replace("KEN JONES", rng.choice(PATIENTS))
+            .replace("0F3D35A-4-816", f"{rng.randrange(16**7):07X}-{rng.randint(1, 9)}-{rng.randint(100, 999)}")
+            .replace("GLUCOPGHAGE", rng.choice(MEDICATIONS))
+            .replace("TAKE 1 TABLETS ORAL ONCE DAILY", sig_line1)
+            .replace("WITH FOOD FOR 30 DAYS", sig_line2))
+
+
+def make_fields(rng):
+    """Field values for a stored-format /print request"""
+    sig_line1, sig_line2 = rng.choice(SIGS)
+    return {
+        "patient_name": rng.choice(PATIENTS),
+        "date": datetime.now().strftime("%d/%m/%y"),
+        "rx_number": f"{rng.randrange(16**7):07X}",
+        "doctor_name": "DR JOE",
+        "medication_name": rng.choice(MEDICATIONS),
+        "sig_line1": sig_line1,
+        "sig_line2": sig_line2,
+        "quantity": str(rng.choice([14, 28, 30, 60, 90])),
+        "unit": "tablets",
+        "refills": f"REFILLS: {rng.randint(0, 3)}",
+    }
+
+
+def parse_mix(spec):
+    """Parse "print=70,batch=20,status=10" into [(operation, weight)]"""
+    mix = []
+    for part in spec.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in OPERATIONS:
+            raise ValueError(f"Unknown operation '{name}', expected one of {', '.join(OPERATIONS)}")
+        mix.append((name, float(weight or 1)))
+    if not any(weight > 0 for _, weight in mix):
+        raise ValueError("The mix needs at least one operation with a positive weight")
+    return mix
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    rank = max(int(round(fraction * len(sorted_values) + 0.5)) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+
+def summarize(samples, elapsed):
+    """Latency percentiles (ms), throughput and error rate for (latency, ok, error) samples"""
+    latencies = sorted(latency * 1000 for latency, _, _ in samples)
+    errors = {}
+    for _, ok, error in samples:
+        if not ok:
+            errors[error] = errors.get(error, 0) + 1
+    failed = sum(errors.values())
+    return {
+        "requests": len(samples),
+        "errors": failed,
+        "error_rate": round(failed / len(samples), 4) if samples else 0.0,
+        "error_kinds": errors,
+        "throughput_rps": round(len(samples) / elapsed, 2) if elapsed > 0 else None,
+        "latency_ms": {
+            "p50": _round(percentile(latencies, 0.50)),
+            "p95": _round(percentile(latencies, 0.95)),
+            "p99": _round(percentile(latencies, 0.99)),
+            "mean": _round(sum(latencies) / len(latencies)) if latencies else None,
+            "max": _round(latencies[-1]) if latencies else None,
+        },
+    }
+
+
+def _round(value):
+    return None if value is None else round(value, 2)
+
+
+def http_client(server_url, timeout=30):
+    """(post, get) over HTTP with one keep-alive session per thread"""
+    import requests
+
+    sessions = threading.local()
+
+    def session():
+        if not hasattr(sessions, "session"):
+            sessions.session = requests.Session()
+        return sessions.session
+
+    def post(path, payload):
+        response = session().post(f"{server_url}{path}", json=payload, timeout=timeout)
+        return response.status_code, response.json()
+
+    def get(path):
+        response = session().get(f"{server_url}{path}", timeout=timeout)
+        return response.status_code, response.json()
+
+    return post, get
+
+
+class Benchmark:
+    """One benchmark run"""
+
+    def __init__(self, post, get, mix, printer=None, batch_size=3, seed=None):
+        self.post = post
+        self.get = get
+        self.operations = [name for name, _ in mix]
+        self.weights = [weight for _, weight in mix]
+        self.printer = printer
+        self.batch_size = batch_size
+        self.template = load_label_template()
+        self.seed = seed
+        self.samples = {name: [] for name in self.operations}
+        self.job_ids = []
+        self._lock = threading.Lock()
+        self._rngs = threading.local()
+
+    def run(self, concurrency, total_requests=None, duration=None, rate=None):
+        """Send requests until total_requests or duration runs out. Returns elapsed seconds."""
+        start = time.perf_counter()
+        deadline = start + duration if duration else None
+        counter = itertools.count()
+
+        def worker():
+            while True:
+                index = next(counter)
+                if total_requests is not None and index >= total_requests:
+                    return
+                if rate:
+                    # Open loop: request i goes out at start + i / rate
+                    delay = start + index / rate - time.perf_counter()
+                    if delay > 0:
+                        time.sleep(delay)
+                if deadline and time.perf_counter() >= deadline:
+                    return
+                self._request()
+
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            for _ in range(concurrency):
+                pool.submit(worker)
+        return time.perf_counter() - start
+
+    def wait_for_jobs(self, timeout):
+        """
+        Poll every accepted job until it finishes; returns a summary of job
+        outcomes. A 404 means the server dropped the job from its registry to
+        make room for newer ones, so it is counted as evicted, not pending.
+        """
+        deadline = time.time() + timeout
+        finished = {}
+        evicted = 0
+        pending = list(self.job_ids)
+        while pending and time.time() < deadline:
+            still_pending = []
+            for job_id in pending:
+                try:
+                    status, job = self.get(f"/job/{job_id}")
+                except Exception:
+                    still_pending.append(job_id)
+                    continue
+                if status == 200 and job.get("status") in ("done", "failed"):
+                    finished[job_id] = job
+                elif status == 404:
+                    evicted += 1
+                else:
+                    still_pending.append(job_id)
+            pending = still_pending
+            if pending:
+                time.sleep(0.5)
+
+        end_to_end = sorted(
+            (job["completed_at"] - job["timestamp"]) * 1000
+            for job in finished.values() if job.get("completed_at") and job.get("timestamp")
+        )
+        failed = sum(1 for job in finished.values() if job.get("status") == "failed")
+        return {
+            "jobs": len(self.job_ids),
+            "finished": len(finished),
+            "failed": failed,
+            "evicted": evicted,
+            "unfinished": len(pending),
+            "failure_rate": round(failed / len(finished), 4) if finished else 0.0,
+            "completion_ms": {
+                "p50": _round(percentile(end_to_end, 0.50)),
+                "p95": _round(percentile(end_to_end, 0.95)),
+                "p99": _round(percentile(end_to_end, 0.99)),
+                "max": _round(end_to_end[-1]) if end_to_end else None,
+            },
+        }
+
+    def _rng(self):
+        rng = getattr(self._rngs, "rng", None)
+        if rng is None:
+            seed = None if self.seed is None else f"{self.seed}-{threading.get_ident()}"
+            rng = self._rngs.rng = random.Random(seed)
+        return rng
+
+    def _request(self):
+        rng = self._rng()
+        operation = rng.choices(self.operations, self.weights)[0]
+        started = time.perf_counter()
+        try:
+            if operation == "status":
+                status, body = self.get("/status")
+            elif operation == "print":
+                status, body = self.post("/print", self._with_printer({"zpl": make_label(self.template, rng)}))
+            elif operation == "fields":
+                status, body = self.post("/print", self._with_printer({"fields": make_fields(rng)}))
+            else:
+                labels = [make_label(self.template, rng) for _ in range(rng.randint(1, self.batch_size))]
+                status, body = self.post("/print/batch", self._with_printer({"labels": labels}))
+            ok = 200 <= status < 300
+            error = None if ok else f"status_{status}"
+        except Exception as e:
+            body, ok, error = None, False, type(e).__name__
+        latency = time.perf_counter() - started
+
+        with self._lock:
+            self.samples[operation].append((latency, ok, error))
+            if ok and isinstance(body, dict) and body.get("job_id"):
+                self.job_ids.append(body["job_id"])
+
+    def _with_printer(self, payload):
+        if self.printer:
+            payload["printer"] = self.printer
+        return payload
+
+    def report(self, elapsed):
+        all_samples = [sample for samples in self.samples.values() for sample in samples]
+        return {
+            "overall": summarize(all_samples, elapsed),
+            "operations": {name: summarize(samples, elapsed) for name, samples in self.samples.items() if samples},
+        }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the Zebra print server")
+    target = parser.add_mutually_exclusive_group()
+    target.add_argument("--url", default="http://localhost:5000", help="print server URL")
+    target.add_argument("--in-process", action="store_true",
+                        help="load print_server.py here and use Flask's test client")
+    parser.add_argument("--concurrency", type=int, default=10, help="concurrent clients (default 10)")
+    parser.add_argument("--requests", type=int, help="total requests to send (default 200 unless --duration)")
+    parser.add_argument("--duration", type=float, help="seconds to run for")
+    parser.add_argument("--rate", type=float, help="requests per second across all clients (default: as fast as possible)")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help=f"operation weights (default {DEFAULT_MIX})")
+    parser.add_argument("--batch-size", type=int, default=3, help="most labels per batch request (default 3)")
+    parser.add_argument("--printer", help="printer or printer group to print to (default: server default)")
+    parser.add_argument("--wait-jobs", action="store_true", help="wait for accepted jobs to finish and report their completion times")
+    parser.add_argument("--wait-timeout", type=float, default=300, help="seconds to wait for jobs (default 300)")
+    parser.add_argument("--job-capacity", type=int,
+                        default=int(os.environ.get("MAX_STORED_JOBS", DEFAULT_JOB_CAPACITY)),
+                        help=f"jobs the server keeps, its MAX_STORED_JOBS (default {DEFAULT_JOB_CAPACITY})")
+    parser.add_argument("--check", action="store_true", help="run test_connection.py's checks (and a test print) first")
+    parser.add_argument("--seed", help="random seed for a repeatable label sequence")
+    parser.add_argument("--label", help="free-form name for this run, stored in the report")
+    parser.add_argument("--output", help="write the JSON report to this file as well as stdout")
+    args = parser.parse_args(argv)
+
+    try:
+        mix = parse_mix(args.mix)
+    except ValueError as e:
+        parser.error(str(e))
+    total_requests = args.requests if args.requests or args.duration else 200
+    if args.wait_jobs and total_requests and total_requests > args.job_capacity:
+        print(f"⚠️  {total_requests} requests is more than the {args.job_capacity} jobs the server keeps; "
+              f"the oldest jobs will be evicted before they can be checked. Raise MAX_STORED_JOBS on the "
+              f"server and pass --job-capacity.", file=sys.stderr)
+
+    if args.in_process:
+        from stress_test import in_process_client
+        post, get = in_process_client()
+    else:
+        if args.check:
+            from test_connection import test_print_server
+            if not test_print_server(args.url, args.printer):
+                return 1
+        post, get = http_client(args.url)
+
+    try:
+        status, server_status = get("/status")
+    except Exception as e:
+        print(f"❌ Print server is not reachable: {e}", file=sys.stderr)
+        return 1
+
+    benchmark = Benchmark(post, get, mix, printer=args.printer, batch_size=args.batch_size, seed=args.seed)
+    print(f"Running benchmark: {args.concurrency} clients, mix {args.mix}"
+          f"{f', {args.rate}/s' if args.rate else ''}...", file=sys.stderr)
+    started_at = datetime.now().isoformat(timespec="seconds")
+    elapsed = benchmark.run(args.concurrency, total_requests, args.duration, args.rate)
+
+    report = {
+        "label": args.label,
+        "started_at": started_at,
+        "target": "in-process" if args.in_process else args.url,
+        "server": server_status if status == 200 else None,
+        "config": {
+            "concurrency": args.concurrency,
+            "requests": total_requests,
+            "duration": args.duration,
+            "rate": args.rate,
+            "mix": dict(mix),
+            "batch_size": args.batch_size,
+            "printer": args.printer,
+            "label_bytes": len(benchmark.template.encode("utf-8")),
+        },
+        "elapsed_s": round(elapsed, 3),
+        **benchmark.report(elapsed),
+    }
+    if args.wait_jobs:
+        print(f"Waiting for {len(benchmark.job_ids)} job(s) to finish...", file=sys.stderr)
+        report["jobs"] = benchmark.wait_for_jobs(args.wait_timeout)
+
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+
+    return 0 if report["overall"]["errors"] == 0 else 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
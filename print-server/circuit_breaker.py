@@ -0,0 +1,296 @@
+"""
+Retries and circuit breakers for print jobs.
+A job that fails with a transient error (a timeout, a dropped connection, a
+busy spooler) before any of it was written is retried with exponential
+backoff; once part of a job may have reached the printer it is never sent
+again, so a label can't print twice. Each printer also has a circuit breaker:
+after several failed jobs in a row (a job counts once, however many attempts
+it took) it opens and jobs for that printer fail straight away (or are routed
+to another group member) for a cool-down period. After that it lets one test
+job through (half-open); if it prints the circuit closes again, otherwise it
+reopens.
+
+Settings (environment variables):
+  PRINT_RETRY_ATTEMPTS       attempts per job, including the first (default 3)
+  PRINT_RETRY_BASE_DELAY     seconds before the first retry, doubled for each one after (default 0.5)
+  PRINT_RETRY_MAX_DELAY      longest wait between attempts in seconds (default 5)
+  CIRCUIT_FAILURE_THRESHOLD  failed jobs in a row that open a printer's circuit (default 5)
+  CIRCUIT_RESET_TIMEOUT      seconds a circuit stays open before a test job (default 30)
+"""
+
+import asyncio
+import logging
+import os
+import random
+import socket
+import threading
+import time
+from printer_health import PrinterNotReadyError
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_ATTEMPTS = 3
+DEFAULT_BASE_DELAY = 0.5
+DEFAULT_MAX_DELAY = 5.0
+DEFAULT_FAILURE_THRESHOLD = 5
+DEFAULT_RESET_TIMEOUT = 30.0
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+# Windows error codes worth another try: the printer or spooler was busy,
+# timed out or briefly unreachable, or a cached handle went stale
+TRANSIENT_WINERRORS = {
+    6,      # ERROR_INVALID_HANDLE
+    21,     # ERROR_NOT_READY
+    121,    # ERROR_SEM_TIMEOUT
+    1722,   # RPC_S_SERVER_UNAVAILABLE
+    1726,   # RPC_S_CALL_FAILED
+    1460,   # ERROR_TIMEOUT
+}
+
+
+class CircuitOpenError(Exception):
+    """Raised for a job sent to a printer whose circuit is open"""
+
+    def __init__(self, printer_name, retry_after):
+        super().__init__(f"Printer {printer_name} is failing, not sending jobs for {retry_after:.0f}s")
+        self.printer_name = printer_name
+        self.retry_after = retry_after
+
+
+class WriteInterruptedError(Exception):
+    """
+    Raised when sending a job failed after some of it may have reached the
+    printer. It is never retried, since that could print the label twice.
+    """
+
+    def __init__(self, error):
+        super().__init__(f"{error} (the label may have partly printed, so it was not sent again)")
+
+
+def is_transient(error):
+    """Whether a failed attempt is worth retrying"""
+    if isinstance(error, (PrinterNotReadyError, CircuitOpenError, WriteInterruptedError)):
+        return False
+    if isinstance(error, (socket.timeout, TimeoutError, asyncio.TimeoutError, ConnectionError)):
+        return True
+    if type(error).__module__ == "pywintypes":
+        return getattr(error, "winerror", None) in TRANSIENT_WINERRORS
+    return False
+
+
+class RetryPolicy:
+    """Exponential backoff with full jitter between attempts"""
+
+    def __init__(self, attempts=DEFAULT_ATTEMPTS, base_delay=DEFAULT_BASE_DELAY, max_delay=DEFAULT_MAX_DELAY):
+        self.attempts = max(int(attempts), 1)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def delay(self, attempt):
+        """Seconds to wait after failed attempt number `attempt` (1-based)"""
+        # Jitter keeps printers that failed together from retrying in lockstep
+        return random.uniform(0, min(self.base_delay * 2 ** (attempt - 1), self.max_delay))
+
+
+class CircuitBreaker:
+    """Closed, open or half-open state for one printer"""
+
+    def __init__(self, failure_threshold=DEFAULT_FAILURE_THRESHOLD, reset_timeout=DEFAULT_RESET_TIMEOUT):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self.last_error = None
+        self._trial = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """Whether a job may be sent now; in half-open state only one test job at a time"""
+        with self._lock:
+            if self.state == OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = HALF_OPEN
+            if self.state == CLOSED:
+                return True
+            if self.state == HALF_OPEN and not self._trial:
+                self._trial = True
+                return True
+            return False
+
+    def is_open(self):
+        """Whether jobs would be refused right now, without taking the half-open test slot"""
+        with self._lock:
+            if self.state == OPEN:
+                return time.monotonic() - self.opened_at < self.reset_timeout
+            return self.state == HALF_OPEN and self._trial
+
+    def retry_after(self):
+        """Seconds until the next test job is let through"""
+        with self._lock:
+            if self.state != OPEN:
+                return 0.0
+            return max(self.reset_timeout - (time.monotonic() - self.opened_at), 0.0)
+
+    def release(self):
+        """Give back the half-open test slot without counting a success or a failure"""
+        with self._lock:
+            self._trial = False
+
+    def record_success(self):
+        """Returns True if this closed the circuit"""
+        with self._lock:
+            reopened = self.state != CLOSED
+            self.state = CLOSED
+            self.failures = 0
+            self.last_error = None
+            self._trial = False
+            return reopened
+
+    def record_failure(self, error):
+        """Returns True if this opened the circuit"""
+        with self._lock:
+            self.failures += 1
+            self.last_error = str(error)
+            self._trial = False
+            if self.state == HALF_OPEN or (self.state == CLOSED and self.failures >= self.failure_threshold):
+                self.state = OPEN
+                self.opened_at = time.monotonic()
+                return True
+            return False
+
+    def to_dict(self):
+        with self._lock:
+            state = self.state
+            retry_after = None
+            if state == OPEN:
+                retry_after = max(self.reset_timeout - (time.monotonic() - self.opened_at), 0.0)
+                if not retry_after:
+                    # The next job will be the half-open test
+                    state = HALF_OPEN
+            return {
+                "state": state,
+                "failures": self.failures,
+                "retry_after": round(retry_after, 1) if retry_after else None,
+                "last_error": self.last_error,
+            }
+
+
+class CircuitBreakers:
+    """Per-printer circuit breakers and the retry loop around the spool function"""
+
+    def __init__(self, retry_policy=None, failure_threshold=DEFAULT_FAILURE_THRESHOLD,
+                 reset_timeout=DEFAULT_RESET_TIMEOUT):
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._breakers = {}
+        self._retries = {}
+        self._lock = threading.Lock()
+
+    def get(self, printer_name):
+        breaker = self._breakers.get(printer_name)
+        if breaker is None:
+            with self._lock:
+                breaker = self._breakers.setdefault(
+                    printer_name, CircuitBreaker(self.failure_threshold, self.reset_timeout))
+        return breaker
+
+    def is_open(self, printer_name):
+        breaker = self._breakers.get(printer_name)
+        return breaker is not None and breaker.is_open()
+
+    def retry_after(self, printer_name):
+        breaker = self._breakers.get(printer_name)
+        return breaker.retry_after() if breaker else 0.0
+
+    def guard(self, spool_func):
+        """Wrap a PrintQueue spool function with the circuit check and retries"""
+        def spool(printer_name, data, job):
+            breaker = self._check(printer_name)
+            attempt = 1
+            while True:
+                job["attempts"] = attempt
+                try:
+                    message = spool_func(printer_name, data, job)
+                except Exception as e:
+                    if not self._failed(printer_name, breaker, e, attempt):
+                        raise
+                    time.sleep(self.retry_policy.delay(attempt))
+                    attempt += 1
+                    continue
+                self._succeeded(printer_name, breaker)
+                return message
+        return spool
+
+    def guard_async(self, spool_func):
+        """guard() for the coroutine spool function of AsyncPrintQueue"""
+        async def spool(printer_name, data, job):
+            breaker = self._check(printer_name)
+            attempt = 1
+            while True:
+                job["attempts"] = attempt
+                try:
+                    message = await spool_func(printer_name, data, job)
+                except Exception as e:
+                    if not self._failed(printer_name, breaker, e, attempt):
+                        raise
+                    await asyncio.sleep(self.retry_policy.delay(attempt))
+                    attempt += 1
+                    continue
+                self._succeeded(printer_name, breaker)
+                return message
+        return spool
+
+    def retry_counts(self):
+        """Retries by printer, for /metrics"""
+        with self._lock:
+            return dict(self._retries)
+
+    def open_circuits(self):
+        """1 for each printer whose circuit is open, 0 otherwise, for /metrics"""
+        return {printer_name: int(breaker.state != CLOSED) for printer_name, breaker in list(self._breakers.items())}
+
+    def to_dict(self):
+        """Breaker state by printer, for /printers"""
+        return {printer_name: breaker.to_dict() for printer_name, breaker in list(self._breakers.items())}
+
+    def _check(self, printer_name):
+        breaker = self.get(printer_name)
+        if not breaker.allow():
+            raise CircuitOpenError(printer_name, breaker.retry_after())
+        return breaker
+
+    def _failed(self, printer_name, breaker, error, attempt):
+        """Return whether to try a failed attempt again; a job that gives up counts as one failure"""
+        # A paused or empty printer is the health monitor's business, not a broken
+        # one, so it neither counts towards opening the circuit nor closes it
+        if isinstance(error, PrinterNotReadyError):
+            breaker.release()
+            return False
+        if attempt < self.retry_policy.attempts and is_transient(error):
+            logger.warning(f"Print attempt {attempt} on {printer_name} failed ({str(error)}), retrying")
+            with self._lock:
+                self._retries[printer_name] = self._retries.get(printer_name, 0) + 1
+            return True
+        if breaker.record_failure(error):
+            logger.error(f"Circuit opened for {printer_name} after {breaker.failures} failed job(s): {str(error)}")
+        return False
+
+    def _succeeded(self, printer_name, breaker):
+        if breaker.record_success():
+            logger.info(f"Circuit closed for {printer_name}")
+
+
+# Shared by the print servers
+circuit_breakers = CircuitBreakers(
+    RetryPolicy(
+        attempts=int(os.environ.get('PRINT_RETRY_ATTEMPTS', DEFAULT_ATTEMPTS)),
+        base_delay=float(os.environ.get('PRINT_RETRY_BASE_DELAY', DEFAULT_BASE_DELAY)),
+        max_delay=float(os.environ.get('PRINT_RETRY_MAX_DELAY', DEFAULT_MAX_DELAY))
+    ),
+    failure_threshold=int(os.environ.get('CIRCUIT_FAILURE_THRESHOLD', DEFAULT_FAILURE_THRESHOLD)),
+    reset_timeout=float(os.environ.get('CIRCUIT_RESET_TIMEOUT', DEFAULT_RESET_TIMEOUT))
+)
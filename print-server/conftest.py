@@ -0,0 +1,2 @@
+# test_connection.py is a command-line check against a running server, not a test module
+collect_ignore = ["test_connection.py"]
@@ -7,23 +7,36 @@ Windows-specific implementation that interfaces with Zebra printers
 import os
 import sys
 import time
-import tempfile
 import socket
 import logging
 import json
-from flask import Flask, jsonify, request, make_response
+from flask import Flask, Response, jsonify, request, make_response
 from flask_cors import CORS
-import win32print
+from print_queue import PrintQueue, parse_priority, DEFAULT_COALESCE_MAX_BYTES, DEFAULT_BULK_EVERY
+from job_journal import JobJournal, QUERY_PARAMS as JOURNAL_QUERY_PARAMS
+from job_events import (JobEvents, parse_last_event_id, parse_filter, HEADERS as EVENT_STREAM_HEADERS,
+                        DEFAULT_BUFFER_SIZE as DEFAULT_EVENT_BUFFER_SIZE, stream_limit, DEFAULT_STREAM_MAX_AGE)
+from idempotency import idempotency_cache, request_keys as idempotency_keys, HEADER as IDEMPOTENCY_HEADER
+from job_store import JobRegistry, DEFAULT_CAPACITY
+from print_intake import PrintIntake, PrintRequestError
+from print_batch import parse_batch_labels, parse_copies, build_batch_document
+from zpl_utils import set_copies
+from win32_spooler import spool_raw, enumerate_printers, handle_pool, printer_status as spooler_status
+from label_archive import archive_label
+from stored_formats import stored_formats, build_prescription_recall
+from label_templates import render_prescription_labels
+from printer_registry import PrinterRegistry, DEFAULT_REFRESH_INTERVAL
+from tcp_printer import network_printers, connection_pool, send_raw as send_network, query as query_network
+from production_server import serve, server_threads
+from print_metrics import print_metrics, CONTENT_TYPE as METRICS_CONTENT_TYPE
+from server_logging import configure_logging
+from circuit_breaker import circuit_breakers
+from printer_health import (PrinterHealth, parse_host_status, HOST_STATUS_COMMAND, HOST_STATUS_FRAMES,
+                            DEFAULT_INTERVAL as DEFAULT_HEALTH_INTERVAL, DEFAULT_TIMEOUT as DEFAULT_HEALTH_TIMEOUT)
+from printer_groups import PrinterGroups, parse_groups, affinity_key, EARLIEST_COMPLETION, DEFAULT_AFFINITY_TTL
 
 # Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.StreamHandler(),
-        logging.FileHandler('print_server.log')
-    ]
-)
+configure_logging()
 logger = logging.getLogger('zebra_print_server')
 
 # Initialize Flask app
@@ -31,12 +44,115 @@ app = Flask(__name__)
 CORS(app)  # Enable CORS for all routes
 
 # Store print jobs in memory
-print_jobs = []
+job_registry = JobRegistry(int(os.environ.get('MAX_STORED_JOBS', DEFAULT_CAPACITY)))
+
+# Optional durable job history for audits
+job_journal = JobJournal(os.environ['JOB_JOURNAL_PATH']) if os.environ.get('JOB_JOURNAL_PATH') else None
+
+# Job and printer changes pushed to /jobs/stream; each open stream holds a request thread
+job_events = JobEvents(
+    capacity=int(os.environ.get('EVENT_BUFFER_SIZE', DEFAULT_EVENT_BUFFER_SIZE)),
+    max_streams=stream_limit(server_threads(), int(os.environ.get('MAX_EVENT_STREAMS', 0))),
+    stream_max_age=float(os.environ.get('EVENT_STREAM_MAX_AGE', DEFAULT_STREAM_MAX_AGE))
+)
+
+# Cached printer list, refreshed in the background
+printer_registry = PrinterRegistry(
+    network_printers.extend(enumerate_printers),
+    refresh_interval=int(os.environ.get('PRINTER_REFRESH_INTERVAL', DEFAULT_REFRESH_INTERVAL))
+)
+printer_registry.start()
+
+HEALTH_TIMEOUT = float(os.environ.get('PRINTER_HEALTH_TIMEOUT', DEFAULT_HEALTH_TIMEOUT))
+
+def printer_status(printer_name):
+    """Health flags for one printer, read by the health monitor"""
+    if network_printers.address(printer_name):
+        response = query_network(printer_name, HOST_STATUS_COMMAND, HOST_STATUS_FRAMES, HEALTH_TIMEOUT)
+        return parse_host_status(response) if response else None
+    return spooler_status(printer_name)
+
+# Paper-out, paused and head-open flags for each printer, polled in the background
+printer_health = PrinterHealth(
+    printer_status,
+    printer_registry.printers,
+    interval=float(os.environ.get('PRINTER_HEALTH_INTERVAL', DEFAULT_HEALTH_INTERVAL))
+)
+printer_health.add_listener(job_events.record_health)
+# A printer that was offline or stopped may have been power-cycled and lost its formats
+stored_formats.follow(printer_health)
+printer_health.start()
+
+def printer_available(printer_name):
+    """Whether a printer can take jobs right now"""
+    known = bool(network_printers.address(printer_name)) or printer_name in printer_registry
+    return known and printer_health.is_ready(printer_name) and not circuit_breakers.is_open(printer_name)
+
+def spool_label(printer_name, data, job):
+    """Send one queued job to the printer (runs on the printer's worker thread)"""
+    # A paused or empty printer would take the job and never print it
+    printer_health.ensure_ready(printer_name)
+    doc_name = {
+        "test_print": "Test Print",
+        "batch": "Prescription Labels",
+        "prescription": "Prescription Labels"
+    }.get(job.get("type"), "Prescription Label")
+    # Prepend the stored-format download if this printer doesn't hold it yet
+    data = stored_formats.prepare(printer_name, job, data)
+    try:
+        if network_printers.address(printer_name):
+            # Networked printers are written to directly on port 9100
+            send_network(printer_name, data)
+        else:
+            job["spool_job_id"] = spool_raw(printer_name, data, doc_name)
+    except Exception:
+        # The printer may have lost its formats along with the job
+        stored_formats.invalidate(printer_name)
+        raise
+    stored_formats.confirm(printer_name, job)
+    logger.info(f"Print job {job['id']} sent to {printer_name}")
+    archive_label(job, data)
+    return f"Print job sent to {printer_name}"
+
+# Background queue that drains print jobs per printer
+print_queue = PrintQueue(
+    print_metrics.instrument(circuit_breakers.guard(spool_label)),
+    # Jobs for the same printer within this many ms go out as one write; 0 is off
+    coalesce_window=float(os.environ.get('PRINT_COALESCE_MS', 0)) / 1000,
+    coalesce_max_bytes=int(os.environ.get('PRINT_COALESCE_MAX_BYTES', DEFAULT_COALESCE_MAX_BYTES)),
+    # Interactive jobs in a row before a waiting bulk job gets a turn
+    bulk_every=int(os.environ.get('PRINT_BULK_EVERY', DEFAULT_BULK_EVERY))
+)
+print_queue.add_listener(print_metrics.record_job)
+print_queue.add_listener(job_events.record_job)
+if job_journal:
+    print_queue.add_listener(job_journal.record)
+
+# Values read when /metrics is scraped
+print_metrics.add_callback("print_queue_depth", "gauge", "Jobs waiting or spooling per printer", "printer", print_queue.depths)
+print_metrics.add_callback("printer_lookup_total", "counter", "Printer name lookups by cache result", "result", printer_registry.lookup_counts)
+print_metrics.add_callback("print_retries_total", "counter", "Print attempts retried after a transient error", "printer", circuit_breakers.retry_counts)
+print_metrics.add_callback("printer_circuit_open", "gauge", "1 while a printer's circuit breaker is open", "printer", circuit_breakers.open_circuits)
+print_metrics.add_callback("print_duplicates_total", "counter", "Repeated print requests answered with the original job", None,
+                           lambda: idempotency_cache.hits)
+
+# Named groups of printers that share the load, e.g. "counter"
+printer_groups = PrinterGroups(
+    parse_groups(os.environ.get('PRINTER_GROUPS', '')),
+    print_queue,
+    available_func=printer_available,
+    strategy=os.environ.get('PRINTER_GROUP_STRATEGY', EARLIEST_COMPLETION),
+    affinity_ttl=int(os.environ.get('PRINTER_GROUP_AFFINITY_TTL', DEFAULT_AFFINITY_TTL))
+)
+
+# Printer resolution, readiness checks and duplicate suppression for the print endpoints
+print_intake = PrintIntake(printer_registry, printer_groups, printer_health, job_registry, print_queue,
+                           fall_back_to_default=False)
 
 def add_cors_headers(response):
     """Add CORS headers to response"""
     response.headers.add('Access-Control-Allow-Origin', '*')
-    response.headers.add('Access-Control-Allow-Headers', 'Content-Type,Authorization')
+    response.headers.add('Access-Control-Allow-Headers', 'Content-Type,Authorization,Idempotency-Key')
     response.headers.add('Access-Control-Allow-Methods', 'GET,PUT,POST,DELETE,OPTIONS')
     return response
 
@@ -44,7 +160,7 @@ def build_cors_preflight_response():
     """Build response for CORS preflight requests"""
     response = make_response()
     response.headers.add('Access-Control-Allow-Origin', '*')
-    response.headers.add('Access-Control-Allow-Headers', 'Content-Type,Authorization')
+    response.headers.add('Access-Control-Allow-Headers', 'Content-Type,Authorization,Idempotency-Key')
     response.headers.add('Access-Control-Allow-Methods', 'GET,PUT,POST,DELETE,OPTIONS')
     return response
 
@@ -57,7 +173,8 @@ def status():
     response = make_response(jsonify({
         "status": "online",
         "version": "1.0.0",
-        "timestamp": time.time()
+        "timestamp": time.time(),
+        "printers": printer_health.summary()
     }))
     return add_cors_headers(response)
 
@@ -67,24 +184,46 @@ def get_printers():
     if request.method == 'OPTIONS':
         return build_cors_preflight_response()
         
-    try:
-        printers = []
-        for printer in win32print.EnumPrinters(win32print.PRINTER_ENUM_LOCAL, None, 1):
-            printers.append(printer[2])
-        
-        response = make_response(jsonify({
-            "printers": printers,
-            "default": win32print.GetDefaultPrinter()
-        }))
-        return add_cors_headers(response)
-        
-    except Exception as e:
-        logger.error(f"Error getting printer list: {str(e)}")
+    
+    # Re-enumerate only when asked, otherwise serve the cached list
+    if request.args.get('refresh') in ('1', 'true'):
+        printer_registry.refresh()
+    
+    if printer_registry.refreshed_at is None:
         response = make_response(jsonify({
-            "error": str(e),
+            "error": "Printer list is not available",
             "printers": []
         }), 500)
         return add_cors_headers(response)
+    
+    response = make_response(jsonify({
+        "printers": printer_registry.printers(),
+        "default": printer_registry.default,
+        "refreshed_at": printer_registry.refreshed_at,
+        "groups": printer_groups.to_dict(),
+        "health": printer_health.to_dict(),
+        "circuits": circuit_breakers.to_dict()
+    }))
+    return add_cors_headers(response)
+
+def duplicate_response(job):
+    """The original job for a repeated print request, which is not printed again"""
+    response = make_response(jsonify({
+        "success": True,
+        "duplicate": True,
+        "job_id": job["id"],
+        "status": job["status"],
+        "printer": job["printer"],
+        "message": f"Duplicate of print job {job['id']}, not printed again"
+    }), 200)
+    response.headers["Idempotent-Replayed"] = "true"
+    return add_cors_headers(response)
+
+def request_error_response(error):
+    """The response for a print request turned away before queueing"""
+    response = make_response(jsonify(error.to_dict()), error.status)
+    response.headers.update(error.headers)
+    return add_cors_headers(response)
 
 @app.route('/print', methods=['POST', 'OPTIONS'])
 def print_label():
@@ -92,105 +231,285 @@ def print_label():
     if request.method == 'OPTIONS':
         return build_cors_preflight_response()
         
+    started = time.perf_counter()
     try:
-        data = request.json
+        data = request.get_json(silent=True)
         
-        if not data:
+        if not data or not isinstance(data, dict):
+            print_metrics.reject("no_data")
             return jsonify({"success": False, "error": "No data provided"}), 400
         
         zpl = data.get('zpl')
         printer_name = data.get('printer')
+        formats = []
+        
+        # Stored-format mode: only the field values are sent and the layout
+        # is recalled from printer memory
+        if not zpl and data.get('fields'):
+            try:
+                zpl, format_name = build_prescription_recall(data.get('fields'))
+            except ValueError as e:
+                print_metrics.reject("invalid_fields")
+                return jsonify({"success": False, "error": str(e)}), 400
+            formats.append(format_name)
         
         if not zpl:
+            print_metrics.reject("no_zpl")
             return jsonify({"success": False, "error": "No ZPL code provided"}), 400
         
-        if not printer_name:
-            # Use default printer if none specified
-            printer_name = win32print.GetDefaultPrinter()
-            logger.info(f"No printer specified, using default: {printer_name}")
+        # Copies are made by the printer from one ^PQ label, not sent again
+        try:
+            copies = parse_copies(data.get('copies', 1))
+            zpl = set_copies(zpl, copies)
+        except ValueError as e:
+            print_metrics.reject("invalid_copies")
+            return jsonify({"success": False, "error": str(e)}), 400
+        
+        # Walk-in labels go ahead of bulk reprints
+        try:
+            priority = parse_priority(data.get('priority'))
+        except ValueError as e:
+            print_metrics.reject("invalid_priority")
+            return jsonify({"success": False, "error": str(e)}), 400
+        
+        fields = {"priority": priority}
+        if formats:
+            fields["formats"] = formats
+        if copies > 1:
+            fields["copies"] = copies
+        
+        # A repeat of a request that already printed (or is queued) gets the original job
+        keys = idempotency_keys(request.headers.get(IDEMPOTENCY_HEADER), data, printer_name, zpl)
+        
+        # Record the print job and hand it to the printer's queue
+        print_job, queue_position = print_intake.queue(
+            printer_name, zpl, affinity_key(data), keys, started=started, **fields)
+        if queue_position is None:
+            return duplicate_response(print_job)
+        
+        response = make_response(jsonify({
+            "success": True,
+            "job_id": print_job['id'],
+            "status": print_job['status'],
+            "queue_position": queue_position,
+            "printer": print_job['printer'],
+            "message": f"Print job queued for {print_job['printer']}"
+        }), 202)
+        return add_cors_headers(response)
+        
+    except PrintRequestError as e:
+        return request_error_response(e)
+    except Exception as e:
+        logger.error(f"Error processing print request: {str(e)}")
+        response = make_response(jsonify({
+            "success": False,
+            "error": str(e)
+        }), 500)
+        return add_cors_headers(response)
+
+@app.route('/print/batch', methods=['POST', 'OPTIONS'])
+def print_batch():
+    """Print several labels as one spooler job"""
+    if request.method == 'OPTIONS':
+        return build_cors_preflight_response()
+        
+    try:
+        data = request.get_json(silent=True)
+        
+        if not data or not isinstance(data, dict):
+            return jsonify({"success": False, "error": "No data provided"}), 400
         
-        # Check if printer exists
-        printer_exists = False
-        for printer in win32print.EnumPrinters(win32print.PRINTER_ENUM_LOCAL, None, 1):
-            if printer[2] == printer_name:
-                printer_exists = True
-                break
+        try:
+            accepted, results = parse_batch_labels(data.get('labels'))
+            priority = parse_priority(data.get('priority'))
+        except ValueError as e:
+            return jsonify({"success": False, "error": str(e)}), 400
         
-        if not printer_exists:
+        if not accepted:
             response = make_response(jsonify({
                 "success": False,
-                "error": f"Printer '{printer_name}' not found"
-            }), 404)
+                "error": "No valid labels in batch",
+                "results": results
+            }), 400)
             return add_cors_headers(response)
         
-        # Create a temporary file with the ZPL code
-        temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.zpl', mode='w')
-        temp_file.write(zpl)
-        temp_file.close()
+        # All labels go to the printer as a single RAW document, already encoded
+        zpl = build_batch_document(accepted)
+        # A repeat of a request that already printed (or is queued) gets the original job
+        keys = idempotency_keys(request.headers.get(IDEMPOTENCY_HEADER), data, data.get('printer'), zpl)
+        batch_job, queue_position = print_intake.queue(
+            data.get('printer'), zpl, affinity_key(data), keys,
+            type="batch",
+            label_count=len(accepted),
+            copies=sum(copies for _, _, copies in accepted),
+            priority=priority
+        )
+        if queue_position is None:
+            return duplicate_response(batch_job)
         
-        # Open the printer
-        logger.info(f"Opening printer: {printer_name}")
-        printer_handle = win32print.OpenPrinter(printer_name)
+        response = make_response(jsonify({
+            "success": True,
+            "job_id": batch_job['id'],
+            "status": batch_job['status'],
+            "queue_position": queue_position,
+            "printer": batch_job['printer'],
+            "results": results,
+            "message": f"Batch of {len(accepted)} label(s) queued for {batch_job['printer']}"
+        }), 202)
+        return add_cors_headers(response)
+        
+    except PrintRequestError as e:
+        return request_error_response(e)
+    except Exception as e:
+        logger.error(f"Error processing batch print request: {str(e)}")
+        response = make_response(jsonify({
+            "success": False,
+            "error": str(e)
+        }), 500)
+        return add_cors_headers(response)
+
+@app.route('/print/prescription', methods=['POST', 'OPTIONS'])
+def print_prescription():
+    """Render prescription labels on the server and print them as one spooler job"""
+    if request.method == 'OPTIONS':
+        return build_cors_preflight_response()
+        
+    try:
+        data = request.get_json(silent=True)
+        
+        if not data or not isinstance(data, dict):
+            return jsonify({"success": False, "error": "No data provided"}), 400
+        
+        labels = data.get('labels')
+        if labels is None and data.get('label'):
+            labels = [data.get('label')]
         
         try:
-            # Start a print job
-            job_id = win32print.StartDocPrinter(printer_handle, 1, ("Prescription Label", None, "RAW"))
-            
-            try:
-                win32print.StartPagePrinter(printer_handle)
-                
-                # Read and send the ZPL file to the printer
-                with open(temp_file.name, 'rb') as f:
-                    zpl_data = f.read()
-                    win32print.WritePrinter(printer_handle, zpl_data)
-                
-                win32print.EndPagePrinter(printer_handle)
-            finally:
-                win32print.EndDocPrinter(printer_handle)
-        finally:
-            win32print.ClosePrinter(printer_handle)
-        
-        # Clean up the temporary file
-        os.unlink(temp_file.name)
-        
-        # Record the print job
-        print_job = {
-            "id": len(print_jobs) + 1,
-            "printer": printer_name,
-            "timestamp": time.time(),
-            "zpl_length": len(zpl)
-        }
-        print_jobs.append(print_job)
+            accepted, results, formats = render_prescription_labels(
+                labels,
+                stored_format=bool(data.get('stored_format')),
+                version=data.get('template_version')
+            )
+            priority = parse_priority(data.get('priority'))
+        except ValueError as e:
+            return jsonify({"success": False, "error": str(e)}), 400
+        
+        if not accepted:
+            response = make_response(jsonify({
+                "success": False,
+                "error": "No valid labels in request",
+                "results": results
+            }), 400)
+            return add_cors_headers(response)
         
-        logger.info(f"Print job {print_job['id']} sent to {printer_name}")
+        zpl = build_batch_document(accepted)
+        fields = {"priority": priority}
+        if formats:
+            fields["formats"] = formats
+        # A repeat of a request that already printed (or is queued) gets the original job
+        keys = idempotency_keys(request.headers.get(IDEMPOTENCY_HEADER), data, data.get('printer'), zpl)
+        prescription_job, queue_position = print_intake.queue(
+            data.get('printer'), zpl, affinity_key(data), keys,
+            type="prescription",
+            label_count=len(accepted),
+            copies=len(accepted),
+            **fields
+        )
+        if queue_position is None:
+            return duplicate_response(prescription_job)
         
         response = make_response(jsonify({
             "success": True,
-            "job_id": print_job['id'],
-            "printer": printer_name,
-            "message": f"Print job sent to {printer_name}"
-        }), 200)
+            "job_id": prescription_job['id'],
+            "status": prescription_job['status'],
+            "queue_position": queue_position,
+            "printer": prescription_job['printer'],
+            "results": results,
+            "message": f"{len(accepted)} prescription label(s) queued for {prescription_job['printer']}"
+        }), 202)
         return add_cors_headers(response)
         
+    except PrintRequestError as e:
+        return request_error_response(e)
     except Exception as e:
-        logger.error(f"Error processing print request: {str(e)}")
+        logger.error(f"Error processing prescription print request: {str(e)}")
         response = make_response(jsonify({
             "success": False,
             "error": str(e)
         }), 500)
         return add_cors_headers(response)
 
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus metrics"""
+    return app.response_class(print_metrics.render(), content_type=METRICS_CONTENT_TYPE)
+
 @app.route('/jobs', methods=['GET', 'OPTIONS'])
 def get_jobs():
     """Get a list of print jobs"""
     if request.method == 'OPTIONS':
         return build_cors_preflight_response()
         
+    # Time range, printer and status filters are answered from the journal
+    if job_journal and any(name in request.args for name in JOURNAL_QUERY_PARAMS):
+        try:
+            jobs, next_cursor = job_journal.query_args(request.args)
+        except ValueError as e:
+            response = make_response(jsonify({"error": str(e)}), 400)
+            return add_cors_headers(response)
+        
+        response = make_response(jsonify({
+            "jobs": jobs,
+            "next_cursor": next_cursor
+        }))
+        return add_cors_headers(response)
+    
+    # Optionally limit to the most recent jobs
+    count = request.args.get('count', type=int)
+    jobs = job_registry.recent(count or None)
+    
     response = make_response(jsonify({
-        "jobs": print_jobs
+        "jobs": [job.to_dict() for job in jobs],
+        "total": len(job_registry)
     }))
     return add_cors_headers(response)
 
+@app.route('/jobs/stream', methods=['GET'])
+def job_stream():
+    """Push job state and printer health changes as Server-Sent Events"""
+    if not job_events.open_stream():
+        response = make_response(jsonify({
+            "success": False,
+            "error": "Too many open job streams, poll /jobs instead"
+        }), 503)
+        return add_cors_headers(response)
+    
+    # EventSource sends Last-Event-ID when it reconnects
+    last_id = parse_last_event_id(request.headers.get('Last-Event-ID') or request.args.get('last_event_id'))
+    response = Response(
+        job_events.stream(last_id, parse_filter(request.args.get('job_id')), parse_filter(request.args.get('printer'))),
+        headers=EVENT_STREAM_HEADERS
+    )
+    response.call_on_close(job_events.close_stream)
+    return add_cors_headers(response)
+
+@app.route('/job/<job_id>', methods=['GET', 'OPTIONS'])
+def get_job(job_id):
+    """Get details of a specific print job"""
+    if request.method == 'OPTIONS':
+        return build_cors_preflight_response()
+        
+    job = job_registry.get(job_id)
+    
+    # Older jobs may only be left in the journal
+    job_data = job.to_dict() if job else (job_journal.get(job_id) if job_journal else None)
+    if not job_data:
+        response = make_response(jsonify({"error": "Job not found"}), 404)
+        return add_cors_headers(response)
+    
+    response = make_response(jsonify(job_data))
+    return add_cors_headers(response)
+
 @app.route('/test_print', methods=['POST', 'OPTIONS'])
 def test_print():
     """Send a test print job to verify printer connectivity"""
@@ -198,27 +517,10 @@ def test_print():
         return build_cors_preflight_response()
         
     try:
-        data = request.json
-        printer_name = data.get('printer')
-        
-        # If no printer specified, use default
-        if not printer_name:
-            printer_name = win32print.GetDefaultPrinter()
-            logger.info(f"No printer specified for test print, using default: {printer_name}")
-        
-        # Check if printer exists
-        printer_exists = False
-        for printer in win32print.EnumPrinters(win32print.PRINTER_ENUM_LOCAL, None, 1):
-            if printer[2] == printer_name:
-                printer_exists = True
-                break
+        data = request.get_json(silent=True)
+        printer_name = data.get('printer') if isinstance(data, dict) else None
         
-        if not printer_exists:
-            response = make_response(jsonify({
-                "success": False,
-                "error": f"Printer '{printer_name}' not found"
-            }), 404)
-            return add_cors_headers(response)
+        printer_name = print_intake.resolve(printer_name)
         
         # Simple test ZPL code - optimized for 3x2 inch label with improved formatting
         # Adjusted to start from the left edge of the label with Helvetica font
@@ -265,55 +567,21 @@ def test_print():
             timestamp=time.strftime("%H:%M:%S")
         )
         
-        # Create a temporary file with the ZPL code
-        temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.zpl', mode='w')
-        temp_file.write(test_zpl)
-        temp_file.close()
-        
-        # Open the printer
-        logger.info(f"Opening printer for test print: {printer_name}")
-        printer_handle = win32print.OpenPrinter(printer_name)
-        
-        try:
-            # Start a print job
-            job_id = win32print.StartDocPrinter(printer_handle, 1, ("Test Print", None, "RAW"))
-            
-            try:
-                win32print.StartPagePrinter(printer_handle)
-                
-                # Read and send the ZPL file to the printer
-                with open(temp_file.name, 'rb') as f:
-                    zpl_data = f.read()
-                    win32print.WritePrinter(printer_handle, zpl_data)
-                
-                win32print.EndPagePrinter(printer_handle)
-            finally:
-                win32print.EndDocPrinter(printer_handle)
-        finally:
-            win32print.ClosePrinter(printer_handle)
-        
-        # Clean up the temporary file
-        os.unlink(temp_file.name)
-        
-        # Record the print job
-        test_job = {
-            "id": len(print_jobs) + 1,
-            "printer": printer_name,
-            "timestamp": time.time(),
-            "type": "test_print"
-        }
-        print_jobs.append(test_job)
-        
-        logger.info(f"Test print job {test_job['id']} sent to {printer_name}")
+        # Test prints skip the readiness check, so they can show what is wrong
+        test_job, queue_position = print_intake.submit(printer_name, test_zpl, type="test_print")
         
         response = make_response(jsonify({
             "success": True,
             "job_id": test_job['id'],
+            "status": test_job['status'],
+            "queue_position": queue_position,
             "printer": printer_name,
-            "message": f"Test print sent to {printer_name}"
-        }), 200)
+            "message": f"Test print queued for {printer_name}"
+        }), 202)
         return add_cors_headers(response)
         
+    except PrintRequestError as e:
+        return request_error_response(e)
     except Exception as e:
         logger.error(f"Error processing test print request: {str(e)}")
         response = make_response(jsonify({
@@ -322,6 +590,15 @@ def test_print():
         }), 500)
         return add_cors_headers(response)
 
+def close_resources():
+    """Release printer connections and flush the job journal on shutdown"""
+    job_events.close()
+    printer_health.stop()
+    handle_pool.close_all()
+    connection_pool.close_all()
+    if job_journal:
+        job_journal.close()
+
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5000))
     hostname = socket.gethostname()
@@ -331,11 +608,12 @@ if __name__ == '__main__':
     print(f"* Zebra Print Server running at: http://{ip_address}:{port} *")
     print(f"*****************************************************")
     print(f"Available printers:")
-    try:
-        for i, printer in enumerate(win32print.EnumPrinters(win32print.PRINTER_ENUM_LOCAL, None, 1)):
-            print(f"  {i+1}. {printer[2]}")
-        print(f"Default printer: {win32print.GetDefaultPrinter()}")
-    except Exception as e:
-        print(f"Error listing printers: {str(e)}")
+    for i, printer in enumerate(printer_registry.printers()):
+        print(f"  {i+1}. {printer}")
+    print(f"Default printer: {printer_registry.default}")
     
-    app.run(host='0.0.0.0', port=port, debug=False)
+    # Production WSGI server; set DEBUG=1 for the development server with the debugger
+    if os.environ.get('DEBUG', 'False').lower() in ('true', '1', 't'):
+        app.run(host='0.0.0.0', port=port, debug=True)
+    else:
+        serve(app, print_queue, host='0.0.0.0', port=port, on_shutdown=close_resources)
@@ -0,0 +1,122 @@
+"""
+Duplicate print suppression for the Zebra print server.
+When a print request times out in the browser, staff click Print again even
+though the first job often went through. A request can carry an
+Idempotency-Key header (or "idempotency_key" in the body); a repeat with the
+same key within the window gets the original job back instead of a second
+label. Requests with an Rx number also get a key made from the Rx number,
+printer and a hash of the ZPL, with or without a key of their own, so a
+second click that sends a new key is still caught. It is kept for a shorter
+window so a deliberate reprint a little later still prints. A job that
+failed doesn't count, so retrying after a failure prints again.
+
+Settings (environment variables):
+  IDEMPOTENCY_TTL          seconds an explicit key is remembered (default 600)
+  IDEMPOTENCY_DERIVED_TTL  seconds a key made from the Rx number is remembered (default 30)
+  IDEMPOTENCY_CAPACITY     most keys remembered (default 1000)
+"""
+
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from print_queue import JOB_FAILED
+from printer_groups import rx_number
+
+DEFAULT_TTL = 600
+DEFAULT_DERIVED_TTL = 30
+DEFAULT_CAPACITY = 1000
+
+HEADER = "Idempotency-Key"
+
+
+def request_keys(header_value, payload, printer_name, zpl):
+    """
+    The idempotency keys for a request as (key, derived) pairs: the client's
+    own key if it sent one, and one made from the Rx number and the ZPL if the
+    label has an Rx number. Either one matching an earlier job makes the
+    request a duplicate.
+    """
+    keys = []
+    key = header_value or payload.get("idempotency_key")
+    if key:
+        keys.append((f"key:{key}", False))
+    # A deliberate reprint opts out of the derived key
+    number = rx_number(payload)
+    if number and not payload.get("reprint"):
+        if isinstance(zpl, str):
+            zpl = zpl.encode("utf-8")
+        keys.append((f"rx:{number}:{printer_name}:{hashlib.sha256(zpl).hexdigest()}", True))
+    return keys
+
+
+class IdempotencyCache:
+    """Bounded, expiring map of idempotency keys to the jobs they created"""
+
+    def __init__(self, ttl=DEFAULT_TTL, derived_ttl=DEFAULT_DERIVED_TTL, capacity=DEFAULT_CAPACITY):
+        self.ttl = ttl
+        self.derived_ttl = derived_ttl
+        self.capacity = capacity
+        # key -> (expires_at, job), oldest first
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+
+    def get(self, keys):
+        """The job held for any of keys ((key, derived) pairs), if it is within its window and didn't fail"""
+        with self._lock:
+            original = self._find(keys, time.monotonic())
+            if original is not None:
+                self.hits += 1
+            return original
+
+    def claim(self, keys, job):
+        """
+        Remember job under all of keys ((key, derived) pairs) and return None,
+        or return the job already held for any of them if it is still within
+        its window and didn't fail. Checking and claiming happen under one
+        lock, so of two identical requests arriving together only one wins.
+        """
+        now = time.monotonic()
+        with self._lock:
+            original = self._find(keys, now)
+            if original is not None:
+                self.hits += 1
+                return original
+
+            for key, derived in keys:
+                self._entries.pop(key, None)
+                self._entries[key] = (now + (self.derived_ttl if derived else self.ttl), job)
+            self._evict(now)
+        return None
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _find(self, keys, now):
+        # Caller must hold self._lock
+        for key, _ in keys:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now and entry[1].get("status") != JOB_FAILED:
+                return entry[1]
+        return None
+
+    def _evict(self, now):
+        # Caller must hold self._lock. Entries are in insertion order, so the
+        # oldest go first; derived keys expire early and are dropped when seen.
+        while len(self._entries) > self.capacity:
+            self._entries.popitem(last=False)
+        while self._entries:
+            key, (expires_at, _) = next(iter(self._entries.items()))
+            if expires_at > now:
+                break
+            del self._entries[key]
+
+
+# Shared by the print servers
+idempotency_cache = IdempotencyCache(
+    ttl=float(os.environ.get('IDEMPOTENCY_TTL', DEFAULT_TTL)),
+    derived_ttl=float(os.environ.get('IDEMPOTENCY_DERIVED_TTL', DEFAULT_DERIVED_TTL)),
+    capacity=int(os.environ.get('IDEMPOTENCY_CAPACITY', DEFAULT_CAPACITY))
+)
@@ -0,0 +1,206 @@
+"""
+Job state and printer health changes as a Server-Sent Events stream.
+Instead of polling /jobs, a page opens GET /jobs/stream and is sent each job
+change (queued, spooling, done, failed) and each printer going ready or not
+ready as it happens. Events are numbered and the most recent ones are kept,
+so a browser that reconnects with Last-Event-ID gets what it missed; if it
+was gone too long it is sent a "reset" event and should reload /jobs.
+
+Filters: ?job_id=a,b only sends those jobs, ?printer=X only that printer's.
+
+A stream holds one request thread of the Flask servers, so they allow at
+most half of SERVER_THREADS streams at once (4 of the default 8) and end each
+one after EVENT_STREAM_MAX_AGE seconds (default 300); EventSource reconnects
+and resumes by itself. The other threads stay free for /print and /status.
+The asyncio engine has no such limits.
+
+Settings (environment variables):
+  EVENT_BUFFER_SIZE     events kept for resuming (default 1000)
+  MAX_EVENT_STREAMS     open streams allowed by the Flask servers (default half
+                        of SERVER_THREADS, and always at least one thread fewer)
+  EVENT_STREAM_MAX_AGE  seconds before a Flask server ends a stream (default 300)
+"""
+
+import itertools
+import json
+import threading
+import time
+from collections import deque
+
+DEFAULT_BUFFER_SIZE = 1000
+DEFAULT_MAX_STREAMS = 4
+DEFAULT_STREAM_MAX_AGE = 300
+
+# Comment line sent when nothing happened, so proxies and dead clients are noticed
+HEARTBEAT_INTERVAL = 15
+# How long EventSource waits before reconnecting, in milliseconds
+RECONNECT_MS = 2000
+
+JOB_EVENT = "job"
+HEALTH_EVENT = "printer_health"
+RESET_EVENT = "reset"
+
+HEADERS = {
+    "Content-Type": "text/event-stream; charset=utf-8",
+    "Cache-Control": "no-cache",
+    # Don't let a reverse proxy hold events back
+    "X-Accel-Buffering": "no",
+}
+
+
+class Event:
+    __slots__ = ("id", "type", "printer", "job_id", "data")
+
+    def __init__(self, event_id, event_type, printer, job_id, data):
+        self.id = event_id
+        self.type = event_type
+        self.printer = printer
+        self.job_id = job_id
+        self.data = data
+
+    def encode(self):
+        return f"id: {self.id}\nevent: {self.type}\ndata: {json.dumps(self.data, default=str)}\n\n".encode()
+
+
+def parse_last_event_id(value):
+    """The numeric Last-Event-ID, or None to start from now"""
+    try:
+        return int(value) if value else None
+    except ValueError:
+        return None
+
+
+def parse_filter(value):
+    """A comma-separated query value as a set, or None for no filter"""
+    return {item.strip() for item in value.split(",") if item.strip()} or None if value else None
+
+
+def stream_limit(threads, requested=0):
+    """
+    Streams a Flask server with `threads` request threads can allow: the
+    requested number (half the threads if not given), leaving at least one
+    thread for everything else unless there is only one
+    """
+    limit = requested or threads // 2
+    return max(min(limit, threads - 1), 1)
+
+
+class JobEvents:
+    """Recent job and printer events with their ids, shared by every stream"""
+
+    def __init__(self, capacity=DEFAULT_BUFFER_SIZE, max_streams=DEFAULT_MAX_STREAMS,
+                 stream_max_age=DEFAULT_STREAM_MAX_AGE):
+        self.max_streams = max_streams
+        self.stream_max_age = stream_max_age
+        self._events = deque(maxlen=capacity)
+        self._ids = itertools.count(1)
+        self._last_id = 0
+        self._changed = threading.Condition()
+        # Callbacks run after each event, used by asyncio streams to wake up
+        self._wakeups = set()
+        self._streams = 0
+        self._closed = False
+
+    @property
+    def last_id(self):
+        return self._last_id
+
+    def publish(self, event_type, data, printer=None, job_id=None):
+        with self._changed:
+            event = Event(next(self._ids), event_type, printer, job_id, data)
+            self._events.append(event)
+            self._last_id = event.id
+            self._changed.notify_all()
+            wakeups = list(self._wakeups)
+        for wakeup in wakeups:
+            wakeup()
+        return event
+
+    def record_job(self, job):
+        """PrintQueue listener: publish the job's new state"""
+        self.publish(JOB_EVENT, job.to_dict(), printer=job.get("printer"), job_id=job.get("id"))
+
+    def record_health(self, printer_name, health):
+        """PrinterHealth listener: publish a printer going ready or not ready"""
+        self.publish(HEALTH_EVENT, dict(health, printer=printer_name), printer=printer_name)
+
+    def since(self, last_id):
+        """Events after last_id, and whether some of them have already been dropped"""
+        with self._changed:
+            if last_id >= self._last_id:
+                return [], False
+            missed = bool(self._events) and self._events[0].id > last_id + 1
+            return [event for event in self._events if event.id > last_id], missed
+
+    def add_wakeup(self, func):
+        with self._changed:
+            self._wakeups.add(func)
+
+    def remove_wakeup(self, func):
+        with self._changed:
+            self._wakeups.discard(func)
+
+    def open_stream(self):
+        """Reserve one of the max_streams slots; False if they are all taken"""
+        with self._changed:
+            if self._closed or (self.max_streams and self._streams >= self.max_streams):
+                return False
+            self._streams += 1
+            return True
+
+    def close_stream(self):
+        with self._changed:
+            self._streams = max(self._streams - 1, 0)
+
+    def close(self):
+        """End every open stream, e.g. on shutdown"""
+        with self._changed:
+            self._closed = True
+            self._changed.notify_all()
+            wakeups = list(self._wakeups)
+        for wakeup in wakeups:
+            wakeup()
+
+    @property
+    def closed(self):
+        return self._closed
+
+    def preamble(self, last_id):
+        """The first bytes of a stream, and the id to continue from"""
+        chunk = f"retry: {RECONNECT_MS}\n\n".encode()
+        if last_id is None:
+            return chunk, self._last_id
+        if last_id > self._last_id:
+            # An id from before the server restarted; the id resets the browser's count too
+            return chunk + f"id: {self._last_id}\nevent: {RESET_EVENT}\ndata: {{}}\n\n".encode(), self._last_id
+        return chunk, last_id
+
+    def encode(self, events, missed, job_ids=None, printers=None):
+        """The matching events as SSE bytes, starting with a reset if some were missed"""
+        chunks = []
+        if missed:
+            chunks.append(f"event: {RESET_EVENT}\ndata: {{}}\n\n".encode())
+        for event in events:
+            if job_ids is not None and event.job_id not in job_ids:
+                continue
+            if printers is not None and event.printer not in printers:
+                continue
+            chunks.append(event.encode())
+        return b"".join(chunks)
+
+    def stream(self, last_id=None, job_ids=None, printers=None):
+        """
+        Blocking generator of SSE bytes for a thread-per-request server. The
+        caller reserves a slot with open_stream() and releases it with
+        close_stream() once the response is closed.
+        """
+        chunk, last_id = self.preamble(last_id)
+        yield chunk
+        deadline = time.monotonic() + self.stream_max_age if self.stream_max_age else None
+        while not self._closed and (deadline is None or time.monotonic() < deadline):
+            with self._changed:
+                self._changed.wait_for(lambda: self._last_id > last_id or self._closed, HEARTBEAT_INTERVAL)
+            events, missed = self.since(last_id)
+            if events:
+                last_id = events[-1].id
+            yield self.encode(events, missed, job_ids, printers) or b": keepalive\n\n"
@@ -0,0 +1,220 @@
+"""
+Optional durable job journal for the Zebra print server.
+Job state changes are written to a SQLite database (WAL mode) by a background
+thread in batched transactions, so the request and print threads never wait
+on disk. Indexes on timestamp, printer and status keep filtered /jobs queries
+fast with hundreds of thousands of jobs on record.
+
+Enable it by setting JOB_JOURNAL_PATH to the database file.
+"""
+
+import json
+import logging
+import queue
+import sqlite3
+import threading
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+# /jobs query parameters that are answered from the journal
+QUERY_PARAMS = ("since", "until", "printer", "status", "limit", "cursor")
+
+# Most rows a single /jobs query may return
+MAX_QUERY_LIMIT = 1000
+DEFAULT_QUERY_LIMIT = 100
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    id TEXT NOT NULL UNIQUE,
+    printer TEXT,
+    status TEXT,
+    type TEXT,
+    timestamp REAL,
+    completed_at REAL,
+    success INTEGER,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_timestamp ON jobs (timestamp);
+CREATE INDEX IF NOT EXISTS idx_jobs_printer ON jobs (printer, timestamp);
+CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, timestamp);
+"""
+
+_UPSERT = """
+INSERT INTO jobs (id, printer, status, type, timestamp, completed_at, success, data)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (id) DO UPDATE SET
+    printer = excluded.printer,
+    status = excluded.status,
+    type = excluded.type,
+    completed_at = excluded.completed_at,
+    success = excluded.success,
+    data = excluded.data
+"""
+
+
+def parse_time(value):
+    """Parse a since/until query value given as epoch seconds or an ISO date"""
+    if value is None or value == "":
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
+
+
+class JobJournal:
+    """SQLite-backed job history with a batching background writer"""
+
+    def __init__(self, path, batch_size=200, flush_interval=0.5):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._pending = queue.Queue()
+        self._readers = threading.local()
+        self._closed = threading.Event()
+
+        # Create the schema up front so queries work before the first write
+        connection = self._connect()
+        connection.executescript(_SCHEMA)
+        connection.close()
+
+        self._writer = threading.Thread(target=self._write_loop, name="job-journal", daemon=True)
+        self._writer.start()
+        logger.info(f"Job journal enabled at {path}")
+
+    def record(self, job):
+        """Queue a snapshot of a job's current state for writing"""
+        if not self._closed.is_set():
+            self._pending.put(job.to_dict())
+
+    def close(self, timeout=5):
+        """Write everything still queued and stop the writer"""
+        self._closed.set()
+        self._pending.put(None)
+        self._writer.join(timeout)
+
+    def get(self, job_id):
+        """Look up a single job by id, or None"""
+        row = self._reader().execute("SELECT data FROM jobs WHERE id = ?", (str(job_id),)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def query_args(self, args):
+        """Run query() with the filters from a /jobs request's query string"""
+        try:
+            return self.query(
+                since=parse_time(args.get("since")),
+                until=parse_time(args.get("until")),
+                printer=args.get("printer"),
+                status=args.get("status"),
+                limit=args.get("limit"),
+                cursor=args.get("cursor"),
+            )
+        except ValueError as e:
+            raise ValueError(f"Invalid job query: {str(e)}") from None
+
+    def query(self, since=None, until=None, printer=None, status=None, limit=None, cursor=None):
+        """
+        Jobs matching the filters, newest first.
+        Returns (jobs, next_cursor); pass next_cursor back to get the next page.
+        """
+        limit = min(max(int(limit or DEFAULT_QUERY_LIMIT), 1), MAX_QUERY_LIMIT)
+        clauses = []
+        params = []
+
+        if since is not None:
+            clauses.append("timestamp >= ?")
+            params.append(since)
+        if until is not None:
+            clauses.append("timestamp < ?")
+            params.append(until)
+        if printer:
+            clauses.append("printer = ?")
+            params.append(printer)
+        if status:
+            clauses.append("status = ?")
+            params.append(status)
+        if cursor:
+            # Keyset pagination: continue strictly after the last row returned
+            try:
+                cursor_time, cursor_seq = cursor.split(":")
+                cursor_time, cursor_seq = float(cursor_time), int(cursor_seq)
+            except ValueError:
+                raise ValueError("Invalid cursor") from None
+            clauses.append("(timestamp < ? OR (timestamp = ? AND seq < ?))")
+            params.extend([cursor_time, cursor_time, cursor_seq])
+
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        sql = f"SELECT seq, timestamp, data FROM jobs {where} ORDER BY timestamp DESC, seq DESC LIMIT ?"
+        rows = self._reader().execute(sql, params + [limit + 1]).fetchall()
+
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            last_seq, last_time, _ = rows[-1]
+            next_cursor = f"{last_time!r}:{last_seq}"
+
+        return [json.loads(data) for _, _, data in rows], next_cursor
+
+    def _connect(self):
+        connection = sqlite3.connect(self.path, timeout=30)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        return connection
+
+    def _reader(self):
+        # One read connection per thread; WAL lets readers run alongside the writer
+        connection = getattr(self._readers, "connection", None)
+        if connection is None:
+            connection = self._connect()
+            self._readers.connection = connection
+        return connection
+
+    def _write_loop(self):
+        connection = self._connect()
+        stopping = False
+        while not stopping:
+            try:
+                item = self._pending.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+
+            # Drain whatever else is waiting so it goes out in one transaction
+            batch = []
+            while True:
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+                if len(batch) >= self.batch_size:
+                    break
+                try:
+                    item = self._pending.get_nowait()
+                except queue.Empty:
+                    break
+
+            if batch:
+                self._write(connection, batch)
+        connection.close()
+
+    def _write(self, connection, batch):
+        rows = [
+            (
+                str(job["id"]),
+                job.get("printer"),
+                job.get("status"),
+                job.get("type"),
+                job.get("timestamp"),
+                job.get("completed_at"),
+                None if job.get("success") is None else int(job["success"]),
+                json.dumps(job),
+            )
+            for job in batch
+        ]
+        try:
+            with connection:
+                connection.executemany(_UPSERT, rows)
+        except sqlite3.Error as e:
+            # Losing a journal write must never take the print path down
+            logger.error(f"Error writing {len(rows)} job(s) to the journal: {str(e)}")
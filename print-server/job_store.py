@@ -0,0 +1,142 @@
+"""
+Job history for the Zebra print server.
+Jobs are kept in a fixed-capacity ring buffer with a dict index by id, so
+recording a job, evicting the oldest one and looking a job up are all O(1)
+and memory stays bounded on a PC that runs for months.
+
+The registry is shared by the request threads and the print workers, so all
+access goes through a lock that is only held for the O(1) bookkeeping.
+"""
+
+import itertools
+import os
+import threading
+import time
+
+# Default number of jobs kept in memory
+DEFAULT_CAPACITY = 1000
+
+
+def _base36(number):
+    digits = "0123456789abcdefghijklmnopqrstuvwxyz"
+    text = ""
+    while True:
+        number, remainder = divmod(number, 36)
+        text = digits[remainder] + text
+        if number == 0:
+            return text
+
+
+class JobIdGenerator:
+    """
+    Job ids of the form <start>-<pid>-<sequence>. The start time (in ms) and
+    process id keep ids from different runs and worker processes apart, and
+    the sequence increases with every job within a run.
+    """
+
+    def __init__(self):
+        self.prefix = f"{_base36(int(time.time() * 1000))}-{_base36(os.getpid())}"
+        self._sequence = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def next_id(self):
+        with self._lock:
+            sequence = next(self._sequence)
+        return f"{self.prefix}-{sequence}"
+
+
+class JobRecord:
+    """
+    One print job. Uses __slots__ to keep records compact, and supports
+    job["field"] access so the queue and spool code can treat it like a dict.
+    """
+
+    __slots__ = (
+        "id", "printer", "timestamp", "type", "zpl_length", "label_count", "copies",
+        "formats", "success", "status", "queued_at", "started_at", "completed_at",
+        "message", "error", "spool_job_id", "file_path", "attempts", "coalesced",
+        "priority", "queue_wait",
+    )
+
+    def __init__(self, **fields):
+        for name, value in fields.items():
+            setattr(self, name, value)
+
+    def __getitem__(self, name):
+        try:
+            return getattr(self, name)
+        except AttributeError:
+            raise KeyError(name) from None
+
+    def __setitem__(self, name, value):
+        setattr(self, name, value)
+
+    def __contains__(self, name):
+        return hasattr(self, name)
+
+    def get(self, name, default=None):
+        return getattr(self, name, default)
+
+    def to_dict(self):
+        """The fields that have been set, ready for jsonify"""
+        result = {}
+        for name in self.__slots__:
+            try:
+                result[name] = getattr(self, name)
+            except AttributeError:
+                continue
+        return result
+
+
+class JobRegistry:
+    """Fixed-capacity ring buffer of jobs with an index by job id"""
+
+    def __init__(self, capacity=DEFAULT_CAPACITY):
+        if capacity < 1:
+            raise ValueError("Job registry capacity must be at least 1")
+        self.capacity = capacity
+        self._ring = [None] * capacity
+        self._index = {}
+        self._ids = JobIdGenerator()
+        self._lock = threading.Lock()
+        # Total jobs ever added; the next free slot is added % capacity
+        self.added = 0
+
+    def new_id(self):
+        """A fresh job id that no other job in this or any other run will get"""
+        return self._ids.next_id()
+
+    def add(self, job):
+        """Record a job, evicting the oldest one once the buffer is full"""
+        with self._lock:
+            slot = self.added % self.capacity
+            evicted = self._ring[slot]
+            if evicted is not None:
+                self._index.pop(str(evicted.id), None)
+
+            self._ring[slot] = job
+            self._index[str(job.id)] = job
+            self.added += 1
+        return job
+
+    def get(self, job_id):
+        """Look up a job by id, or None if it is unknown or was evicted"""
+        return self._index.get(str(job_id))
+
+    def recent(self, count=None):
+        """
+        The most recent jobs, oldest first. Only the list of references is
+        taken under the lock; callers serialize the jobs afterwards.
+        """
+        with self._lock:
+            size = min(self.added, self.capacity)
+            if count is None or count > size:
+                count = size
+            if count <= 0:
+                return []
+
+            start = self.added - count
+            return [self._ring[i % self.capacity] for i in range(start, self.added)]
+
+    def __len__(self):
+        return min(self.added, self.capacity)
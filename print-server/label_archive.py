@@ -0,0 +1,34 @@
+"""
+Opt-in archive of printed labels.
+Labels are spooled straight from memory; set LABEL_ARCHIVE_DIR to also keep a
+copy of every printed label on disk for auditing or troubleshooting.
+"""
+
+import logging
+import os
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+# Directory for archived labels; archiving is off when this is not set
+ARCHIVE_DIR = os.environ.get('LABEL_ARCHIVE_DIR')
+
+
+def archive_label(job, data):
+    """Write a printed job's ZPL bytes to the archive directory and return the file path"""
+    if not ARCHIVE_DIR:
+        return None
+
+    try:
+        os.makedirs(ARCHIVE_DIR, exist_ok=True)
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        file_path = os.path.join(ARCHIVE_DIR, f"label_{timestamp}_{job['id']}.zpl")
+        with open(file_path, "wb") as f:
+            f.write(data)
+    except OSError as e:
+        # Archiving must never fail a print job
+        logger.error(f"Error archiving label for job {job['id']}: {str(e)}")
+        return None
+
+    job["file_path"] = file_path
+    return file_path
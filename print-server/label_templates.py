@@ -0,0 +1,254 @@
+"""
+Server-side label rendering for the Zebra print server.
+ZPL templates in the templates/ folder are parsed and compiled once at startup
+and cached by template name and version. Rendering a label is then a walk over
+the compiled pieces with no parsing on the print path.
+
+Template syntax:
+  ^FX name=<name> version=<n>   header naming the template (required)
+  {{field}}                      replaced with the field value
+  {{#field}}...{{/field}}        kept only when the field has a value
+Lines starting with ^FX and blank lines are dropped when compiling.
+"""
+
+import logging
+import os
+import re
+from datetime import date, datetime
+from print_batch import MAX_BATCH_LABELS
+from stored_formats import build_prescription_recall
+from zpl_utils import escape_field_data
+
+logger = logging.getLogger(__name__)
+
+TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "templates")
+
+_HEADER_RE = re.compile(r"^\^FX\s+name=(\w+)\s+version=(\d+)\s*$")
+_TAG_RE = re.compile(r"\{\{([#/]?)(\w+)\}\}")
+
+# Longest SIG that still fits on one label line
+SIG_LINE_LENGTH = 25
+
+
+class TemplateError(Exception):
+    """Raised for malformed templates or unknown template names"""
+
+
+class CompiledTemplate:
+    """A template split into literal text, field lookups and conditional sections"""
+
+    def __init__(self, name, version, source):
+        self.name = name
+        self.version = version
+        self._pieces = self._compile(source)
+
+    def render(self, context):
+        out = []
+        self._render(self._pieces, context, out)
+        return "".join(out)
+
+    def _render(self, pieces, context, out):
+        for kind, value, children in pieces:
+            if kind == "text":
+                out.append(value)
+            elif kind == "field":
+                field = context.get(value)
+                out.append("" if field is None else str(field))
+            elif context.get(value):
+                self._render(children, context, out)
+
+    def _compile(self, source):
+        # Drop comments and blank lines so they never reach the printer
+        lines = [line for line in source.splitlines() if line.strip() and not line.startswith("^FX")]
+        text = "\n".join(lines) + "\n"
+
+        root = []
+        stack = [(None, root)]
+        position = 0
+        for match in _TAG_RE.finditer(text):
+            if match.start() > position:
+                stack[-1][1].append(("text", text[position:match.start()], None))
+            marker, field = match.groups()
+            if marker == "#":
+                children = []
+                stack[-1][1].append(("section", field, children))
+                stack.append((field, children))
+            elif marker == "/":
+                if stack[-1][0] != field:
+                    raise TemplateError(f"Template '{self.name}' closes '{field}' before it was opened")
+                stack.pop()
+            else:
+                stack[-1][1].append(("field", field, None))
+            position = match.end()
+
+        if len(stack) > 1:
+            raise TemplateError(f"Template '{self.name}' never closes section '{stack[-1][0]}'")
+        if position < len(text):
+            root.append(("text", text[position:], None))
+        return root
+
+
+class TemplateCache:
+    """Compiled templates keyed by (name, version)"""
+
+    def __init__(self):
+        self._templates = {}
+        self._latest = {}
+
+    def load_directory(self, directory):
+        """Compile every .zpl template in a directory"""
+        for filename in sorted(os.listdir(directory)):
+            if filename.endswith(".zpl"):
+                with open(os.path.join(directory, filename), encoding="utf-8") as f:
+                    self.add(f.read())
+
+    def add(self, source):
+        """Compile a template source and cache it under the name and version in its header"""
+        first_line = source.lstrip().split("\n", 1)[0]
+        header = _HEADER_RE.match(first_line.strip())
+        if not header:
+            raise TemplateError("Template must start with '^FX name=<name> version=<n>'")
+
+        name, version = header.group(1), int(header.group(2))
+        template = CompiledTemplate(name, version, source)
+        self._templates[(name, version)] = template
+        if version >= self._latest.get(name, 0):
+            self._latest[name] = version
+        logger.info(f"Compiled label template {name} v{version}")
+        return template
+
+    def get(self, name, version=None):
+        """Look up a compiled template, defaulting to its latest version"""
+        if version is None:
+            version = self._latest.get(name)
+        template = self._templates.get((name, version))
+        if template is None:
+            raise TemplateError(f"Unknown label template '{name}' version {version}")
+        return template
+
+    def versions(self):
+        """{name: latest version} for every cached template"""
+        return dict(self._latest)
+
+
+def split_instructions(sig):
+    """Split SIG text over one or two label lines, breaking at a space near the middle"""
+    if not sig:
+        return "", ""
+    if len(sig) <= SIG_LINE_LENGTH:
+        return sig, ""
+
+    # Try to find a good breaking point around the middle of the string
+    mid_point = len(sig) // 2
+    break_point = sig.find(" ", mid_point)
+    if break_point == -1:
+        break_point = sig.rfind(" ", 0, mid_point + 1)
+
+    # If still no good breaking point, just split at the line length
+    if break_point == -1:
+        return sig[:SIG_LINE_LENGTH], sig[SIG_LINE_LENGTH:]
+
+    return sig[:break_point], sig[break_point + 1:]
+
+
+def format_label_date(value):
+    """Format a label date as dd/mm/yy, falling back to today's date"""
+    if isinstance(value, str):
+        value = value.strip()
+        # prepareLabelData already sends dd/mm/yy
+        if re.match(r"^\d{2}/\d{2}/\d{2}$", value):
+            return value
+        try:
+            return datetime.fromisoformat(value.replace("Z", "+00:00")).strftime("%d/%m/%y")
+        except ValueError:
+            pass
+    return date.today().strftime("%d/%m/%y")
+
+
+def prescription_fields(label):
+    """
+    Turn label data shaped like prepareLabelData() output into the field
+    values used by both the prescription template and the stored format.
+    Raises ValueError when required data is missing.
+    """
+    if not isinstance(label, dict):
+        raise ValueError("Label data must be an object")
+
+    missing = [name for name in ("patientName", "medicationName") if not label.get(name)]
+    if missing:
+        raise ValueError(f"Missing label data: {', '.join(missing)}")
+
+    doctor = label.get("doctor") or {}
+    doctor_name = doctor.get("name") if isinstance(doctor, dict) else str(doctor)
+    sig_line1, sig_line2 = split_instructions(label.get("sig") or "")
+
+    return {
+        "patient_name": label["patientName"],
+        "date": format_label_date(label.get("date")),
+        "rx_number": label.get("rxNumber", ""),
+        "doctor_name": (doctor_name or "").upper(),
+        "medication_name": label["medicationName"],
+        "sig_line1": sig_line1,
+        "sig_line2": sig_line2,
+        "quantity": label.get("quantity", ""),
+        "unit": label.get("unit", ""),
+        "refills": label.get("refills", ""),
+    }
+
+
+def render_prescription(fields, version=None):
+    """Render a full prescription label from prescription_fields() output"""
+    context = {name: escape_field_data(value) for name, value in fields.items()}
+
+    # A second SIG line pushes the rest of the label down
+    two_lines = bool(fields.get("sig_line2"))
+    divider_y = 270 if two_lines else 235
+    context.update({
+        "qty_y": 220 if two_lines else 185,
+        "refills_y": 250 if two_lines else 215,
+        "divider_y": divider_y,
+        "pharmacy_name_y": divider_y + 20,
+        "pharmacy_address_y": divider_y + 45,
+        "pharmacy_phone_y": divider_y + 70,
+        "pharmacist_y": divider_y + 100,
+    })
+    return templates.get("prescription", version).render(context)
+
+
+def render_prescription_labels(labels, stored_format=False, version=None):
+    """
+    Render the labels of a /print/prescription request.
+    With stored_format the labels become short ^XF recalls of the stored
+    prescription format instead of full ZPL.
+    Returns (accepted, results, formats) where accepted matches parse_batch_labels().
+    Raises ValueError if the label list itself is unusable.
+    """
+    if not isinstance(labels, list) or not labels:
+        raise ValueError("'labels' must be a non-empty array")
+    if len(labels) > MAX_BATCH_LABELS:
+        raise ValueError(f"A request can hold at most {MAX_BATCH_LABELS} labels")
+
+    accepted = []
+    results = []
+    formats = set()
+    for index, label in enumerate(labels):
+        try:
+            fields = prescription_fields(label)
+            if stored_format:
+                zpl, format_name = build_prescription_recall(fields)
+                formats.add(format_name)
+            else:
+                zpl = render_prescription(fields, version)
+        except (ValueError, TemplateError) as e:
+            results.append({"index": index, "success": False, "error": str(e)})
+            continue
+
+        accepted.append((index, zpl, 1))
+        results.append({"index": index, "success": True, "copies": 1, "zpl_length": len(zpl)})
+
+    return accepted, results, sorted(formats)
+
+
+# Templates are compiled once, when the server starts
+templates = TemplateCache()
+templates.load_directory(TEMPLATE_DIR)
@@ -0,0 +1,66 @@
+"""
+Batch label helpers for the Zebra print server.
+A batch is spooled as one concatenated RAW document, so a multi-drug
+prescription costs one spooler job instead of one job per label.
+"""
+
+from zpl_utils import encode_zpl, set_copies
+
+# Limits that keep a single batch request to a sensible size
+MAX_BATCH_LABELS = 200
+MAX_COPIES = 100
+
+
+def parse_copies(copies):
+    """A requested copy count, or ValueError if it isn't a whole number from 1 to MAX_COPIES"""
+    if not isinstance(copies, int) or isinstance(copies, bool) or not 1 <= copies <= MAX_COPIES:
+        raise ValueError(f"'copies' must be between 1 and {MAX_COPIES}")
+    return copies
+
+
+def parse_batch_labels(labels):
+    """
+    Validate the labels of a /print/batch request.
+    Each label is either a ZPL string or an object like {"zpl": "...", "copies": 2}.
+    Returns (accepted, results): accepted is a list of (index, zpl, copies) tuples,
+    with the copies already set as the label's ^PQ quantity, and results holds
+    one entry per submitted label, in order.
+    Raises ValueError if the label list itself is unusable.
+    """
+    if not isinstance(labels, list) or not labels:
+        raise ValueError("'labels' must be a non-empty array")
+    if len(labels) > MAX_BATCH_LABELS:
+        raise ValueError(f"A batch can hold at most {MAX_BATCH_LABELS} labels")
+
+    accepted = []
+    results = []
+    for index, label in enumerate(labels):
+        if isinstance(label, str):
+            zpl, copies = label, 1
+        elif isinstance(label, dict):
+            zpl, copies = label.get('zpl'), label.get('copies', 1)
+        else:
+            results.append({"index": index, "success": False, "error": "Label must be a ZPL string or an object"})
+            continue
+
+        if not zpl or not isinstance(zpl, str):
+            results.append({"index": index, "success": False, "error": "No ZPL code provided"})
+            continue
+        try:
+            printed = set_copies(zpl, parse_copies(copies))
+        except ValueError as e:
+            results.append({"index": index, "success": False, "error": str(e)})
+            continue
+
+        accepted.append((index, printed, copies))
+        results.append({"index": index, "success": True, "copies": copies, "zpl_length": len(zpl)})
+
+    return accepted, results
+
+
+def build_batch_document(accepted):
+    """
+    Concatenate accepted labels into one encoded ZPL document. Each label is
+    sent once; the printer makes its copies from the ^PQ quantity.
+    """
+    return b"\n".join(encode_zpl(zpl.strip()) for _, zpl, _ in accepted)
@@ -0,0 +1,166 @@
+"""
+The steps every print endpoint takes before a job is queued.
+A print request names a printer (or a group, or nothing for the default),
+and before its job is queued the server has to pick the printer, turn the
+request away if that printer can't print right now, and answer a repeated
+request with the job it already made. PrintIntake does this once for every
+server; each server only turns the outcome into its own kind of response.
+"""
+
+import logging
+import time
+from circuit_breaker import circuit_breakers
+from idempotency import idempotency_cache
+from job_store import JobRecord
+from print_queue import JOB_QUEUED
+from print_metrics import print_metrics
+from tcp_printer import network_printers
+
+logger = logging.getLogger(__name__)
+
+
+class PrintRequestError(Exception):
+    """A print request turned away before its job was queued"""
+
+    def __init__(self, status, message, headers=None, **extra):
+        super().__init__(message)
+        self.status = status
+        self.headers = headers or {}
+        self.extra = extra
+
+    def to_dict(self):
+        """The JSON body to answer with"""
+        return {"success": False, "error": str(self), **self.extra}
+
+
+def retry_after_header(seconds):
+    return {"Retry-After": str(max(int(seconds), 1))}
+
+
+class PrintIntake:
+    """Printer resolution, readiness checks and duplicate suppression for the print endpoints"""
+
+    def __init__(self, printer_registry, printer_groups, printer_health, job_registry, print_queue,
+                 fall_back_to_default=True):
+        self.printer_registry = printer_registry
+        self.printer_groups = printer_groups
+        self.printer_health = printer_health
+        self.job_registry = job_registry
+        self.print_queue = print_queue
+        # Whether an unknown printer name prints on the default printer or is a 404
+        self.fall_back_to_default = fall_back_to_default
+
+    def resolve(self, printer_name, affinity=None):
+        """
+        The printer a job should go to: the named printer, the group member
+        that should take it, or the default printer when none is named.
+        Raises PrintRequestError if there is no such printer or no group
+        member can print.
+        """
+        if printer_name in self.printer_groups:
+            member = self.printer_groups.pick(printer_name, affinity)
+            if member is None:
+                print_metrics.reject("group_unavailable")
+                raise PrintRequestError(
+                    503, f"No printer in group '{printer_name}' is available",
+                    headers=retry_after_header(self._group_retry_after(printer_name)),
+                    group=printer_name
+                )
+            return member
+
+        if printer_name and (network_printers.address(printer_name) or self.printer_registry.lookup(printer_name)):
+            return printer_name
+
+        if printer_name and not self.fall_back_to_default:
+            print_metrics.reject("no_printer")
+            raise PrintRequestError(404, f"Printer '{printer_name}' not found")
+
+        if not self.printer_registry.default:
+            print_metrics.reject("no_printer")
+            raise PrintRequestError(404, "No printers available")
+        if not printer_name:
+            logger.info(f"No printer specified, using default: {self.printer_registry.default}")
+        return self.printer_registry.default
+
+    def check_ready(self, printer_name):
+        """
+        Raise PrintRequestError (503) if the printer's circuit breaker is open
+        after repeated failures, or it was last seen paused, out of paper or
+        with its head open
+        """
+        if circuit_breakers.is_open(printer_name):
+            print_metrics.reject("circuit_open")
+            retry_after = circuit_breakers.retry_after(printer_name)
+            raise PrintRequestError(
+                503, f"Printer {printer_name} is failing, try again in {retry_after:.0f}s",
+                headers=retry_after_header(retry_after),
+                printer=printer_name,
+                circuit=circuit_breakers.get(printer_name).to_dict()
+            )
+        reason = self.printer_health.not_ready_reason(printer_name)
+        if reason:
+            print_metrics.reject("printer_not_ready")
+            raise PrintRequestError(
+                503, f"Printer {printer_name} is not ready: {reason}",
+                printer=printer_name,
+                health=self.printer_health.get(printer_name)
+            )
+
+    def duplicate(self, keys):
+        """The job already made for any of a request's idempotency keys, if any"""
+        return idempotency_cache.get(keys) if keys else None
+
+    def submit(self, printer_name, zpl, keys=(), **fields):
+        """
+        Record a job and hand it to the printer's queue. Returns (job,
+        queue_position); if another request with one of the same idempotency
+        keys (see idempotency.request_keys) got there first, returns (original
+        job, None) and queues nothing.
+        """
+        # Complete enough to answer a duplicate request with as soon as it is claimed,
+        # before the queue has taken it
+        now = time.time()
+        job = JobRecord(
+            id=self.job_registry.new_id(),
+            printer=printer_name,
+            timestamp=now,
+            zpl_length=len(zpl),
+            success=None,
+            status=JOB_QUEUED,
+            queued_at=now,
+            **fields
+        )
+        if keys:
+            # Two copies of the same request may arrive together
+            original = idempotency_cache.claim(keys, job)
+            if original:
+                return original, None
+        self.job_registry.add(job)
+        return job, self.print_queue.submit(printer_name, zpl, job)
+
+    def queue(self, printer_name, zpl, affinity=None, keys=(), started=None, **fields):
+        """
+        All of the above for one request: returns (job, queue_position) as
+        submit() does, with the original job for a repeated request. Pass
+        started (a perf_counter() reading) to time the parse and resolve stages.
+        Raises PrintRequestError.
+        """
+        original = self.duplicate(keys)
+        if original:
+            return original, None
+
+        parsed = time.perf_counter()
+        printer_name = self.resolve(printer_name, affinity)
+        self.check_ready(printer_name)
+        if started is not None:
+            print_metrics.observe_stage(printer_name, "parse", parsed - started)
+            print_metrics.observe_stage(printer_name, "resolve", time.perf_counter() - parsed)
+
+        return self.submit(printer_name, zpl, keys, **fields)
+
+    def _group_retry_after(self, group_name):
+        # The soonest a failing member's circuit lets a test job through,
+        # otherwise the next health poll
+        waits = [circuit_breakers.retry_after(member) for member in self.printer_groups.groups[group_name]]
+        waits = [wait for wait in waits if wait > 0]
+        return min(waits) if waits else self.printer_health.interval
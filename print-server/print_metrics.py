@@ -0,0 +1,234 @@
+"""
+Prometheus metrics for the Zebra print server, served at /metrics in the
+Prometheus text format. Counters and histograms are plain dicts behind a lock,
+so recording a value costs a perf_counter() call and a dict update and the
+metrics can stay on in production.
+
+Stages timed per printer (print_stage_seconds):
+  parse       reading and validating a /print request
+  resolve     picking the printer (name lookup, default or group member)
+  queue_wait  time a job waited in the printer's queue
+  spool       the whole spooler hand-off (StartDoc..EndDoc, copy /b or TCP)
+  write       the WritePrinter call, copy command or socket write alone
+  total       job accepted to job finished
+"""
+
+import asyncio
+import socket
+import threading
+import time
+from bisect import bisect_left
+from print_queue import JOB_DONE, JOB_FAILED
+from printer_health import PrinterNotReadyError
+from circuit_breaker import CircuitOpenError, WriteInterruptedError
+
+# Histogram bucket upper bounds in seconds
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=""):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def failure_reason(error):
+    """A short, low-cardinality reason for a failed print job"""
+    if isinstance(error, PrinterNotReadyError):
+        return "not_ready"
+    if isinstance(error, CircuitOpenError):
+        return "circuit_open"
+    if isinstance(error, WriteInterruptedError):
+        return "write_interrupted"
+    if isinstance(error, (socket.timeout, TimeoutError, asyncio.TimeoutError)):
+        return "timeout"
+    if isinstance(error, ConnectionRefusedError):
+        return "connection_refused"
+    if isinstance(error, ConnectionError):
+        return "connection_lost"
+    if type(error).__module__ == "pywintypes":
+        # win32print raises pywintypes.error for spooler failures
+        return "spooler_error"
+    if isinstance(error, OSError):
+        return "os_error"
+    return "other"
+
+
+class Counter:
+    """Monotonic counter with labels"""
+
+    def __init__(self, name, help_text, label_names=()):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self):
+        with self._lock:
+            values = list(self._values.items())
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        for label_values, value in values:
+            lines.append(f"{self.name}{_labels(self.label_names, label_values)} {_number(value)}")
+        return lines
+
+
+class Histogram:
+    """Histogram with fixed buckets and labels"""
+
+    def __init__(self, name, help_text, label_names=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(buckets)
+        # {label values: [per-bucket counts (last is +Inf), sum]}
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(label_values)
+            if entry is None:
+                entry = self._values[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][index] += 1
+            entry[1] += value
+
+    def render(self):
+        with self._lock:
+            values = [(label_values, list(counts), total) for label_values, (counts, total) in self._values.items()]
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for label_values, counts, total in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = f'le="{_number(bound)}"'
+                lines.append(f"{self.name}_bucket{_labels(self.label_names, label_values, le)} {cumulative}")
+            labels = _labels(self.label_names, label_values)
+            lines.append(f"{self.name}_sum{labels} {_number(total)}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class PrintMetrics:
+    """The print server's metrics and the hooks that record them"""
+
+    def __init__(self):
+        self.stage_seconds = Histogram(
+            "print_stage_seconds", "Time spent in each stage of a print job", ("printer", "stage"))
+        self.jobs = Counter("print_jobs_total", "Finished print jobs by outcome", ("printer", "status"))
+        self.bytes_sent = Counter("print_bytes_sent_total", "ZPL bytes sent to each printer", ("printer",))
+        self.failures = Counter("print_failures_total", "Failed print jobs by reason", ("printer", "reason"))
+        self.rejected = Counter("print_requests_rejected_total", "Print requests rejected before queueing", ("reason",))
+        # (name, type, help, label name, func) read when /metrics is scraped
+        self._callbacks = []
+
+    def observe_stage(self, printer_name, stage, seconds):
+        self.stage_seconds.observe(seconds, printer_name, stage)
+
+    def stage(self, printer_name, stage):
+        """Context manager that times a block as one stage"""
+        return _StageTimer(self, printer_name, stage)
+
+    def reject(self, reason):
+        self.rejected.inc(reason)
+
+    def add_callback(self, name, metric_type, help_text, label_name, func):
+        """Expose a value read at scrape time; func returns a number or {label value: number}"""
+        self._callbacks.append((name, metric_type, help_text, label_name, func))
+
+    def instrument(self, spool_func):
+        """Wrap a PrintQueue spool function to time it and count bytes and failures"""
+        def spool(printer_name, data, job):
+            start = time.perf_counter()
+            try:
+                message = spool_func(printer_name, data, job)
+            except Exception as e:
+                self.failures.inc(printer_name, failure_reason(e))
+                raise
+            finally:
+                self.stage_seconds.observe(time.perf_counter() - start, printer_name, "spool")
+            self.bytes_sent.inc(printer_name, amount=len(data))
+            return message
+        return spool
+
+    def instrument_async(self, spool_func):
+        """instrument() for the coroutine spool function of AsyncPrintQueue"""
+        async def spool(printer_name, data, job):
+            start = time.perf_counter()
+            try:
+                message = await spool_func(printer_name, data, job)
+            except Exception as e:
+                self.failures.inc(printer_name, failure_reason(e))
+                raise
+            finally:
+                self.stage_seconds.observe(time.perf_counter() - start, printer_name, "spool")
+            self.bytes_sent.inc(printer_name, amount=len(data))
+            return message
+        return spool
+
+    def record_job(self, job):
+        """PrintQueue listener: record queue wait and total time once a job finishes"""
+        status = job.get("status")
+        if status not in (JOB_DONE, JOB_FAILED):
+            return
+        printer_name = job.get("printer")
+        self.jobs.inc(printer_name, status)
+        if job.get("started_at") and job.get("queued_at"):
+            self.stage_seconds.observe(job["started_at"] - job["queued_at"], printer_name, "queue_wait")
+        if job.get("completed_at") and job.get("timestamp"):
+            self.stage_seconds.observe(job["completed_at"] - job["timestamp"], printer_name, "total")
+
+    def render(self):
+        """All metrics in the Prometheus text format"""
+        lines = []
+        for metric in (self.stage_seconds, self.jobs, self.bytes_sent, self.failures, self.rejected):
+            lines.extend(metric.render())
+        for name, metric_type, help_text, label_name, func in self._callbacks:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {metric_type}")
+            value = func()
+            if isinstance(value, dict):
+                for label_value, number in value.items():
+                    lines.append(f"{name}{_labels((label_name,), (label_value,))} {_number(number)}")
+            else:
+                lines.append(f"{name} {_number(value)}")
+        return "\n".join(lines) + "\n"
+
+
+class _StageTimer:
+    __slots__ = ("metrics", "printer_name", "stage_name", "start")
+
+    def __init__(self, metrics, printer_name, stage_name):
+        self.metrics = metrics
+        self.printer_name = printer_name
+        self.stage_name = stage_name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.metrics.observe_stage(self.printer_name, self.stage_name, time.perf_counter() - self.start)
+        return False
+
+
+# Shared by the servers and the spooler helpers
+print_metrics = PrintMetrics()
@@ -0,0 +1,444 @@
+"""
+Background print queue for the Zebra print server.
+Each printer gets its own FIFO queue drained by a worker thread, so /print can
+accept a job and return straight away while the spooler does the slow work.
+AsyncPrintQueue does the same with tasks on an asyncio event loop.
+
+With a coalescing window set, a worker that picks up a job also takes the
+jobs that reach the same printer within the window (up to a byte limit) and
+sends them to the printer as one write, so a burst of single labels costs one
+spooler job. Each job still gets its own status and result.
+
+Jobs wait in one of two lanes: interactive (someone at the counter) and bulk
+(reprints and other background work). A worker takes interactive jobs first,
+so between two labels of a long reprint run a walk-in label goes next. So
+that bulk work always moves, one bulk job is let through after bulk_every
+interactive jobs in a row.
+"""
+
+import asyncio
+import logging
+import queue
+import threading
+import time
+from collections import deque
+from zpl_utils import encode_zpl
+
+logger = logging.getLogger(__name__)
+
+# Job states reported through /jobs and /job/<job_id>
+JOB_QUEUED = "queued"
+JOB_SPOOLING = "spooling"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+
+# Priority lanes, in the order they are served
+INTERACTIVE = "interactive"
+BULK = "bulk"
+PRIORITIES = (INTERACTIVE, BULK)
+
+# Interactive jobs served in a row, while bulk jobs wait, before one bulk job goes
+DEFAULT_BULK_EVERY = 5
+
+# Assumed seconds per label for a printer that has not printed anything yet
+DEFAULT_LABEL_SECONDS = 1.0
+
+# Weight of the newest job in the per-printer seconds-per-label average
+LABEL_SECONDS_WEIGHT = 0.2
+
+# A coalesced write stops taking more jobs once it holds this many bytes
+DEFAULT_COALESCE_MAX_BYTES = 32 * 1024
+
+# Fields the spool function sets on a coalesced write that apply to each of its jobs
+WRITE_FIELDS = ("attempts", "spool_job_id", "file_path")
+
+
+def job_labels(job):
+    """Number of physical labels a job prints"""
+    return job.get("copies") or job.get("label_count") or 1
+
+
+def parse_priority(priority):
+    """A request's priority lane (interactive when not given), or ValueError"""
+    if priority is None:
+        return INTERACTIVE
+    if priority not in PRIORITIES:
+        raise ValueError(f"'priority' must be one of: {', '.join(PRIORITIES)}")
+    return priority
+
+
+class Lanes:
+    """
+    The deque behind a printer's queue: popleft() takes interactive jobs
+    ahead of bulk ones, except that after bulk_every interactive jobs in a
+    row while bulk jobs wait, the next one is a bulk job
+    """
+
+    def __init__(self, bulk_every=DEFAULT_BULK_EVERY):
+        self.bulk_every = bulk_every
+        self._lanes = {priority: deque() for priority in PRIORITIES}
+        self._streak = 0
+
+    def __len__(self):
+        return sum(len(lane) for lane in self._lanes.values())
+
+    def waiting(self, priority):
+        return len(self._lanes[priority])
+
+    def append(self, entry):
+        _, job = entry
+        self._lanes[job.get("priority") or INTERACTIVE].append(entry)
+
+    def popleft(self):
+        interactive, bulk = self._lanes[INTERACTIVE], self._lanes[BULK]
+        if interactive and not (bulk and self.bulk_every and self._streak >= self.bulk_every):
+            self._streak = self._streak + 1 if bulk else 0
+            return interactive.popleft()
+        self._streak = 0
+        return (bulk or interactive).popleft()
+
+
+class LaneQueue(queue.Queue):
+    """queue.Queue that hands out jobs by priority lane"""
+
+    def __init__(self, bulk_every=DEFAULT_BULK_EVERY):
+        self.bulk_every = bulk_every
+        super().__init__()
+
+    def _init(self, maxsize):
+        self.queue = Lanes(self.bulk_every)
+
+    def waiting(self, priority):
+        with self.mutex:
+            return self.queue.waiting(priority)
+
+
+class AsyncLaneQueue(asyncio.Queue):
+    """asyncio.Queue that hands out jobs by priority lane"""
+
+    def __init__(self, bulk_every=DEFAULT_BULK_EVERY):
+        self.bulk_every = bulk_every
+        super().__init__()
+
+    def _init(self, maxsize):
+        self._queue = Lanes(self.bulk_every)
+
+    def waiting(self, priority):
+        return self._queue.waiting(priority)
+
+
+class PrintQueue:
+    """Per-printer job queues, each drained in order by its own worker thread"""
+
+    def __init__(self, spool_func, coalesce_window=0, coalesce_max_bytes=DEFAULT_COALESCE_MAX_BYTES,
+                 bulk_every=DEFAULT_BULK_EVERY):
+        # spool_func(printer_name, data, job) sends one job's encoded ZPL bytes
+        # to the printer and returns a status message. It should raise if the
+        # job failed. For a coalesced write, job is a dict standing for all of
+        # the jobs in it.
+        self.spool_func = spool_func
+        # Seconds to wait for more jobs before writing, 0 to send each job alone
+        self.coalesce_window = coalesce_window
+        self.coalesce_max_bytes = coalesce_max_bytes
+        # 0 lets bulk jobs wait for as long as interactive ones keep coming
+        self.bulk_every = bulk_every
+        self._listeners = []
+        self._queues = {}
+        self._pending = {}
+        self._pending_labels = {}
+        self._label_seconds = {}
+        self._lock = threading.Lock()
+        # Signalled whenever the last pending job of all printers finishes
+        self._idle = threading.Condition(self._lock)
+
+    def submit(self, printer_name, zpl, job):
+        """
+        Queue a job in the lane named by its "priority" (interactive if unset)
+        and return its position in that printer's queue
+        """
+        # Encode once here; workers hand these bytes to the printer as-is
+        data = encode_zpl(zpl)
+        job["status"] = JOB_QUEUED
+        job["queued_at"] = time.time()
+        job["started_at"] = None
+        job["completed_at"] = None
+
+        with self._lock:
+            printer_queue = self._queues.get(printer_name)
+            if printer_queue is None:
+                printer_queue = self._start_worker(printer_name)
+            self._pending[printer_name] += 1
+            self._pending_labels[printer_name] += job_labels(job)
+            position = self._pending[printer_name]
+            if job.get("priority") != BULK:
+                # Only the job being printed and other interactive jobs are ahead of it
+                position -= printer_queue.waiting(BULK)
+            printer_queue.put_nowait((data, job))
+
+        logger.info(f"Job {job['id']} queued for {printer_name} at position {position}")
+        self._notify(job)
+        return position
+
+    def add_listener(self, listener):
+        """Call listener(job) whenever a job's status changes"""
+        self._listeners.append(listener)
+
+    def depth(self, printer_name):
+        """Number of jobs waiting or spooling for a printer"""
+        with self._lock:
+            return self._pending.get(printer_name, 0)
+
+    def depths(self):
+        """{printer_name: jobs waiting or spooling} for every printer seen so far"""
+        with self._lock:
+            return dict(self._pending)
+
+    def pending(self):
+        """Number of jobs waiting or spooling across all printers"""
+        with self._lock:
+            return sum(self._pending.values())
+
+    def wait_idle(self, timeout=None):
+        """Block until every queued job has finished. Returns False on timeout."""
+        with self._idle:
+            return self._idle.wait_for(lambda: not any(self._pending.values()), timeout)
+
+    def estimated_wait(self, printer_name):
+        """
+        Seconds until a printer would finish everything queued for it, from
+        its pending label count and its measured average seconds per label
+        """
+        with self._lock:
+            labels = self._pending_labels.get(printer_name, 0)
+            seconds = self._label_seconds.get(printer_name, DEFAULT_LABEL_SECONDS)
+        return labels * seconds
+
+    def _start_worker(self, printer_name):
+        # Caller must hold self._lock
+        printer_queue = self._create_queue()
+        self._queues[printer_name] = printer_queue
+        self._pending[printer_name] = 0
+        self._pending_labels[printer_name] = 0
+        self._spawn_worker(printer_name, printer_queue)
+        logger.info(f"Started print worker for {printer_name}")
+        return printer_queue
+
+    def _create_queue(self):
+        return LaneQueue(self.bulk_every)
+
+    def _spawn_worker(self, printer_name, printer_queue):
+        worker = threading.Thread(
+            target=self._worker,
+            args=(printer_name, printer_queue),
+            name=f"print-worker-{printer_name}",
+            daemon=True
+        )
+        worker.start()
+
+    def _worker(self, printer_name, printer_queue):
+        while True:
+            data, job = printer_queue.get()
+            if self.coalesce_window:
+                entries = self._gather(printer_queue, [(data, job)])
+                if len(entries) > 1:
+                    self._spool_write(printer_name, entries)
+                    for _ in entries:
+                        printer_queue.task_done()
+                    continue
+            self._start_job(job)
+            try:
+                message = self.spool_func(printer_name, data, job)
+            except Exception as e:
+                self._fail_job(printer_name, job, e)
+            else:
+                self._complete_job(job, message)
+            finally:
+                self._finish(printer_name, job)
+                printer_queue.task_done()
+
+            logger.info(f"Print job {job['id']} {job['status']} on {printer_name}")
+            self._notify(job)
+
+    def _gather(self, printer_queue, entries):
+        """Add the jobs that arrive within the coalescing window to entries, up to coalesce_max_bytes"""
+        deadline = time.monotonic() + self.coalesce_window
+        size = len(entries[0][0])
+        while size < self.coalesce_max_bytes:
+            try:
+                entry = printer_queue.get(timeout=max(deadline - time.monotonic(), 0))
+            except queue.Empty:
+                break
+            entries.append(entry)
+            size += len(entry[0])
+        return entries
+
+    def _spool_write(self, printer_name, entries):
+        data, write = self._merge(printer_name, entries)
+        self._start_write(entries)
+        try:
+            message = self.spool_func(printer_name, data, write)
+        except Exception as e:
+            self._end_write(printer_name, entries, write, error=e)
+        else:
+            self._end_write(printer_name, entries, write, message)
+
+    def _merge(self, printer_name, entries):
+        """The joined bytes of several jobs, and a job dict that stands for all of them"""
+        jobs = [job for _, job in entries]
+        formats = []
+        for job in jobs:
+            formats.extend(name for name in job.get("formats") or () if name not in formats)
+        write = {
+            "id": f"{jobs[0]['id']}+{len(jobs) - 1}",
+            "printer": printer_name,
+            "type": "batch",
+            "label_count": sum(job_labels(job) for job in jobs),
+            "formats": formats,
+        }
+        logger.info(f"Coalescing {len(jobs)} jobs for {printer_name} into one write")
+        return b"\n".join(bytes(data) for data, _ in entries), write
+
+    def _start_write(self, entries):
+        for _, job in entries:
+            job["coalesced"] = len(entries)
+            self._start_job(job)
+
+    def _end_write(self, printer_name, entries, write, message=None, error=None):
+        for _, job in entries:
+            for field in WRITE_FIELDS:
+                if field in write:
+                    job[field] = write[field]
+            if error is None:
+                self._complete_job(job, message)
+            else:
+                self._fail_job(printer_name, job, error)
+            self._finish(printer_name, job, write["label_count"])
+            logger.info(f"Print job {job['id']} {job['status']} on {printer_name}")
+            self._notify(job)
+
+    def _start_job(self, job):
+        # Timestamps are written before the status so a reader that sees
+        # a new status also sees the fields that go with it
+        job["started_at"] = time.time()
+        job["queue_wait"] = job["started_at"] - job["queued_at"]
+        job["status"] = JOB_SPOOLING
+        self._notify(job)
+
+    def _fail_job(self, printer_name, job, error):
+        logger.error(f"Print job {job['id']} failed on {printer_name}: {str(error)}")
+        job["error"] = str(error)
+        job["success"] = False
+        job["completed_at"] = time.time()
+        job["status"] = JOB_FAILED
+
+    def _complete_job(self, job, message):
+        job["message"] = message
+        job["success"] = True
+        job["completed_at"] = time.time()
+        job["status"] = JOB_DONE
+
+    def _finish(self, printer_name, job, write_labels=None):
+        # write_labels is the label count of the whole write for a coalesced job
+        labels = job_labels(job)
+        with self._lock:
+            self._pending[printer_name] -= 1
+            self._pending_labels[printer_name] -= labels
+            # Track how fast this printer gets through labels for estimated_wait()
+            if job.get("success"):
+                per_label = (job["completed_at"] - job["started_at"]) / (write_labels or labels)
+                previous = self._label_seconds.get(printer_name)
+                self._label_seconds[printer_name] = per_label if previous is None else (
+                    previous + LABEL_SECONDS_WEIGHT * (per_label - previous))
+            if not any(self._pending.values()):
+                self._idle.notify_all()
+
+    def _notify(self, job):
+        for listener in self._listeners:
+            try:
+                listener(job)
+            except Exception as e:
+                # A broken listener must not stall the print queue
+                logger.error(f"Error in print queue listener: {str(e)}")
+
+
+class AsyncPrintQueue(PrintQueue):
+    """
+    The same per-printer queues for the asyncio server. Each printer is
+    drained by a task on the event loop, spool_func is a coroutine function,
+    and submit() must be called from the loop.
+    """
+
+    def __init__(self, spool_func, coalesce_window=0, coalesce_max_bytes=DEFAULT_COALESCE_MAX_BYTES,
+                 bulk_every=DEFAULT_BULK_EVERY):
+        super().__init__(spool_func, coalesce_window, coalesce_max_bytes, bulk_every)
+        # Keep references so worker tasks aren't garbage collected
+        self._tasks = {}
+
+    async def drain(self, timeout=None):
+        """Wait until every queued job has finished. Returns False on timeout."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self.pending():
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            await asyncio.sleep(0.1)
+        return True
+
+    def _create_queue(self):
+        return AsyncLaneQueue(self.bulk_every)
+
+    def _spawn_worker(self, printer_name, printer_queue):
+        self._tasks[printer_name] = asyncio.get_running_loop().create_task(
+            self._worker(printer_name, printer_queue),
+            name=f"print-worker-{printer_name}"
+        )
+
+    async def _worker(self, printer_name, printer_queue):
+        while True:
+            data, job = await printer_queue.get()
+            if self.coalesce_window:
+                entries = await self._gather(printer_queue, [(data, job)])
+                if len(entries) > 1:
+                    await self._spool_write(printer_name, entries)
+                    for _ in entries:
+                        printer_queue.task_done()
+                    continue
+            self._start_job(job)
+            try:
+                message = await self.spool_func(printer_name, data, job)
+            except Exception as e:
+                self._fail_job(printer_name, job, e)
+            else:
+                self._complete_job(job, message)
+            finally:
+                self._finish(printer_name, job)
+                printer_queue.task_done()
+
+            logger.info(f"Print job {job['id']} {job['status']} on {printer_name}")
+            self._notify(job)
+
+    async def _gather(self, printer_queue, entries):
+        deadline = time.monotonic() + self.coalesce_window
+        size = len(entries[0][0])
+        while size < self.coalesce_max_bytes:
+            try:
+                entry = printer_queue.get_nowait()
+            except asyncio.QueueEmpty:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                # Sleep out the window, then take whatever arrived
+                await asyncio.sleep(remaining)
+                continue
+            entries.append(entry)
+            size += len(entry[0])
+        return entries
+
+    async def _spool_write(self, printer_name, entries):
+        data, write = self._merge(printer_name, entries)
+        self._start_write(entries)
+        try:
+            message = await self.spool_func(printer_name, data, write)
+        except Exception as e:
+            self._end_write(printer_name, entries, write, error=e)
+        else:
+            self._end_write(printer_name, entries, write, message)
@@ -4,7 +4,7 @@ This is a Flask server that handles printing to Zebra printers via Windows.
 For production, this should be deployed on a Windows PC with the Zebra printer connected.
 """
 
-from flask import Flask, jsonify, request
+from flask import Flask, Response, jsonify, request
 from flask_cors import CORS
 import os
 import time
@@ -13,16 +13,31 @@ import sys
 import tempfile
 import subprocess
 from datetime import datetime
+from print_queue import PrintQueue, parse_priority, DEFAULT_COALESCE_MAX_BYTES, DEFAULT_BULK_EVERY
+from job_journal import JobJournal, QUERY_PARAMS as JOURNAL_QUERY_PARAMS
+from job_events import (JobEvents, parse_last_event_id, parse_filter, HEADERS as EVENT_STREAM_HEADERS,
+                        DEFAULT_BUFFER_SIZE as DEFAULT_EVENT_BUFFER_SIZE, stream_limit, DEFAULT_STREAM_MAX_AGE)
+from idempotency import idempotency_cache, request_keys as idempotency_keys, HEADER as IDEMPOTENCY_HEADER
+from job_store import JobRegistry
+from print_intake import PrintIntake, PrintRequestError
+from print_batch import parse_batch_labels, parse_copies, build_batch_document
+from zpl_utils import set_copies
+from label_archive import archive_label
+from stored_formats import stored_formats, build_prescription_recall
+from label_templates import render_prescription_labels
+from printer_registry import PrinterRegistry, DEFAULT_REFRESH_INTERVAL
+from tcp_printer import network_printers, connection_pool, send_raw as send_network, query as query_network
+from production_server import serve, server_threads
+from print_metrics import print_metrics, CONTENT_TYPE as METRICS_CONTENT_TYPE
+from server_logging import configure_logging
+from simulated_printer import simulated_printers
+from circuit_breaker import circuit_breakers, WriteInterruptedError
+from printer_health import (PrinterHealth, parse_host_status, HOST_STATUS_COMMAND, HOST_STATUS_FRAMES,
+                            DEFAULT_INTERVAL as DEFAULT_HEALTH_INTERVAL, DEFAULT_TIMEOUT as DEFAULT_HEALTH_TIMEOUT)
+from printer_groups import PrinterGroups, parse_groups, affinity_key, EARLIEST_COMPLETION, DEFAULT_AFFINITY_TTL
 
 # Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.StreamHandler(),
-        logging.FileHandler('print_server.log')
-    ]
-)
+configure_logging()
 
 logger = logging.getLogger(__name__)
 
@@ -30,199 +45,492 @@ app = Flask(__name__)
 CORS(app)  # Enable CORS for all routes
 
 # Print job history - store recent jobs in memory
-print_jobs = []
-MAX_STORED_JOBS = 100
+MAX_STORED_JOBS = int(os.environ.get('MAX_STORED_JOBS', 100))
+job_registry = JobRegistry(MAX_STORED_JOBS)
+
+# Optional durable job history for audits
+job_journal = JobJournal(os.environ['JOB_JOURNAL_PATH']) if os.environ.get('JOB_JOURNAL_PATH') else None
+
+# Job and printer changes pushed to /jobs/stream; each open stream holds a request thread
+job_events = JobEvents(
+    capacity=int(os.environ.get('EVENT_BUFFER_SIZE', DEFAULT_EVENT_BUFFER_SIZE)),
+    max_streams=stream_limit(server_threads(), int(os.environ.get('MAX_EVENT_STREAMS', 0))),
+    stream_max_age=float(os.environ.get('EVENT_STREAM_MAX_AGE', DEFAULT_STREAM_MAX_AGE))
+)
 
 # Get available printers
 def get_available_printers():
+    """Enumerate printers and pick the default. Raises if the list can't be read."""
+    if sys.platform == 'win32':
+        # On Windows, use wmic to get printer list
+        output = subprocess.check_output(['wmic', 'printer', 'get', 'name']).decode('utf-8')
+        printers = [printer.strip() for printer in output.split('\n')[1:] if printer.strip()]
+    else:
+        # For development on non-Windows platforms, return simulated list
+        # Include the specific printer name mentioned by the user
+        # (unless real network printers are configured)
+        printers = [] if network_printers.names() else ["ZDesigner GK420d (Copy 1)", "Zebra GK420D (Simulated)", "Microsoft Print to PDF"]
+    
+    # Networked printers are reached over raw TCP on any platform
+    printers += [name for name in network_printers.names() if name not in printers]
+    
+    # Find default Zebra printer if available
+    # Look for both 'zebra' and 'zdesigner' in printer names
+    default_printer = next(
+        (printer for printer in printers if 'zebra' in printer.lower() or 'zdesigner' in printer.lower()), 
+        printers[0] if printers else None
+    )
+    
+    return printers, default_printer
+
+# Cached printer list, refreshed in the background
+printer_registry = PrinterRegistry(
+    get_available_printers,
+    refresh_interval=int(os.environ.get('PRINTER_REFRESH_INTERVAL', DEFAULT_REFRESH_INTERVAL))
+)
+printer_registry.start()
+
+HEALTH_TIMEOUT = float(os.environ.get('PRINTER_HEALTH_TIMEOUT', DEFAULT_HEALTH_TIMEOUT))
+
+# This server prints with copy /b and doesn't need pywin32, but with it
+# installed local printers report their status through the spooler
+spooler_status = None
+if sys.platform == 'win32':
     try:
-        if sys.platform == 'win32':
-            # On Windows, use wmic to get printer list
-            output = subprocess.check_output(['wmic', 'printer', 'get', 'name']).decode('utf-8')
-            printers = [printer.strip() for printer in output.split('\n')[1:] if printer.strip()]
-            return printers
-        else:
-            # For development on non-Windows platforms, return simulated list
-            # Include the specific printer name mentioned by the user
-            return ["ZDesigner GK420d (Copy 1)", "Zebra GK420D (Simulated)", "Microsoft Print to PDF"]
-    except Exception as e:
-        logger.error(f"Error getting printer list: {e}")
-        return ["Error getting printer list"]
+        from win32_spooler import printer_status as spooler_status
+    except ImportError:
+        logger.warning("pywin32 is not installed, so local printer status can't be read")
+
+def printer_status(printer_name):
+    """Health flags for one printer, read by the health monitor"""
+    if network_printers.address(printer_name):
+        response = query_network(printer_name, HOST_STATUS_COMMAND, HOST_STATUS_FRAMES, HEALTH_TIMEOUT)
+        return parse_host_status(response) if response else None
+    if sys.platform != 'win32':
+        return parse_host_status(simulated_printers.get(printer_name).host_status())
+    if spooler_status is None:
+        # copy /b can't read anything back from the printer
+        return None
+    return spooler_status(printer_name)
+
+# Paper-out, paused and head-open flags for each printer, polled in the background
+printer_health = PrinterHealth(
+    printer_status,
+    printer_registry.printers,
+    interval=float(os.environ.get('PRINTER_HEALTH_INTERVAL', DEFAULT_HEALTH_INTERVAL))
+)
+printer_health.add_listener(job_events.record_health)
+# A printer that was offline or stopped may have been power-cycled and lost its formats
+stored_formats.follow(printer_health)
+printer_health.start()
+
+def printer_available(printer_name):
+    """Whether a printer can take jobs right now"""
+    known = bool(network_printers.address(printer_name)) or printer_name in printer_registry
+    return known and printer_health.is_ready(printer_name) and not circuit_breakers.is_open(printer_name)
+
+def spool_label(printer_name, data, job):
+    """Send one queued job's ZPL bytes to the printer (runs on the printer's worker thread)"""
+    # A paused or empty printer would take the job and never print it
+    printer_health.ensure_ready(printer_name)
+    
+    # Prepend the stored-format download if this printer doesn't hold it yet
+    data = stored_formats.prepare(printer_name, job, data)
+    
+    if network_printers.address(printer_name):
+        # Networked printers are written to directly on port 9100
+        try:
+            send_network(printer_name, data)
+        except Exception:
+            # The printer may have lost its formats along with the job
+            stored_formats.invalidate(printer_name)
+            raise
+        message = f"Print job sent to {printer_name}"
+    elif sys.platform == 'win32':
+        # copy /b needs a file, so write the already-encoded bytes in one go
+        with tempfile.NamedTemporaryFile(delete=False, suffix='.zpl') as f:
+            f.write(data)
+        
+        try:
+            # On Windows, use the actual printing command
+            # Handle printer names with spaces and special characters
+            printer_path = f"\\\\.\\{printer_name}"
+            cmd = ['copy', '/b', f.name, printer_path]
+            logger.info(f"Executing print command: copy /b {f.name} {printer_path}")
+            with print_metrics.stage(printer_name, "write"):
+                try:
+                    subprocess.run(cmd, check=True, shell=True)
+                except subprocess.CalledProcessError as e:
+                    # copy /b doesn't say how much reached the port before it failed
+                    raise WriteInterruptedError(e) from e
+        except Exception:
+            # The printer may have lost its formats along with the job
+            stored_formats.invalidate(printer_name)
+            raise
+        finally:
+            os.unlink(f.name)
+        message = f"Print job sent to {printer_name}"
+    else:
+        # For development on non-Windows platforms
+        logger.info(f"Simulating print to {printer_name} (non-Windows environment)")
+        try:
+            with print_metrics.stage(printer_name, "write"):
+                simulated_printers.send(printer_name, data)
+        except Exception:
+            stored_formats.invalidate(printer_name)
+            raise
+        message = f"Simulated print job sent to {printer_name}"
+    
+    stored_formats.confirm(printer_name, job)
+    archive_label(job, data)
+    return message
+
+# Background queue that drains print jobs per printer
+print_queue = PrintQueue(
+    print_metrics.instrument(circuit_breakers.guard(spool_label)),
+    # Jobs for the same printer within this many ms go out as one write; 0 is off
+    coalesce_window=float(os.environ.get('PRINT_COALESCE_MS', 0)) / 1000,
+    coalesce_max_bytes=int(os.environ.get('PRINT_COALESCE_MAX_BYTES', DEFAULT_COALESCE_MAX_BYTES)),
+    # Interactive jobs in a row before a waiting bulk job gets a turn
+    bulk_every=int(os.environ.get('PRINT_BULK_EVERY', DEFAULT_BULK_EVERY))
+)
+print_queue.add_listener(print_metrics.record_job)
+print_queue.add_listener(job_events.record_job)
+if job_journal:
+    print_queue.add_listener(job_journal.record)
+
+# Values read when /metrics is scraped
+print_metrics.add_callback("print_queue_depth", "gauge", "Jobs waiting or spooling per printer", "printer", print_queue.depths)
+print_metrics.add_callback("printer_lookup_total", "counter", "Printer name lookups by cache result", "result", printer_registry.lookup_counts)
+print_metrics.add_callback("print_retries_total", "counter", "Print attempts retried after a transient error", "printer", circuit_breakers.retry_counts)
+print_metrics.add_callback("printer_circuit_open", "gauge", "1 while a printer's circuit breaker is open", "printer", circuit_breakers.open_circuits)
+print_metrics.add_callback("print_duplicates_total", "counter", "Repeated print requests answered with the original job", None,
+                           lambda: idempotency_cache.hits)
+
+# Named groups of printers that share the load, e.g. "counter"
+printer_groups = PrinterGroups(
+    parse_groups(os.environ.get('PRINTER_GROUPS', '')),
+    print_queue,
+    available_func=printer_available,
+    strategy=os.environ.get('PRINTER_GROUP_STRATEGY', EARLIEST_COMPLETION),
+    affinity_ttl=int(os.environ.get('PRINTER_GROUP_AFFINITY_TTL', DEFAULT_AFFINITY_TTL))
+)
+
+# Printer resolution, readiness checks and duplicate suppression for the print endpoints
+print_intake = PrintIntake(printer_registry, printer_groups, printer_health, job_registry, print_queue)
 
 @app.route('/status', methods=['GET'])
 def status():
     """Check if the print server is online"""
-    logger.info("Status check received")
+    logger.debug("Status check received")
     return jsonify({
         "status": "online",
         "version": "1.0.0",
-        "timestamp": time.time()
+        "timestamp": time.time(),
+        "printers": printer_health.summary()
     })
 
 @app.route('/printers', methods=['GET'])
 def get_printers():
     """Get a list of available printers"""
-    logger.info("Printer list requested")
-    printers = get_available_printers()
+    logger.debug("Printer list requested")
     
-    # Find default Zebra printer if available
-    # Look for both 'zebra' and 'zdesigner' in printer names
-    default_printer = next(
-        (printer for printer in printers if 'zebra' in printer.lower() or 'zdesigner' in printer.lower()), 
-        printers[0] if printers else None
-    )
+    # Re-enumerate only when asked, otherwise serve the cached list
+    if request.args.get('refresh') in ('1', 'true'):
+        printer_registry.refresh()
     
     return jsonify({
-        "printers": printers,
-        "default": default_printer
+        "printers": printer_registry.printers(),
+        "default": printer_registry.default,
+        "refreshed_at": printer_registry.refreshed_at,
+        "groups": printer_groups.to_dict(),
+        "health": printer_health.to_dict(),
+        "circuits": circuit_breakers.to_dict()
+    })
+
+def duplicate_response(job):
+    """The original job for a repeated print request, which is not printed again"""
+    response = jsonify({
+        "success": True,
+        "duplicate": True,
+        "job_id": job["id"],
+        "status": job["status"],
+        "printer": job["printer"],
+        "message": f"Duplicate of print job {job['id']}, not printed again"
     })
+    response.headers["Idempotent-Replayed"] = "true"
+    return response, 200
+
+def request_error_response(error):
+    """The response for a print request turned away before queueing"""
+    response = jsonify(error.to_dict())
+    response.headers.update(error.headers)
+    return response, error.status
 
 @app.route('/print', methods=['POST'])
 def print_label():
     """Print a label to the specified printer"""
+    started = time.perf_counter()
     try:
-        data = request.json
+        data = request.get_json(silent=True)
         
-        if not data:
+        if not data or not isinstance(data, dict):
+            print_metrics.reject("no_data")
             return jsonify({"success": False, "error": "No data provided"}), 400
         
         zpl = data.get('zpl')
         printer_name = data.get('printer')
+        formats = []
+        
+        # Stored-format mode: only the field values are sent and the layout
+        # is recalled from printer memory
+        if not zpl and data.get('fields'):
+            try:
+                zpl, format_name = build_prescription_recall(data.get('fields'))
+            except ValueError as e:
+                print_metrics.reject("invalid_fields")
+                return jsonify({"success": False, "error": str(e)}), 400
+            formats.append(format_name)
         
         if not zpl:
+            print_metrics.reject("no_zpl")
             return jsonify({"success": False, "error": "No ZPL code provided"}), 400
         
-        # Get available printers
-        printers = get_available_printers()
+        # Copies are made by the printer from one ^PQ label, not sent again
+        try:
+            copies = parse_copies(data.get('copies', 1))
+            zpl = set_copies(zpl, copies)
+        except ValueError as e:
+            print_metrics.reject("invalid_copies")
+            return jsonify({"success": False, "error": str(e)}), 400
+        
+        # Walk-in labels go ahead of bulk reprints
+        try:
+            priority = parse_priority(data.get('priority'))
+        except ValueError as e:
+            print_metrics.reject("invalid_priority")
+            return jsonify({"success": False, "error": str(e)}), 400
         
-        # If no printer specified or printer not found, use default
-        if not printer_name or printer_name not in printers:
-            # Find a Zebra printer (including ZDesigner variants)
-            zebra_printers = [p for p in printers if 'zebra' in p.lower() or 'zdesigner' in p.lower()]
-            if zebra_printers:
-                printer_name = zebra_printers[0]
-            elif printers:
-                printer_name = printers[0]
-            else:
-                return jsonify({"success": False, "error": "No printers available"}), 404
+        fields = {"priority": priority}
+        if formats:
+            fields["formats"] = formats
+        if copies > 1:
+            fields["copies"] = copies
         
-        # Generate a unique job ID
-        job_id = f"{int(time.time())}_{len(print_jobs) + 1}"
+        # A repeat of a request that already printed (or is queued) gets the original job
+        keys = idempotency_keys(request.headers.get(IDEMPOTENCY_HEADER), data, printer_name, zpl)
         
-        # Create a temporary file with the ZPL content
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        temp_dir = os.path.join(tempfile.gettempdir(), "pharmacy_labels")
-        os.makedirs(temp_dir, exist_ok=True)
-        zpl_file_path = os.path.join(temp_dir, f"label_{timestamp}_{job_id}.zpl")
+        # Record the job and hand it to the printer's queue
+        job_info, queue_position = print_intake.queue(
+            printer_name, zpl, affinity_key(data), keys, started=started, **fields)
+        if queue_position is None:
+            return duplicate_response(job_info)
         
-        with open(zpl_file_path, "w") as f:
-            f.write(zpl)
+        return jsonify({
+            "success": True,
+            "job_id": job_info["id"],
+            "status": job_info["status"],
+            "queue_position": queue_position,
+            "printer": job_info["printer"],
+            "message": f"Print job queued for {job_info['printer']}"
+        }), 202
         
-        logger.info(f"Created ZPL file at {zpl_file_path}")
+    except PrintRequestError as e:
+        return request_error_response(e)
+    except Exception as e:
+        logger.error(f"Error processing print request: {str(e)}")
+        return jsonify({
+            "success": False,
+            "error": str(e)
+        }), 500
+
+@app.route('/print/batch', methods=['POST'])
+def print_batch():
+    """Print several labels as one spooler job"""
+    try:
+        data = request.get_json(silent=True)
         
-        # Print the file
-        success = False
-        message = ""
+        if not data or not isinstance(data, dict):
+            return jsonify({"success": False, "error": "No data provided"}), 400
         
         try:
-            if sys.platform == 'win32':
-                # On Windows, use the actual printing command
-                # Handle printer names with spaces and special characters
-                printer_path = f"\\\\.\\{printer_name}"
-                cmd = ['copy', '/b', zpl_file_path, printer_path]
-                logger.info(f"Executing print command: copy /b {zpl_file_path} {printer_path}")
-                subprocess.run(cmd, check=True, shell=True)
-                success = True
-                message = f"Print job sent to {printer_name}"
-            else:
-                # For development on non-Windows platforms
-                logger.info(f"Simulating print to {printer_name} (non-Windows environment)")
-                # Simulate printing delay
-                time.sleep(1)
-                success = True
-                message = f"Simulated print job sent to {printer_name}"
-        except subprocess.CalledProcessError as e:
-            logger.error(f"Printing error: {e}")
-            message = f"Error printing to {printer_name}: {str(e)}"
-        except Exception as e:
-            logger.error(f"Unexpected error during printing: {e}")
-            message = f"Unexpected error: {str(e)}"
+            accepted, results = parse_batch_labels(data.get('labels'))
+            priority = parse_priority(data.get('priority'))
+        except ValueError as e:
+            return jsonify({"success": False, "error": str(e)}), 400
         
-        # Record the job
-        job_info = {
-            "id": job_id,
-            "printer": printer_name,
-            "timestamp": time.time(),
-            "zpl_length": len(zpl),
-            "file_path": zpl_file_path,
-            "success": success
-        }
+        if not accepted:
+            return jsonify({
+                "success": False,
+                "error": "No valid labels in batch",
+                "results": results
+            }), 400
         
-        # Add to job history and maintain max size
-        print_jobs.append(job_info)
-        if len(print_jobs) > MAX_STORED_JOBS:
-            print_jobs.pop(0)
+        # All labels go to the printer as a single RAW document, already encoded
+        zpl = build_batch_document(accepted)
+        # A repeat of a request that already printed (or is queued) gets the original job
+        keys = idempotency_keys(request.headers.get(IDEMPOTENCY_HEADER), data, data.get('printer'), zpl)
+        job_info, queue_position = print_intake.queue(
+            data.get('printer'), zpl, affinity_key(data), keys,
+            type="batch",
+            label_count=len(accepted),
+            copies=sum(copies for _, _, copies in accepted),
+            priority=priority
+        )
+        if queue_position is None:
+            return duplicate_response(job_info)
         
-        logger.info(f"Print job {job_id} processed: {success}")
+        return jsonify({
+            "success": True,
+            "job_id": job_info["id"],
+            "status": job_info["status"],
+            "queue_position": queue_position,
+            "printer": job_info["printer"],
+            "results": results,
+            "message": f"Batch of {len(accepted)} label(s) queued for {job_info['printer']}"
+        }), 202
         
+    except PrintRequestError as e:
+        return request_error_response(e)
+    except Exception as e:
+        logger.error(f"Error processing batch print request: {str(e)}")
         return jsonify({
-            "success": success,
-            "job_id": job_id,
-            "message": message
-        })
+            "success": False,
+            "error": str(e)
+        }), 500
+
+@app.route('/print/prescription', methods=['POST'])
+def print_prescription():
+    """Render prescription labels on the server and print them as one spooler job"""
+    try:
+        data = request.get_json(silent=True)
+        
+        if not data or not isinstance(data, dict):
+            return jsonify({"success": False, "error": "No data provided"}), 400
+        
+        labels = data.get('labels')
+        if labels is None and data.get('label'):
+            labels = [data.get('label')]
         
+        try:
+            accepted, results, formats = render_prescription_labels(
+                labels,
+                stored_format=bool(data.get('stored_format')),
+                version=data.get('template_version')
+            )
+            priority = parse_priority(data.get('priority'))
+        except ValueError as e:
+            return jsonify({"success": False, "error": str(e)}), 400
+        
+        if not accepted:
+            return jsonify({
+                "success": False,
+                "error": "No valid labels in request",
+                "results": results
+            }), 400
+        
+        zpl = build_batch_document(accepted)
+        fields = {"priority": priority}
+        if formats:
+            fields["formats"] = formats
+        # A repeat of a request that already printed (or is queued) gets the original job
+        keys = idempotency_keys(request.headers.get(IDEMPOTENCY_HEADER), data, data.get('printer'), zpl)
+        job_info, queue_position = print_intake.queue(
+            data.get('printer'), zpl, affinity_key(data), keys,
+            type="prescription",
+            label_count=len(accepted),
+            copies=len(accepted),
+            **fields
+        )
+        if queue_position is None:
+            return duplicate_response(job_info)
+        
+        return jsonify({
+            "success": True,
+            "job_id": job_info["id"],
+            "status": job_info["status"],
+            "queue_position": queue_position,
+            "printer": job_info["printer"],
+            "results": results,
+            "message": f"{len(accepted)} prescription label(s) queued for {job_info['printer']}"
+        }), 202
+        
+    except PrintRequestError as e:
+        return request_error_response(e)
     except Exception as e:
-        logger.error(f"Error processing print request: {str(e)}")
+        logger.error(f"Error processing prescription print request: {str(e)}")
         return jsonify({
             "success": False,
             "error": str(e)
         }), 500
 
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus metrics"""
+    return app.response_class(print_metrics.render(), content_type=METRICS_CONTENT_TYPE)
+
 @app.route('/jobs', methods=['GET'])
 def get_jobs():
     """Get a list of print jobs"""
-    # Optionally filter by count or time range
+    # Time range, printer and status filters are answered from the journal
+    if job_journal and any(name in request.args for name in JOURNAL_QUERY_PARAMS):
+        try:
+            jobs, next_cursor = job_journal.query_args(request.args)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        
+        return jsonify({
+            "jobs": jobs,
+            "next_cursor": next_cursor
+        })
+    
+    # Optionally filter by count
     count = request.args.get('count', type=int)
-    if count:
-        jobs = print_jobs[-count:]
-    else:
-        jobs = print_jobs
+    jobs = job_registry.recent(count or None)
     
     return jsonify({
-        "jobs": jobs,
-        "total": len(print_jobs)
+        "jobs": [job.to_dict() for job in jobs],
+        "total": len(job_registry)
     })
 
+@app.route('/jobs/stream', methods=['GET'])
+def job_stream():
+    """Push job state and printer health changes as Server-Sent Events"""
+    if not job_events.open_stream():
+        return jsonify({"success": False, "error": "Too many open job streams, poll /jobs instead"}), 503
+    
+    # EventSource sends Last-Event-ID when it reconnects
+    last_id = parse_last_event_id(request.headers.get('Last-Event-ID') or request.args.get('last_event_id'))
+    response = Response(
+        job_events.stream(last_id, parse_filter(request.args.get('job_id')), parse_filter(request.args.get('printer'))),
+        headers=EVENT_STREAM_HEADERS
+    )
+    response.call_on_close(job_events.close_stream)
+    return response
+
 @app.route('/job/<job_id>', methods=['GET'])
 def get_job(job_id):
     """Get details of a specific print job"""
-    job = next((job for job in print_jobs if str(job["id"]) == job_id), None)
+    job = job_registry.get(job_id)
+    
+    if job:
+        return jsonify(job.to_dict())
     
-    if not job:
+    # Older jobs may only be left in the journal
+    journal_job = job_journal.get(job_id) if job_journal else None
+    if not journal_job:
         return jsonify({"error": "Job not found"}), 404
     
-    return jsonify(job)
+    return jsonify(journal_job)
 
 @app.route('/test_print', methods=['POST'])
 def test_print():
     """Send a test print job to verify printer connectivity"""
     try:
-        data = request.json
-        printer_name = data.get('printer')
+        data = request.get_json(silent=True)
+        printer_name = data.get('printer') if isinstance(data, dict) else None
         
-        # Get available printers
-        printers = get_available_printers()
-        
-        # If no printer specified or printer not found, use default
-        if not printer_name or printer_name not in printers:
-            # Find a Zebra printer (including ZDesigner variants)
-            zebra_printers = [p for p in printers if 'zebra' in p.lower() or 'zdesigner' in p.lower()]
-            if zebra_printers:
-                printer_name = zebra_printers[0]
-            elif printers:
-                printer_name = printers[0]
-            else:
-                return jsonify({"success": False, "error": "No printers available"}), 404
+        printer_name = print_intake.resolve(printer_name)
         
         # Simple test ZPL code - optimized for 3x2 inch label
         test_zpl = """^XA
@@ -235,21 +543,20 @@ def test_print():
 ^FO30,250^FDIf you can read this, printing works!^FS
 ^XZ""".format(timestamp=datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
         
-        # Create a request with the test ZPL
-        test_request = type('obj', (object,), {
-            'json': {
-                'zpl': test_zpl,
-                'printer': printer_name
-            }
-        })
+        # Test prints skip the readiness check, so they can show what is wrong
+        job_info, queue_position = print_intake.submit(printer_name, test_zpl, type="test_print")
         
-        # Use the existing print function
-        with app.test_request_context():
-            request._cached_json = test_request.json
-            response = print_label()
-            
-        return response
+        return jsonify({
+            "success": True,
+            "job_id": job_info["id"],
+            "status": job_info["status"],
+            "queue_position": queue_position,
+            "printer": printer_name,
+            "message": f"Test print queued for {printer_name}"
+        }), 202
         
+    except PrintRequestError as e:
+        return request_error_response(e)
     except Exception as e:
         logger.error(f"Error processing test print: {str(e)}")
         return jsonify({
@@ -257,16 +564,27 @@ def test_print():
             "error": str(e)
         }), 500
 
+def close_resources():
+    """Release printer connections and flush the job journal on shutdown"""
+    job_events.close()
+    printer_health.stop()
+    connection_pool.close_all()
+    if job_journal:
+        job_journal.close()
+
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5000))
     host = os.environ.get('HOST', '0.0.0.0')
-    debug = os.environ.get('DEBUG', 'True').lower() in ('true', '1', 't')
+    debug = os.environ.get('DEBUG', 'False').lower() in ('true', '1', 't')
     
     # Log startup information
     logger.info(f"Starting Zebra Print Server on {host}:{port}")
     logger.info(f"Debug mode: {debug}")
     logger.info(f"Platform: {sys.platform}")
-    logger.info(f"Available printers: {get_available_printers()}")
+    logger.info(f"Available printers: {printer_registry.printers()}")
     
-    # Run the server
-    app.run(host=host, port=port, debug=debug)
+    # Run the server; the development server (reloader and debugger) only with DEBUG=1
+    if debug:
+        app.run(host=host, port=port, debug=True)
+    else:
+        serve(app, print_queue, host=host, port=port, on_shutdown=close_resources)
@@ -0,0 +1,158 @@
+"""
+Named printer groups for the Zebra print server.
+A group such as "counter" can be used in the printer field of any print
+request, and each job is dispatched to the member that will get to it
+soonest, so two or three printers at the dispensing counter share the load
+instead of one of them taking every label.
+
+Groups are set in the PRINTER_GROUPS environment variable:
+
+  PRINTER_GROUPS="counter=ZDesigner GK420d,ZDesigner GK420d (Copy 1)"
+
+Optionally all labels of one prescription stay on the printer that got the
+first of them, so a patient's labels come out of one printer together.
+"""
+
+import itertools
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# Dispatch strategies
+LEAST_QUEUE = "least_queue"
+EARLIEST_COMPLETION = "earliest_completion"
+STRATEGIES = (LEAST_QUEUE, EARLIEST_COMPLETION)
+
+# Seconds a prescription stays pinned to the printer its first label went to
+DEFAULT_AFFINITY_TTL = 300
+
+# Most prescriptions remembered for affinity at once
+MAX_AFFINITY_ENTRIES = 1000
+
+
+def parse_groups(spec):
+    """Parse "group=Printer A,Printer B;other=Printer C" into {group: [members]}"""
+    groups = {}
+    for entry in (spec or "").split(";"):
+        if not entry.strip():
+            continue
+        name, separator, members = entry.partition("=")
+        members = [member.strip() for member in members.split(",") if member.strip()]
+        if not separator or not name.strip() or not members:
+            raise ValueError(f"Invalid printer group '{entry}', expected group=Printer A,Printer B")
+        groups[name.strip()] = members
+    return groups
+
+
+def rx_number(payload):
+    """The Rx number in a print request's label data, if there is one"""
+    labels = payload.get("labels")
+    label = payload.get("fields") or payload.get("label") or (labels[0] if isinstance(labels, list) and labels else None)
+    if isinstance(label, dict):
+        number = label.get("rx_number") or label.get("rxNumber")
+        return str(number) if number else None
+    return None
+
+
+def affinity_key(payload):
+    """
+    The key that keeps one prescription's labels on one printer: an explicit
+    "affinity" value, or else the Rx number found in the request's label data
+    """
+    key = payload.get("affinity")
+    return str(key) if key else rx_number(payload)
+
+
+class PrinterGroups:
+    """Printer groups with least-loaded member selection"""
+
+    def __init__(self, groups, print_queue, available_func=None, strategy=EARLIEST_COMPLETION,
+                 affinity_ttl=DEFAULT_AFFINITY_TTL):
+        if strategy not in STRATEGIES:
+            raise ValueError(f"Unknown printer group strategy '{strategy}'")
+        self.groups = dict(groups)
+        self.print_queue = print_queue
+        # available_func(printer_name) says whether a member can take jobs right now
+        self.available_func = available_func or (lambda printer_name: True)
+        self.strategy = strategy
+        self.affinity_ttl = affinity_ttl
+        # {affinity key: (printer_name, expires_at)}, oldest first
+        self._affinity = OrderedDict()
+        self._lock = threading.Lock()
+        # Rotates the starting member so ties are shared out evenly
+        self._turn = itertools.count()
+
+    def __contains__(self, name):
+        return name in self.groups
+
+    def names(self):
+        return list(self.groups)
+
+    def pick(self, group_name, affinity_key=None):
+        """
+        Choose the member of a group that should print the next job, or None
+        if no member is available. With an affinity key (e.g. an Rx number),
+        later jobs with the same key go to the same member while it is available.
+        An affinity_ttl of 0 turns affinity off.
+        """
+        members = [member for member in self.groups[group_name] if self.available_func(member)]
+        if not members:
+            logger.error(f"No printer available in group {group_name}")
+            return None
+
+        if affinity_key and self.affinity_ttl > 0:
+            pinned = self._pinned(affinity_key)
+            if pinned in members:
+                self._pin(affinity_key, pinned)
+                return pinned
+
+        start = next(self._turn) % len(members)
+        rotated = members[start:] + members[:start]
+        # min() keeps the first of equally loaded members
+        printer_name = min(rotated, key=self._load)
+
+        if affinity_key and self.affinity_ttl > 0:
+            self._pin(affinity_key, printer_name)
+        logger.info(f"Group {group_name} dispatching to {printer_name}")
+        return printer_name
+
+    def to_dict(self):
+        """Groups with each member's queue depth and estimated wait, for /printers"""
+        return {
+            name: [
+                {
+                    "printer": member,
+                    "available": bool(self.available_func(member)),
+                    "queued": self.print_queue.depth(member),
+                    "estimated_wait": round(self.print_queue.estimated_wait(member), 2)
+                }
+                for member in members
+            ]
+            for name, members in self.groups.items()
+        }
+
+    def _load(self, printer_name):
+        if self.strategy == LEAST_QUEUE:
+            return self.print_queue.depth(printer_name)
+        return self.print_queue.estimated_wait(printer_name)
+
+    def _pinned(self, affinity_key):
+        with self._lock:
+            entry = self._affinity.get(affinity_key)
+            if entry is None:
+                return None
+            printer_name, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._affinity[affinity_key]
+                return None
+            return printer_name
+
+    def _pin(self, affinity_key, printer_name):
+        with self._lock:
+            self._affinity.pop(affinity_key, None)
+            self._affinity[affinity_key] = (printer_name, time.monotonic() + self.affinity_ttl)
+            while len(self._affinity) > MAX_AFFINITY_ENTRIES:
+                self._affinity.popitem(last=False)
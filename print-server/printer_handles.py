@@ -0,0 +1,143 @@
+"""
+Pool of long-lived win32 printer handles, keyed by printer name.
+Handles are reused across jobs instead of calling OpenPrinter/ClosePrinter
+around every label. A handle is health-checked before reuse once it has been
+idle for a while, dropped after an error, and closed after an idle timeout.
+
+The win32print module is passed in, so the pool can be exercised on Linux
+with a fake module that provides OpenPrinter, ClosePrinter and GetPrinter.
+"""
+
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Seconds a handle may sit unused before it is closed
+DEFAULT_IDLE_TIMEOUT = 300
+
+# Seconds of idleness after which a handle is health-checked before reuse
+DEFAULT_HEALTH_CHECK_AFTER = 30
+
+
+class _PooledHandle:
+    __slots__ = ("handle", "last_used", "lock")
+
+    def __init__(self, handle):
+        self.handle = handle
+        self.last_used = time.monotonic()
+        self.lock = threading.Lock()
+
+
+class PrinterHandlePool:
+    """Reusable printer handles, one per printer name"""
+
+    def __init__(self, win32print, idle_timeout=DEFAULT_IDLE_TIMEOUT,
+                 health_check_after=DEFAULT_HEALTH_CHECK_AFTER):
+        self.win32print = win32print
+        self.idle_timeout = idle_timeout
+        self.health_check_after = health_check_after
+        self._handles = {}
+        self._lock = threading.Lock()
+        self._reaper = None
+        self._stop = threading.Event()
+
+    @contextmanager
+    def handle(self, printer_name):
+        """
+        Borrow the printer's handle for one job. Only one job uses a handle at
+        a time. If the job raises, the handle is closed so the next job reopens it.
+        """
+        entry = self._entry(printer_name)
+        with entry.lock:
+            if entry.handle is None:
+                entry.handle = self._open(printer_name)
+            elif time.monotonic() - entry.last_used > self.health_check_after and not self._healthy(entry.handle):
+                logger.info(f"Reopening stale printer handle for {printer_name}")
+                self._close(printer_name, entry.handle)
+                entry.handle = self._open(printer_name)
+
+            try:
+                yield entry.handle
+            except Exception:
+                # Don't trust a handle that just failed; reopen it next time
+                self._close(printer_name, entry.handle)
+                entry.handle = None
+                raise
+            finally:
+                entry.last_used = time.monotonic()
+
+    def close_idle(self):
+        """Close handles that have not been used within the idle timeout"""
+        now = time.monotonic()
+        with self._lock:
+            entries = list(self._handles.items())
+
+        for printer_name, entry in entries:
+            if entry.handle is None or now - entry.last_used < self.idle_timeout:
+                continue
+            # Skip handles that are busy with a job right now
+            if entry.lock.acquire(blocking=False):
+                try:
+                    if entry.handle is not None:
+                        logger.info(f"Closing idle printer handle for {printer_name}")
+                        self._close(printer_name, entry.handle)
+                        entry.handle = None
+                finally:
+                    entry.lock.release()
+
+    def close_all(self):
+        """Close every open handle and stop the idle reaper"""
+        self._stop.set()
+        with self._lock:
+            entries = list(self._handles.items())
+            self._handles = {}
+
+        for printer_name, entry in entries:
+            with entry.lock:
+                if entry.handle is not None:
+                    self._close(printer_name, entry.handle)
+                    entry.handle = None
+
+    def open_count(self):
+        """Number of handles currently open"""
+        with self._lock:
+            return sum(1 for entry in self._handles.values() if entry.handle is not None)
+
+    def _entry(self, printer_name):
+        with self._lock:
+            entry = self._handles.get(printer_name)
+            if entry is None:
+                entry = _PooledHandle(None)
+                self._handles[printer_name] = entry
+                self._start_reaper()
+            return entry
+
+    def _start_reaper(self):
+        # Caller must hold self._lock
+        if self._reaper is None and self.idle_timeout > 0:
+            self._reaper = threading.Thread(target=self._reap, name="printer-handle-reaper", daemon=True)
+            self._reaper.start()
+
+    def _reap(self):
+        while not self._stop.wait(max(self.idle_timeout / 2, 1)):
+            self.close_idle()
+
+    def _open(self, printer_name):
+        logger.info(f"Opening printer: {printer_name}")
+        return self.win32print.OpenPrinter(printer_name)
+
+    def _close(self, printer_name, handle):
+        try:
+            self.win32print.ClosePrinter(handle)
+        except Exception as e:
+            logger.error(f"Error closing printer handle for {printer_name}: {str(e)}")
+
+    def _healthy(self, handle):
+        try:
+            self.win32print.GetPrinter(handle, 2)
+            return True
+        except Exception:
+            return False
@@ -0,0 +1,184 @@
+"""
+Background printer health monitor.
+A Zebra that is paused, out of paper or has its head open still accepts jobs,
+so a print looks successful and the label never comes out. The monitor polls
+every printer's status on an interval (~HS host status over TCP, or the
+spooler's printer status) and caches the flags, so a print request can be
+failed or rerouted with a dict lookup instead of a status query.
+
+Settings (environment variables):
+  PRINTER_HEALTH_INTERVAL  seconds between polls, 0 to turn the monitor off (default 5)
+  PRINTER_HEALTH_TIMEOUT   seconds to wait for a printer's status (default 2)
+"""
+
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_INTERVAL = 5
+DEFAULT_TIMEOUT = 2
+MAX_POLL_THREADS = 4
+
+# Zebra host status query; the reply is three <STX>...<ETX> frames
+HOST_STATUS_COMMAND = b"~HS"
+HOST_STATUS_FRAMES = 3
+
+# Flags kept for each printer; any of these but buffer_full stops printing
+FLAGS = ("paper_out", "paused", "head_open", "buffer_full", "offline")
+NOT_READY_FLAGS = ("offline", "head_open", "paper_out", "paused")
+
+
+class PrinterNotReadyError(Exception):
+    """Raised when a job is sent to a printer the monitor has seen in an error state"""
+
+    def __init__(self, printer_name, reason):
+        super().__init__(f"Printer {printer_name} is not ready: {reason}")
+        self.printer_name = printer_name
+        self.reason = reason
+
+
+def parse_host_status(response):
+    """Read the status flags from a ~HS reply. Raises ValueError if it isn't one."""
+    if isinstance(response, bytes):
+        response = response.decode("ascii", errors="replace")
+    frames = [frame.split("\x03")[0].split(",") for frame in response.split("\x02")[1:]]
+    if len(frames) < 2 or len(frames[0]) < 6 or len(frames[1]) < 3:
+        raise ValueError(f"Invalid host status response: {response!r}")
+    try:
+        return {
+            "paper_out": frames[0][1] == "1",
+            "paused": frames[0][2] == "1",
+            "head_open": frames[1][2] == "1",
+            "buffer_full": frames[0][5] == "1",
+            "offline": False,
+            "formats_in_buffer": int(frames[0][4]),
+        }
+    except ValueError:
+        raise ValueError(f"Invalid host status response: {response!r}") from None
+
+
+def not_ready_reason(flags):
+    """The first flag that stops the printer, as text, or None if it can print"""
+    for flag in NOT_READY_FLAGS:
+        if flags.get(flag):
+            return flag.replace("_", " ")
+    return None
+
+
+class PrinterHealth:
+    """Cached printer status, refreshed from a background thread"""
+
+    def __init__(self, status_func, printers_func, interval=DEFAULT_INTERVAL):
+        # status_func(printer_name) returns a dict of FLAGS, None if the printer
+        # can't report its status, or raises if the printer can't be reached
+        self.status_func = status_func
+        self.printers_func = printers_func
+        self.interval = interval
+        # Readings older than this are ignored, e.g. after the monitor stalls
+        self.max_age = max(interval * 3, 1)
+        # Replaced per printer on each poll so readers never need a lock
+        self._health = {}
+        self._listeners = []
+        self._stop = threading.Event()
+        self._thread = None
+        self._executor = None
+
+    def add_listener(self, func):
+        """Call func(printer_name, health) whenever a printer's readiness changes"""
+        self._listeners.append(func)
+
+    def start(self):
+        """Poll all printers now and then every interval from a background thread"""
+        if self.interval <= 0 or self._thread is not None:
+            return
+        self._executor = ThreadPoolExecutor(max_workers=MAX_POLL_THREADS, thread_name_prefix="printer-health")
+        self._thread = threading.Thread(target=self._run, name="printer-health", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop polling"""
+        self._stop.set()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+
+    def poll(self):
+        """Check every printer once, in parallel so one unreachable printer doesn't hold up the rest"""
+        printers = self.printers_func()
+        if self._executor is None:
+            for printer_name in printers:
+                self.check(printer_name)
+        else:
+            list(self._executor.map(self.check, printers))
+
+    def check(self, printer_name):
+        """Query one printer's status now and cache it"""
+        try:
+            flags = self.status_func(printer_name)
+            if flags is None:
+                return None
+            health = dict(flags, error=None)
+        except Exception as e:
+            health = {flag: False for flag in FLAGS}
+            health.update(offline=True, error=str(e))
+
+        health["ready"] = not_ready_reason(health) is None
+        health["checked_at"] = time.time()
+        previous = self._health.get(printer_name)
+        self._health[printer_name] = health
+
+        if previous is None or previous["ready"] != health["ready"]:
+            if health["ready"]:
+                logger.info(f"Printer {printer_name} is ready")
+            else:
+                logger.warning(f"Printer {printer_name} is not ready: {not_ready_reason(health)}"
+                               + (f" ({health['error']})" if health["error"] else ""))
+            for listener in self._listeners:
+                try:
+                    listener(printer_name, health)
+                except Exception as e:
+                    logger.error(f"Printer health listener failed: {str(e)}")
+        return health
+
+    def get(self, printer_name):
+        """The last reading for a printer, or None if there is no recent one"""
+        health = self._health.get(printer_name)
+        if health is None or time.time() - health["checked_at"] > self.max_age:
+            return None
+        return health
+
+    def not_ready_reason(self, printer_name):
+        """Why the printer can't print right now, or None if it can (or its status is unknown)"""
+        health = self.get(printer_name)
+        return not_ready_reason(health) if health else None
+
+    def is_ready(self, printer_name):
+        return self.not_ready_reason(printer_name) is None
+
+    def ensure_ready(self, printer_name):
+        """Raise PrinterNotReadyError if the printer was last seen unable to print"""
+        reason = self.not_ready_reason(printer_name)
+        if reason:
+            raise PrinterNotReadyError(printer_name, reason)
+
+    def to_dict(self):
+        """Recent readings by printer name, for /printers"""
+        return {printer_name: self.get(printer_name) for printer_name in list(self._health)
+                if self.get(printer_name) is not None}
+
+    def summary(self):
+        """Ready and not-ready printer counts, for /status"""
+        readings = self.to_dict()
+        ready = sum(1 for health in readings.values() if health["ready"])
+        return {"ready": ready, "not_ready": len(readings) - ready}
+
+    def _run(self):
+        while True:
+            try:
+                self.poll()
+            except Exception as e:
+                logger.error(f"Error polling printer health: {str(e)}")
+            if self._stop.wait(self.interval):
+                return
@@ -0,0 +1,97 @@
+"""
+In-memory printer inventory for the Zebra print server.
+Printers are enumerated in the background on an interval (or on demand), so
+validating a printer name on the print path is a dict lookup instead of a
+wmic subprocess or a Win32 EnumPrinters call.
+"""
+
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Default seconds between background refreshes of the printer list
+DEFAULT_REFRESH_INTERVAL = 60
+
+# Minimum seconds between refreshes triggered by a lookup miss
+MISS_REFRESH_GAP = 5
+
+
+class PrinterRegistry:
+    """Cached printer list with O(1) name lookup and a cached default printer"""
+
+    def __init__(self, enumerate_func, refresh_interval=DEFAULT_REFRESH_INTERVAL):
+        # enumerate_func() returns (printer_names, default_printer) and raises on failure
+        self.enumerate_func = enumerate_func
+        self.refresh_interval = refresh_interval
+        self.refreshed_at = None
+        # Replaced as a whole on refresh so readers never need the lock
+        self._printers = {}
+        self._default = None
+        self._refresh_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        # Lookup cache hits and misses, for /metrics
+        self.hits = 0
+        self.misses = 0
+
+    def start(self):
+        """Load the printer list and keep it fresh from a background thread"""
+        self.refresh()
+        if self._thread is None and self.refresh_interval > 0:
+            self._thread = threading.Thread(target=self._run, name="printer-registry", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """Stop the background refresh thread"""
+        self._stop.set()
+
+    def refresh(self):
+        """Re-enumerate printers now. On failure the previous list is kept."""
+        with self._refresh_lock:
+            try:
+                names, default = self.enumerate_func()
+            except Exception as e:
+                logger.error(f"Error refreshing printer list: {str(e)}")
+                return False
+
+            self._printers = {name: index for index, name in enumerate(names)}
+            self._default = default if default in self._printers else None
+            self.refreshed_at = time.time()
+
+        logger.info(f"Printer list refreshed: {len(names)} printers, default: {self._default}")
+        return True
+
+    def printers(self):
+        """Printer names in enumeration order"""
+        return list(self._printers)
+
+    @property
+    def default(self):
+        return self._default
+
+    def __contains__(self, printer_name):
+        return printer_name in self._printers
+
+    def lookup(self, printer_name):
+        """
+        Check a printer name against the cache. A miss triggers one refresh
+        (at most every MISS_REFRESH_GAP seconds) to pick up newly added printers.
+        """
+        if printer_name in self._printers:
+            self.hits += 1
+            return True
+
+        self.misses += 1
+        if self.refreshed_at is None or time.time() - self.refreshed_at >= MISS_REFRESH_GAP:
+            self.refresh()
+        return printer_name in self._printers
+
+    def lookup_counts(self):
+        """{"hit": n, "miss": n} for lookups so far"""
+        return {"hit": self.hits, "miss": self.misses}
+
+    def _run(self):
+        while not self._stop.wait(self.refresh_interval):
+            self.refresh()
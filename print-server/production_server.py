@@ -0,0 +1,98 @@
+"""
+Production entry point for the Zebra print servers.
+The Flask app is served by waitress, a multi-threaded WSGI server that also
+runs on Windows, instead of the Werkzeug development server with its reloader
+and debugger.
+
+On Ctrl+C or SIGTERM the server stops taking requests, waits for the print
+queue to drain and then runs the shutdown hooks (closing printer connections,
+flushing the job journal). Requests being handled at that moment get a few
+seconds to finish, but their replies may not reach the client; sending the
+request again with the same Idempotency-Key won't print the label twice.
+
+Settings (environment variables):
+  SERVER_THREADS          request threads (default 8)
+  SERVER_BACKLOG          pending connection backlog (default 1024)
+  SERVER_CONNECTION_LIMIT most simultaneous connections (default 100)
+  MAX_REQUEST_SIZE        largest request body in bytes (default 10 MB)
+  SHUTDOWN_DRAIN_TIMEOUT  seconds to wait for queued jobs on shutdown (default 30)
+"""
+
+import logging
+import os
+import signal
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_THREADS = 8
+DEFAULT_BACKLOG = 1024
+DEFAULT_CONNECTION_LIMIT = 100
+DEFAULT_MAX_REQUEST_SIZE = 10 * 1024 * 1024
+DEFAULT_DRAIN_TIMEOUT = 30
+
+
+def _exit_on_signal(signum, frame):
+    # waitress stops its loop cleanly on SystemExit, just like on Ctrl+C
+    raise SystemExit(0)
+
+
+def server_threads():
+    """Request threads serve() will run, from SERVER_THREADS"""
+    return int(os.environ.get('SERVER_THREADS', DEFAULT_THREADS))
+
+
+def serve(app, print_queue, host="0.0.0.0", port=5000, on_shutdown=None):
+    """Serve app until interrupted, then drain print_queue and call on_shutdown()"""
+    try:
+        from waitress import create_server
+    except ImportError:
+        raise RuntimeError("waitress is not installed; run 'pip install waitress' or set DEBUG=1 "
+                           "to use the development server") from None
+
+    max_request_size = int(os.environ.get('MAX_REQUEST_SIZE', DEFAULT_MAX_REQUEST_SIZE))
+    drain_timeout = float(os.environ.get('SHUTDOWN_DRAIN_TIMEOUT', DEFAULT_DRAIN_TIMEOUT))
+
+    # Flask answers oversized bodies with 413 before they are parsed
+    app.config['MAX_CONTENT_LENGTH'] = max_request_size
+
+    server = create_server(
+        app,
+        host=host,
+        port=port,
+        threads=server_threads(),
+        backlog=int(os.environ.get('SERVER_BACKLOG', DEFAULT_BACKLOG)),
+        connection_limit=int(os.environ.get('SERVER_CONNECTION_LIMIT', DEFAULT_CONNECTION_LIMIT)),
+        max_request_body_size=max_request_size,
+        ident="Zebra Print Server"
+    )
+
+    signal.signal(signal.SIGTERM, _exit_on_signal)
+    if hasattr(signal, "SIGBREAK"):
+        # Ctrl+Break in a Windows console
+        signal.signal(signal.SIGBREAK, _exit_on_signal)
+
+    logger.info(f"Serving on http://{host}:{port} with {server.adj.threads} threads")
+    try:
+        # Returns once interrupted. waitress gives the request threads up to 5
+        # seconds to finish the request they are on and cancels requests still
+        # waiting for a thread; with its loop stopped, replies may not be sent.
+        server.run()
+    finally:
+        server.close()
+        shutdown(print_queue, drain_timeout, on_shutdown)
+
+
+def shutdown(print_queue, drain_timeout=DEFAULT_DRAIN_TIMEOUT, on_shutdown=None):
+    """Wait for queued print jobs to finish, then release resources"""
+    pending = print_queue.pending()
+    if pending:
+        logger.info(f"Shutting down, waiting for {pending} queued print job(s)")
+        if not print_queue.wait_idle(drain_timeout):
+            logger.warning(f"{print_queue.pending()} print job(s) still queued after {drain_timeout}s, exiting anyway")
+
+    if on_shutdown:
+        try:
+            on_shutdown()
+        except Exception as e:
+            logger.error(f"Error during shutdown: {str(e)}")
+    logger.info("Zebra Print Server stopped")
@@ -0,0 +1,188 @@
+"""
+Logging setup shared by the print servers.
+Request threads only put log records on a queue; a background thread formats
+them and writes them to the console and to a log file of JSON lines. The file
+is rotated by size and by age and the rotated files are gzipped, so disk I/O
+stays off the request path and the log can't fill the disk.
+
+Label ZPL is replaced with its length in everything logged at INFO and above,
+so patient details don't end up in the log file.
+
+Settings (environment variables):
+  LOG_FILE            log file, empty to log to the console only (default print_server.log)
+  LOG_LEVEL           lowest level logged (default INFO)
+  LOG_MAX_BYTES       rotate once the file reaches this size (default 10 MB)
+  LOG_ROTATE_HOURS    rotate at least this often, 0 for size only (default 24)
+  LOG_BACKUP_COUNT    rotated files kept (default 14)
+  LOG_QUEUE_SIZE      records held for the writer before new ones are dropped (default 10000)
+"""
+
+import atexit
+import gzip
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import re
+import shutil
+import sys
+import time
+from datetime import datetime, timezone
+
+DEFAULT_LOG_FILE = "print_server.log"
+DEFAULT_MAX_BYTES = 10 * 1024 * 1024
+DEFAULT_ROTATE_HOURS = 24
+DEFAULT_BACKUP_COUNT = 14
+DEFAULT_QUEUE_SIZE = 10000
+
+CONSOLE_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+_ZPL_RE = re.compile(r"\^XA.*?(?:\^XZ|$)", re.S)
+
+# LogRecord attributes that aren't extra fields passed with extra={...}
+_RECORD_FIELDS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+_listener = None
+
+
+class RedactZplFilter(logging.Filter):
+    """Replace ZPL in INFO and higher records with its length"""
+
+    def filter(self, record):
+        if record.levelno >= logging.INFO:
+            message = record.getMessage()
+            if "^XA" in message:
+                record.msg = _ZPL_RE.sub(lambda match: f"<ZPL {len(match.group(0))} bytes>", message)
+                record.args = None
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line, with any extra={...} fields included"""
+
+    def format(self, record):
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "thread": record.threadName,
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_FIELDS and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class RotatingGzipFileHandler(logging.handlers.RotatingFileHandler):
+    """
+    Rotates when the file reaches max_bytes or is older than rotate_seconds,
+    gzipping each rotated file (print_server.log.1.gz, .2.gz, ...)
+    """
+
+    def __init__(self, filename, max_bytes=DEFAULT_MAX_BYTES, rotate_seconds=DEFAULT_ROTATE_HOURS * 3600,
+                 backup_count=DEFAULT_BACKUP_COUNT):
+        super().__init__(filename, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8", delay=True)
+        self.rotate_seconds = rotate_seconds
+        self.rollover_at = self._next_rollover()
+
+    def shouldRollover(self, record):
+        if self.rotate_seconds and time.time() >= self.rollover_at:
+            return os.path.exists(self.baseFilename) and os.path.getsize(self.baseFilename) > 0
+        return super().shouldRollover(record)
+
+    def doRollover(self):
+        super().doRollover()
+        self.rollover_at = self._next_rollover()
+
+    def rotation_filename(self, default_name):
+        return default_name + ".gz"
+
+    def rotate(self, source, dest):
+        if not os.path.exists(source):
+            return
+        with open(source, "rb") as f_in, gzip.open(dest, "wb") as f_out:
+            shutil.copyfileobj(f_in, f_out)
+        os.remove(source)
+
+    def _next_rollover(self):
+        return time.time() + self.rotate_seconds if self.rotate_seconds else float("inf")
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """Queue handler that drops records instead of blocking when the writer falls behind"""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # Merge the arguments now; the record may hold objects that change later
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def configure_logging():
+    """Route all logging through a queue to console and rotating file handlers on a background thread"""
+    global _listener
+    if _listener is not None:
+        return _listener
+
+    level = getattr(logging, os.environ.get('LOG_LEVEL', 'INFO').upper(), logging.INFO)
+    redact = RedactZplFilter()
+
+    console = logging.StreamHandler(sys.stderr)
+    console.setFormatter(logging.Formatter(CONSOLE_FORMAT))
+    console.addFilter(redact)
+    handlers = [console]
+
+    log_file = os.environ.get('LOG_FILE', DEFAULT_LOG_FILE)
+    if log_file:
+        file_handler = RotatingGzipFileHandler(
+            log_file,
+            max_bytes=int(os.environ.get('LOG_MAX_BYTES', DEFAULT_MAX_BYTES)),
+            rotate_seconds=float(os.environ.get('LOG_ROTATE_HOURS', DEFAULT_ROTATE_HOURS)) * 3600,
+            backup_count=int(os.environ.get('LOG_BACKUP_COUNT', DEFAULT_BACKUP_COUNT))
+        )
+        file_handler.setFormatter(JsonFormatter())
+        file_handler.addFilter(redact)
+        handlers.append(file_handler)
+
+    log_queue = queue.Queue(int(os.environ.get('LOG_QUEUE_SIZE', DEFAULT_QUEUE_SIZE)))
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(DroppingQueueHandler(log_queue))
+    root.setLevel(level)
+
+    _listener = logging.handlers.QueueListener(log_queue, *handlers)
+    _listener.start()
+    # Write out whatever is still queued when the process exits
+    atexit.register(stop_logging)
+    return _listener
+
+
+def stop_logging():
+    """Flush queued records and stop the writer thread"""
+    global _listener
+    if _listener is None:
+        return
+    listener, _listener = _listener, None
+    listener.stop()
+    for handler in listener.handlers:
+        handler.close()
@@ -0,0 +1,329 @@
+"""
+Simulated Zebra printer for development and load testing on Linux.
+Stands in for a GK420d: label formats are timed from their ^LL length (and
+^PR speed), ^PQ copies and the gap between labels, data goes through a finite
+receive buffer that pushes back on the sender when it fills, and paper-out,
+head-open and paused states can be injected to exercise the error paths.
+
+The print servers use it instead of a real printer on non-Windows platforms.
+It can also listen on a TCP port like a network printer, answering ~HS host
+status queries, so the raw TCP backend can be tested end to end:
+
+  python simulated_printer.py --port 9100 --speed 5 --inject paper_out@50+10
+  NETWORK_PRINTERS="Sim=127.0.0.1:9100" python print_server.py
+
+Settings for the built-in printers (environment variables):
+  SIMULATED_PRINTER_SPEED   print speed in inches per second (default 5)
+  SIMULATED_PRINTER_BUFFER  receive buffer in bytes (default 16384)
+  SIMULATED_TIME_SCALE      multiply all delays, e.g. 0 for instant printing (default 1)
+"""
+
+import argparse
+import logging
+import os
+import re
+import socket
+import threading
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+# GK420d defaults
+DEFAULT_DPI = 203
+DEFAULT_SPEED = 5.0
+DEFAULT_LABEL_LENGTH = 406
+DEFAULT_BUFFER_SIZE = 16 * 1024
+DEFAULT_WRITE_TIMEOUT = 30
+
+# Inches fed between labels (gap plus backfeed)
+GAP_INCHES = 0.12
+
+# ^PR speed letters and their inches per second
+PRINT_SPEEDS = {"A": 2, "B": 3, "C": 4, "D": 6, "E": 8}
+
+# Printer states that can be injected
+PAPER_OUT = "paper_out"
+HEAD_OPEN = "head_open"
+PAUSED = "paused"
+STATES = (PAPER_OUT, HEAD_OPEN, PAUSED)
+
+_FORMAT_RE = re.compile(rb"\^XA(.*?)\^XZ", re.S)
+_LENGTH_RE = re.compile(rb"\^LL(\d+)")
+_WIDTH_RE = re.compile(rb"\^PW(\d+)")
+_COPIES_RE = re.compile(rb"\^PQ(\d+)")
+_SPEED_RE = re.compile(rb"\^PR([A-E]|\d+)")
+
+
+class SimulatedPrinterError(Exception):
+    """Raised when the simulated printer can't take a job (paper out, head open)"""
+
+
+class _Label:
+    __slots__ = ("size", "seconds", "copies")
+
+    def __init__(self, size, seconds, copies):
+        self.size = size
+        self.seconds = seconds
+        self.copies = copies
+
+
+class SimulatedPrinter:
+    """One simulated printer with a receive buffer drained by a print thread"""
+
+    def __init__(self, name, speed=DEFAULT_SPEED, buffer_size=DEFAULT_BUFFER_SIZE, dpi=DEFAULT_DPI,
+                 time_scale=1.0, write_timeout=DEFAULT_WRITE_TIMEOUT):
+        self.name = name
+        self.speed = speed
+        self.buffer_size = buffer_size
+        self.dpi = dpi
+        self.time_scale = time_scale
+        self.write_timeout = write_timeout
+        # Settings persist between formats like on the real printer
+        self.label_length = DEFAULT_LABEL_LENGTH
+        self.print_width = None
+        self.states = set()
+        self.labels_printed = 0
+        self.bytes_received = 0
+        self._buffered = 0
+        self._labels = deque()
+        # Labels still to print before each injected state kicks in
+        self._scheduled = []
+        self._changed = threading.Condition()
+        self._thread = threading.Thread(target=self._print_loop, name=f"simulated-printer-{name}", daemon=True)
+        self._thread.start()
+
+    def send(self, data):
+        """
+        Feed ZPL bytes to the printer. Blocks while the receive buffer is full
+        and raises SimulatedPrinterError if the printer is out of paper or its
+        head is open, or TimeoutError if the buffer stays full too long.
+        """
+        labels = self._parse(data)
+        deadline = time.monotonic() + self.write_timeout
+        with self._changed:
+            for label in labels:
+                self._check_ready()
+                # A single label larger than the buffer is let in once the buffer is empty
+                while self._buffered and self._buffered + label.size > self.buffer_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise TimeoutError(f"{self.name}: receive buffer full")
+                    self._changed.wait(remaining)
+                    self._check_ready()
+                self._buffered += label.size
+                self.bytes_received += label.size
+                self._labels.append(label)
+                self._changed.notify_all()
+        return len(data)
+
+    def set_state(self, state, active=True):
+        """Turn paper_out, head_open or paused on or off"""
+        if state not in STATES:
+            raise ValueError(f"Unknown printer state '{state}'")
+        with self._changed:
+            if active:
+                self.states.add(state)
+            else:
+                self.states.discard(state)
+            self._changed.notify_all()
+        logger.info(f"Simulated printer {self.name}: {state} {'on' if active else 'off'}")
+
+    def inject(self, state, after_labels=0, duration=None):
+        """Turn a state on after another after_labels labels, and off again after duration seconds"""
+        if state not in STATES:
+            raise ValueError(f"Unknown printer state '{state}'")
+        with self._changed:
+            self._scheduled.append([self.labels_printed + after_labels, state, duration])
+        if after_labels <= 0:
+            self._apply_scheduled()
+
+    def wait_idle(self, timeout=None):
+        """Block until everything received has printed. Returns False on timeout."""
+        with self._changed:
+            return self._changed.wait_for(lambda: not self._labels, timeout)
+
+    def status(self):
+        """Current state, for /printers and tests"""
+        with self._changed:
+            return {
+                "states": sorted(self.states),
+                "buffered_bytes": self._buffered,
+                "buffered_formats": len(self._labels),
+                "buffer_full": self._buffered >= self.buffer_size,
+                "labels_printed": self.labels_printed,
+                "bytes_received": self.bytes_received,
+            }
+
+    def host_status(self):
+        """The printer's reply to ~HS, in the Zebra host status format"""
+        with self._changed:
+            paper_out = int(PAPER_OUT in self.states)
+            paused = int(PAUSED in self.states or bool(self.states - {PAUSED}))
+            head_open = int(HEAD_OPEN in self.states)
+            buffer_full = int(self._buffered >= self.buffer_size)
+            formats = len(self._labels)
+            remaining = sum(label.copies for label in self._labels)
+        return (
+            f"\x02030,{paper_out},{paused},{self.label_length:04d},{min(formats, 999):03d},{buffer_full},0,0,000,0,0,0\x03\r\n"
+            f"\x02001,0,{head_open},0,0,2,4,0,{min(remaining, 99999999):08d},1,000\x03\r\n"
+            f"\x021234,0\x03\r\n"
+        )
+
+    def _check_ready(self):
+        # Caller must hold self._changed
+        if PAPER_OUT in self.states:
+            raise SimulatedPrinterError(f"{self.name}: paper out")
+        if HEAD_OPEN in self.states:
+            raise SimulatedPrinterError(f"{self.name}: head open")
+
+    def _parse(self, data):
+        """Split ZPL into label formats with their print time and copies"""
+        labels = []
+        position = 0
+        for match in _FORMAT_RE.finditer(data):
+            body = match.group(1)
+            length = _LENGTH_RE.search(body)
+            if length:
+                self.label_length = int(length.group(1))
+            width = _WIDTH_RE.search(body)
+            if width:
+                self.print_width = int(width.group(1))
+            speed = _SPEED_RE.search(body)
+            if speed:
+                value = speed.group(1).decode()
+                self.speed = PRINT_SPEEDS.get(value) or float(value)
+
+            # Stored-format downloads go to memory instead of onto paper
+            if b"^DF" in body:
+                seconds, copies = 0.0, 0
+            else:
+                copies_match = _COPIES_RE.search(body)
+                copies = max(int(copies_match.group(1)), 1) if copies_match else 1
+                seconds = copies * (self.label_length / self.dpi + GAP_INCHES) / self.speed
+            labels.append(_Label(match.end() - position, seconds, copies))
+            position = match.end()
+
+        if position < len(data):
+            # Commands outside a format (or a partial one) still take buffer space
+            labels.append(_Label(len(data) - position, 0.0, 0))
+        return labels
+
+    def _print_loop(self):
+        while True:
+            with self._changed:
+                self._changed.wait_for(lambda: self._labels and not self.states)
+                label = self._labels[0]
+            if label.seconds and self.time_scale:
+                time.sleep(label.seconds * self.time_scale)
+            with self._changed:
+                self._labels.popleft()
+                self._buffered -= label.size
+                self.labels_printed += label.copies
+                self._changed.notify_all()
+            if self._scheduled:
+                self._apply_scheduled()
+
+    def _apply_scheduled(self):
+        with self._changed:
+            due = [entry for entry in self._scheduled if entry[0] <= self.labels_printed]
+            self._scheduled = [entry for entry in self._scheduled if entry[0] > self.labels_printed]
+        for _, state, duration in due:
+            self.set_state(state)
+            if duration:
+                timer = threading.Timer(duration, self.set_state, args=(state, False))
+                timer.daemon = True
+                timer.start()
+
+
+class SimulatedPrinters:
+    """Simulated printers by name, created on first use with shared settings"""
+
+    def __init__(self, **settings):
+        self.settings = settings
+        self._printers = {}
+        self._lock = threading.Lock()
+
+    def get(self, printer_name):
+        with self._lock:
+            printer = self._printers.get(printer_name)
+            if printer is None:
+                printer = self._printers[printer_name] = SimulatedPrinter(printer_name, **self.settings)
+            return printer
+
+    def send(self, printer_name, data):
+        return self.get(printer_name).send(data)
+
+
+def serve_tcp(printer, host="127.0.0.1", port=9100):
+    """Accept raw TCP connections for a simulated printer, like port 9100 on a real one"""
+    server = socket.create_server((host, port))
+    logger.info(f"Simulated printer {printer.name} listening on {host}:{port}")
+
+    def handle(connection):
+        pending = b""
+        with connection:
+            while True:
+                try:
+                    chunk = connection.recv(65536)
+                except OSError:
+                    return
+                if not chunk:
+                    return
+                pending += chunk
+                # ~HS is answered straight away, wherever it appears in the stream
+                while b"~HS" in pending:
+                    pending = pending.replace(b"~HS", b"", 1)
+                    connection.sendall(printer.host_status().encode("ascii"))
+                # Only complete formats go to the printer
+                end = pending.rfind(b"^XZ")
+                if end != -1:
+                    try:
+                        printer.send(pending[:end + 3])
+                    except (SimulatedPrinterError, TimeoutError) as e:
+                        # A real printer would just stop reading; dropping the link surfaces the error
+                        logger.error(str(e))
+                        return
+                    pending = pending[end + 3:]
+
+    while True:
+        connection, _ = server.accept()
+        threading.Thread(target=handle, args=(connection,), daemon=True).start()
+
+
+def parse_injection(spec):
+    """Parse STATE[@LABELS][+SECONDS], e.g. paper_out@50+10"""
+    match = re.fullmatch(r"(\w+)(?:@(\d+))?(?:\+(\d+(?:\.\d+)?))?", spec)
+    if not match or match.group(1) not in STATES:
+        raise ValueError(f"Invalid injection '{spec}', expected STATE[@LABELS][+SECONDS] with STATE one of {', '.join(STATES)}")
+    return match.group(1), int(match.group(2) or 0), float(match.group(3)) if match.group(3) else None
+
+
+# Printers used by the servers when there is no real spooler
+simulated_printers = SimulatedPrinters(
+    speed=float(os.environ.get('SIMULATED_PRINTER_SPEED', DEFAULT_SPEED)),
+    buffer_size=int(os.environ.get('SIMULATED_PRINTER_BUFFER', DEFAULT_BUFFER_SIZE)),
+    time_scale=float(os.environ.get('SIMULATED_TIME_SCALE', 1.0))
+)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a simulated Zebra printer on a TCP port")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--name", default="Simulated GK420d")
+    parser.add_argument("--speed", type=float, default=DEFAULT_SPEED, help="inches per second (default 5)")
+    parser.add_argument("--buffer", type=int, default=DEFAULT_BUFFER_SIZE, help="receive buffer in bytes")
+    parser.add_argument("--time-scale", type=float, default=1.0, help="multiply all delays (0 prints instantly)")
+    parser.add_argument("--inject", action="append", default=[], metavar="STATE[@LABELS][+SECONDS]",
+                        help="turn on paper_out, head_open or paused after LABELS labels for SECONDS seconds")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    simulated = SimulatedPrinter(args.name, speed=args.speed, buffer_size=args.buffer, time_scale=args.time_scale)
+    for spec in args.inject:
+        simulated.inject(*parse_injection(spec))
+    try:
+        serve_tcp(simulated, args.host, args.port)
+    except KeyboardInterrupt:
+        pass
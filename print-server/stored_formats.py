@@ -0,0 +1,237 @@
+"""
+Stored-format (^DF/^XF) support for prescription labels.
+The fixed parts of the prescription label (border, fonts, pharmacy details)
+are downloaded to printer memory once with ^DF. Each job then sends a short
+^XF recall with only its ^FN field values.
+
+Formats live in printer RAM (R:), so they are gone after a power cycle. The
+tracker re-downloads a format after a spool failure, after the health monitor
+sees the printer go offline or become ready again (either may mean it was
+restarted), and after STORED_FORMAT_MAX_AGE seconds as a safety net. A printer
+the health monitor has no reading for could restart unnoticed, so its formats
+are downloaded again after the much shorter STORED_FORMAT_UNMONITORED_MAX_AGE.
+"""
+
+import logging
+import os
+import threading
+import time
+from zpl_utils import encode_zpl, escape_field_data
+
+logger = logging.getLogger(__name__)
+
+# Bump when the layout below changes so printers pick up the new version
+FORMAT_VERSION = 1
+
+# Seconds before a stored format is downloaded again even if nothing failed
+DEFAULT_MAX_AGE = 3600
+
+# The same for printers whose status can't be read, e.g. copy /b without pywin32
+DEFAULT_UNMONITORED_MAX_AGE = 300
+
+# Static pharmacy lines, matching templates/prescription.zpl
+PHARMACY_LINES = (
+    ("^ADN,26,13", 20, "Personal Care Pharmacy Ltd"),
+    ("^ADN,26,13", 45, "72 Aranguez Main Rd, San Juan"),
+    ("^ADN,26,13", 70, "Tel: 638-2889  Whatsapp: 352-2676"),
+    ("^ADN,28,14", 100, "Pharmacist: _______________________"),
+)
+
+# ^FN numbers for the variable fields of the prescription label
+FIELD_NUMBERS = {
+    "patient_name": 1,
+    "date": 2,
+    "rx_number": 3,
+    "doctor_name": 4,
+    "medication_name": 5,
+    "sig_line1": 6,
+    "sig_line2": 7,
+    "quantity": 8,
+    "refills": 9,
+}
+
+
+def _prescription_layout(format_path, two_line_sig):
+    """Build the ^DF download for one prescription label variant"""
+    # Same positions as templates/prescription.zpl: a second SIG line pushes the rest down
+    qty_y = 220 if two_line_sig else 185
+    refills_y = 250 if two_line_sig else 215
+    divider_y = 270 if two_line_sig else 235
+
+    lines = [
+        "^XA",
+        f"^DF{format_path}^FS",
+        "^PW609",
+        "^LL406",
+        "^LS0",
+        "^LH0,0",
+        "^FO10,20^GB589,380,2^FS",
+        "^ADN,30,15",
+        "^FO20,40^FN1^FS",
+        "^ADN,24,12",
+        "^FO400,45^FN2^FS",
+        "^ADN,26,13",
+        "^FO20,70^FN3^FS",
+        "^ADN,26,13",
+        "^FO300,70^FN4^FS",
+        "^FO20,90^GB569,1,2^FS",
+        "^ACN,36,20",
+        "^FO20,105^FN5^FS",
+        "^ADN,32,16",
+        "^FO20,150^FN6^FS",
+    ]
+    if two_line_sig:
+        lines += ["^ADN,32,16", "^FO20,185^FN7^FS"]
+    lines += [
+        "^ADN,26,13",
+        f"^FO20,{qty_y}^FN8^FS",
+        "^ADN,26,13",
+        f"^FO20,{refills_y}^FN9^FS",
+        f"^FO20,{divider_y}^GB569,1,1^FS",
+    ]
+    for font, offset, text in PHARMACY_LINES:
+        lines += [font, f"^FO20,{divider_y + offset}^FD{text}^FS"]
+    lines.append("^XZ")
+    return "\n".join(lines)
+
+
+class StoredFormat:
+    """A label layout that can be downloaded to and recalled from printer memory"""
+
+    def __init__(self, name, path, layout, version=FORMAT_VERSION):
+        self.name = name
+        self.path = path
+        self.version = version
+        # Encoded once; prepended to the first job that needs it on a printer
+        self.download = encode_zpl(layout + "\n")
+
+    def recall(self, field_values):
+        """Build the ^XF recall for one label from {fn_number: text}"""
+        parts = ["^XA", f"^XF{self.path}^FS"]
+        for number, text in sorted(field_values.items()):
+            text = "" if text is None else str(text)
+            escaped = escape_field_data(text)
+            # ^FH is only needed when the value had characters to escape
+            field_hex = "^FH" if escaped != text else ""
+            parts.append(f"^FN{number}{field_hex}^FD{escaped}^FS")
+        parts.append("^XZ")
+        return "".join(parts)
+
+
+# One stored format per SIG layout, chosen per label
+FORMATS = {
+    fmt.name: fmt for fmt in (
+        StoredFormat("prescription", "R:RXLBL1.ZPL", _prescription_layout("R:RXLBL1.ZPL", False)),
+        StoredFormat("prescription_two_line", "R:RXLBL2.ZPL", _prescription_layout("R:RXLBL2.ZPL", True)),
+    )
+}
+
+
+def build_prescription_recall(fields):
+    """
+    Turn prescription field values into an ^XF recall.
+    Returns (zpl, format_name). Raises ValueError if required fields are missing.
+    """
+    if not isinstance(fields, dict):
+        raise ValueError("'fields' must be an object")
+
+    missing = [name for name in ("patient_name", "medication_name", "sig_line1") if not fields.get(name)]
+    if missing:
+        raise ValueError(f"Missing label fields: {', '.join(missing)}")
+
+    fmt = FORMATS["prescription_two_line" if fields.get("sig_line2") else "prescription"]
+
+    # Static prefixes stay with the values so the layout matches the full template exactly
+    values = {
+        FIELD_NUMBERS["patient_name"]: fields["patient_name"],
+        FIELD_NUMBERS["date"]: f"DATE: {fields.get('date', '')}",
+        FIELD_NUMBERS["rx_number"]: f"Rx: {fields.get('rx_number', '')}",
+        FIELD_NUMBERS["doctor_name"]: f"Dr. {str(fields.get('doctor_name') or '').upper()}",
+        FIELD_NUMBERS["medication_name"]: fields["medication_name"],
+        FIELD_NUMBERS["sig_line1"]: fields["sig_line1"],
+        FIELD_NUMBERS["quantity"]: f"QTY: {fields.get('quantity', '')} {fields.get('unit', '')}",
+        FIELD_NUMBERS["refills"]: fields.get("refills", ""),
+    }
+    if fields.get("sig_line2"):
+        values[FIELD_NUMBERS["sig_line2"]] = fields["sig_line2"]
+
+    return fmt.recall(values), fmt.name
+
+
+class StoredFormatTracker:
+    """Remembers which printers hold which format versions"""
+
+    def __init__(self, max_age=DEFAULT_MAX_AGE, unmonitored_max_age=DEFAULT_UNMONITORED_MAX_AGE):
+        self.max_age = max_age
+        self.unmonitored_max_age = unmonitored_max_age
+        # {printer_name: {format_name: (version, loaded_at)}}
+        self._loaded = {}
+        self._health = None
+        self._lock = threading.Lock()
+
+    def follow(self, printer_health):
+        """Watch a PrinterHealth monitor for printers that may have restarted"""
+        self._health = printer_health
+        printer_health.add_listener(self.record_health)
+
+    def prepare(self, printer_name, job, data):
+        """Prepend any format downloads the printer still needs to a job's bytes"""
+        downloads = [fmt.download for fmt in self._missing(printer_name, job.get("formats"))]
+        if not downloads:
+            return data
+        logger.info(f"Downloading {len(downloads)} stored format(s) to {printer_name}")
+        return b"".join(downloads) + bytes(data)
+
+    def confirm(self, printer_name, job):
+        """Record that a job's formats are now in the printer's memory"""
+        names = job.get("formats")
+        if not names:
+            return
+        now = time.time()
+        with self._lock:
+            loaded = self._loaded.setdefault(printer_name, {})
+            for name in names:
+                if name in FORMATS:
+                    loaded[name] = (FORMATS[name].version, now)
+
+    def invalidate(self, printer_name):
+        """Forget a printer's formats, e.g. after an error or a restart"""
+        with self._lock:
+            if self._loaded.pop(printer_name, None):
+                logger.info(f"Stored formats on {printer_name} will be downloaded again")
+
+    def record_health(self, printer_name, health):
+        """printer_health listener: forget the formats of a printer that went offline or became ready again"""
+        if health["ready"] or health.get("offline"):
+            self.invalidate(printer_name)
+
+    def loaded_formats(self, printer_name):
+        """Names and versions of the formats a printer is known to hold"""
+        with self._lock:
+            return {name: version for name, (version, _) in self._loaded.get(printer_name, {}).items()}
+
+    def _missing(self, printer_name, names):
+        if not names:
+            return []
+        now = time.time()
+        # Without a status reading a restart would go unseen
+        monitored = self._health is not None and self._health.get(printer_name) is not None
+        max_age = self.max_age if monitored else self.unmonitored_max_age
+        with self._lock:
+            loaded = self._loaded.get(printer_name, {})
+            missing = []
+            for name in names:
+                fmt = FORMATS.get(name)
+                if fmt is None:
+                    continue
+                version, loaded_at = loaded.get(name, (None, 0))
+                if version != fmt.version or now - loaded_at > max_age:
+                    missing.append(fmt)
+            return missing
+
+
+# Shared tracker for the print servers
+stored_formats = StoredFormatTracker(
+    max_age=int(os.environ.get('STORED_FORMAT_MAX_AGE', DEFAULT_MAX_AGE)),
+    unmonitored_max_age=int(os.environ.get('STORED_FORMAT_UNMONITORED_MAX_AGE', DEFAULT_UNMONITORED_MAX_AGE))
+)
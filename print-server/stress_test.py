@@ -0,0 +1,99 @@
+"""
+Stress test for the Zebra print server job store.
+Fires hundreds of concurrent /print requests and checks that every job gets a
+unique id and that the job history stays consistent.
+
+Usage:
+  python stress_test.py [server_url] [requests] [threads]
+  python stress_test.py --in-process [requests] [threads]
+
+--in-process loads print_server.py and drives it through Flask's test client,
+so no server (or printer) needs to be running.
+"""
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+TEST_ZPL = "^XA^FO50,50^ADN,36,20^FDStress Test^FS^XZ"
+
+
+def run_stress_test(post, get, total_requests=500, threads=50):
+    """Send concurrent print requests and verify job ids. Returns True on success."""
+    print(f"Sending {total_requests} print requests from {threads} threads...")
+
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        responses = list(pool.map(lambda i: post("/print", {"zpl": TEST_ZPL}), range(total_requests)))
+
+    failures = [status for status, _ in responses if status not in (200, 202)]
+    if failures:
+        print(f"❌ {len(failures)} request(s) failed, e.g. status {failures[0]}")
+        return False
+
+    job_ids = [body.get("job_id") for _, body in responses]
+    duplicates = len(job_ids) - len(set(job_ids))
+    if duplicates:
+        print(f"❌ {duplicates} duplicate job id(s) handed out")
+        return False
+    print(f"✅ {len(job_ids)} unique job ids")
+
+    # The history must not contain duplicates either, and the newest job must be findable
+    status, jobs_data = get("/jobs")
+    history_ids = [job["id"] for job in jobs_data.get("jobs", [])]
+    if status != 200 or len(history_ids) != len(set(history_ids)):
+        print("❌ Job history is inconsistent")
+        return False
+
+    status, _ = get(f"/job/{history_ids[-1]}")
+    if status != 200:
+        print(f"❌ Newest job {history_ids[-1]} could not be looked up")
+        return False
+
+    print(f"✅ Job history holds {len(history_ids)} unique jobs")
+    return True
+
+
+def http_client(server_url):
+    import requests
+
+    def post(path, payload):
+        response = requests.post(f"{server_url}{path}", json=payload, timeout=30)
+        return response.status_code, response.json()
+
+    def get(path):
+        response = requests.get(f"{server_url}{path}", timeout=30)
+        return response.status_code, response.json()
+
+    return post, get
+
+
+def in_process_client():
+    import print_server
+
+    def post(path, payload):
+        response = print_server.app.test_client().post(path, json=payload)
+        return response.status_code, response.get_json()
+
+    def get(path):
+        response = print_server.app.test_client().get(path)
+        return response.status_code, response.get_json()
+
+    return post, get
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+
+    if args and args[0] == "--in-process":
+        post, get = in_process_client()
+        args = args[1:]
+    else:
+        # Default URL
+        server_url = "http://localhost:5000"
+        if args:
+            server_url = args[0]
+            args = args[1:]
+        post, get = http_client(server_url)
+
+    total_requests = int(args[0]) if len(args) > 0 else 500
+    threads = int(args[1]) if len(args) > 1 else 50
+
+    sys.exit(0 if run_stress_test(post, get, total_requests, threads) else 1)
@@ -0,0 +1,453 @@
+"""
+Raw TCP (port 9100) printing for networked Zebra printers.
+ZPL is streamed straight to the printer over persistent connections, one per
+printer, so network printers skip the Windows spooler entirely and the server
+can drive them from any platform.
+
+Network printers are named in the NETWORK_PRINTERS environment variable and
+then picked through the usual "printer" field, e.g.
+
+  NETWORK_PRINTERS="Counter Zebra=192.168.1.50:9100;Back Office=192.168.1.51"
+
+With ALLOW_TCP_URIS=1 a printer field of the form tcp://host[:port] is also
+sent over TCP, which makes it easy to point the server at a local socket
+stand-in while testing. It is off by default, since it lets any client make
+the server connect to any host and port.
+"""
+
+import asyncio
+import logging
+import os
+import select
+import socket
+import threading
+import time
+from circuit_breaker import WriteInterruptedError
+from print_metrics import print_metrics
+
+logger = logging.getLogger(__name__)
+
+# Raw printing port used by Zebra printers
+DEFAULT_PORT = 9100
+
+# Seconds allowed for connecting and for writing one job
+DEFAULT_CONNECT_TIMEOUT = 5
+DEFAULT_WRITE_TIMEOUT = 30
+
+# Seconds a connection may sit unused before it is closed
+DEFAULT_IDLE_TIMEOUT = 300
+
+# Seconds of silence before TCP keepalive probes start
+DEFAULT_KEEPALIVE_IDLE = 30
+
+URI_PREFIX = "tcp://"
+
+
+def parse_address(value):
+    """Split "host[:port]" into (host, port)"""
+    host, _, port = value.strip().rpartition(":")
+    if not host:
+        return value.strip(), DEFAULT_PORT
+    try:
+        return host, int(port)
+    except ValueError:
+        raise ValueError(f"Invalid printer address '{value}'") from None
+
+
+def enable_keepalive(sock, idle=DEFAULT_KEEPALIVE_IDLE):
+    """Turn on TCP keepalive so a printer that vanished is noticed on an idle connection"""
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+    if hasattr(socket, "TCP_KEEPIDLE"):
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, idle)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPINTVL, 10)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPCNT, 3)
+    elif hasattr(sock, "ioctl") and hasattr(socket, "SIO_KEEPALIVE_VALS"):
+        # Windows takes (on, idle ms, interval ms)
+        sock.ioctl(socket.SIO_KEEPALIVE_VALS, (1, idle * 1000, 10000))
+
+
+class NetworkPrinters:
+    """Printer names that are reached over raw TCP instead of the spooler"""
+
+    def __init__(self, addresses=None, allow_uris=False):
+        # {printer_name: (host, port)}
+        self._addresses = dict(addresses or {})
+        # Whether a tcp://host:port printer name reaches any address
+        self.allow_uris = allow_uris
+
+    @classmethod
+    def from_spec(cls, spec, allow_uris=False):
+        """Parse "Name=host[:port];Other=host[:port]" as used in NETWORK_PRINTERS"""
+        addresses = {}
+        for entry in (spec or "").split(";"):
+            if not entry.strip():
+                continue
+            name, separator, address = entry.partition("=")
+            if not separator or not name.strip() or not address.strip():
+                raise ValueError(f"Invalid network printer entry '{entry}', expected Name=host[:port]")
+            addresses[name.strip()] = parse_address(address)
+        return cls(addresses, allow_uris)
+
+    def names(self):
+        """Configured network printer names"""
+        return list(self._addresses)
+
+    def address(self, printer_name):
+        """
+        (host, port) for a network printer, or for a tcp:// name if those are
+        allowed; None for spooler printers
+        """
+        if not printer_name:
+            return None
+        if printer_name in self._addresses:
+            return self._addresses[printer_name]
+        if self.allow_uris and printer_name.startswith(URI_PREFIX):
+            try:
+                return parse_address(printer_name[len(URI_PREFIX):])
+            except ValueError:
+                return None
+        return None
+
+    def extend(self, enumerate_func):
+        """Wrap a PrinterRegistry enumerate function so the network printers are listed too"""
+        def enumerate_with_network():
+            printers, default = enumerate_func()
+            return list(printers) + [name for name in self._addresses if name not in printers], default
+        return enumerate_with_network
+
+
+class _PooledConnection:
+    __slots__ = ("sock", "last_used", "lock")
+
+    def __init__(self):
+        self.sock = None
+        self.last_used = time.monotonic()
+        self.lock = threading.Lock()
+
+
+class TcpConnectionPool:
+    """Persistent raw TCP connections, one per printer address"""
+
+    def __init__(self, connect_timeout=DEFAULT_CONNECT_TIMEOUT, write_timeout=DEFAULT_WRITE_TIMEOUT,
+                 idle_timeout=DEFAULT_IDLE_TIMEOUT, keepalive_idle=DEFAULT_KEEPALIVE_IDLE):
+        self.connect_timeout = connect_timeout
+        self.write_timeout = write_timeout
+        self.idle_timeout = idle_timeout
+        self.keepalive_idle = keepalive_idle
+        self._connections = {}
+        self._lock = threading.Lock()
+        self._reaper = None
+        self._stop = threading.Event()
+
+    def send(self, address, data):
+        """
+        Write one job's bytes to the printer at address. Only one job uses a
+        connection at a time. A pooled connection the printer has dropped is
+        replaced before writing; once writing has started a failure raises
+        WriteInterruptedError rather than sending again, since part of the
+        job may have printed.
+        """
+        entry = self._entry(address)
+        with entry.lock:
+            if entry.sock is not None and not self._alive(entry.sock):
+                # The printer closed the connection since the last job
+                logger.info(f"Reconnecting to printer at {address[0]}:{address[1]}")
+                self._close(address, entry)
+            if entry.sock is None:
+                entry.sock = self._open(address)
+
+            try:
+                entry.sock.sendall(data)
+            except OSError as e:
+                self._close(address, entry)
+                raise WriteInterruptedError(e) from e
+            finally:
+                entry.last_used = time.monotonic()
+        return len(data)
+
+    def query(self, address, command, frames, timeout=DEFAULT_CONNECT_TIMEOUT):
+        """
+        Send a status command such as ~HS over the printer's connection and
+        read back its reply of `frames` <STX>...<ETX> frames. Returns None
+        without waiting long if a job is using the connection.
+        """
+        entry = self._entry(address)
+        if not entry.lock.acquire(timeout=timeout):
+            return None
+        try:
+            if entry.sock is not None and not self._alive(entry.sock):
+                self._close(address, entry)
+            if entry.sock is None:
+                entry.sock = self._open(address)
+
+            try:
+                entry.sock.settimeout(timeout)
+                entry.sock.sendall(command)
+                response = b""
+                while response.count(b"\x03") < frames:
+                    chunk = entry.sock.recv(4096)
+                    if not chunk:
+                        raise ConnectionError("Printer closed the connection")
+                    response += chunk
+                entry.sock.settimeout(self.write_timeout)
+            except OSError:
+                # Don't leave a half-read reply on the connection for the next job
+                self._close(address, entry)
+                raise
+            finally:
+                entry.last_used = time.monotonic()
+        finally:
+            entry.lock.release()
+        return response
+
+    def close_idle(self):
+        """Close connections that have not been used within the idle timeout"""
+        now = time.monotonic()
+        with self._lock:
+            entries = list(self._connections.items())
+
+        for address, entry in entries:
+            if entry.sock is None or now - entry.last_used < self.idle_timeout:
+                continue
+            # Skip connections that are busy with a job right now
+            if entry.lock.acquire(blocking=False):
+                try:
+                    if entry.sock is not None:
+                        logger.info(f"Closing idle connection to {address[0]}:{address[1]}")
+                        self._close(address, entry)
+                finally:
+                    entry.lock.release()
+
+    def close_all(self):
+        """Close every connection and stop the idle reaper"""
+        self._stop.set()
+        with self._lock:
+            entries = list(self._connections.items())
+            self._connections = {}
+
+        for address, entry in entries:
+            with entry.lock:
+                self._close(address, entry)
+
+    def open_count(self):
+        """Number of connections currently open"""
+        with self._lock:
+            return sum(1 for entry in self._connections.values() if entry.sock is not None)
+
+    def _entry(self, address):
+        with self._lock:
+            entry = self._connections.get(address)
+            if entry is None:
+                entry = _PooledConnection()
+                self._connections[address] = entry
+                self._start_reaper()
+            return entry
+
+    def _start_reaper(self):
+        # Caller must hold self._lock
+        if self._reaper is None and self.idle_timeout > 0:
+            self._reaper = threading.Thread(target=self._reap, name="tcp-printer-reaper", daemon=True)
+            self._reaper.start()
+
+    def _reap(self):
+        while not self._stop.wait(max(self.idle_timeout / 2, 1)):
+            self.close_idle()
+
+    def _open(self, address):
+        logger.info(f"Connecting to printer at {address[0]}:{address[1]}")
+        sock = socket.create_connection(address, timeout=self.connect_timeout)
+        try:
+            # Labels are written in one go, so don't hold back the last segment
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            enable_keepalive(sock, self.keepalive_idle)
+            sock.settimeout(self.write_timeout)
+        except OSError:
+            sock.close()
+            raise
+        return sock
+
+    def _close(self, address, entry):
+        if entry.sock is None:
+            return
+        try:
+            entry.sock.close()
+        except OSError as e:
+            logger.error(f"Error closing connection to {address[0]}:{address[1]}: {str(e)}")
+        entry.sock = None
+
+    def _alive(self, sock):
+        # An idle printer connection has nothing to read; readable means the
+        # peer closed it (empty read) or reset it
+        try:
+            readable, _, _ = select.select([sock], [], [], 0)
+            if not readable:
+                return True
+            return sock.recv(1, socket.MSG_PEEK) != b""
+        except (OSError, ValueError):
+            return False
+
+
+class _AsyncPooledConnection:
+    __slots__ = ("reader", "writer", "last_used", "lock")
+
+    def __init__(self):
+        self.reader = None
+        self.writer = None
+        self.last_used = time.monotonic()
+        self.lock = asyncio.Lock()
+
+
+class AsyncTcpConnectionPool:
+    """
+    The asyncio version of TcpConnectionPool: one persistent stream per
+    printer address, written without blocking the event loop
+    """
+
+    def __init__(self, connect_timeout=DEFAULT_CONNECT_TIMEOUT, write_timeout=DEFAULT_WRITE_TIMEOUT,
+                 idle_timeout=DEFAULT_IDLE_TIMEOUT, keepalive_idle=DEFAULT_KEEPALIVE_IDLE):
+        self.connect_timeout = connect_timeout
+        self.write_timeout = write_timeout
+        self.idle_timeout = idle_timeout
+        self.keepalive_idle = keepalive_idle
+        self._connections = {}
+        self._reaper = None
+
+    async def send(self, address, data):
+        """Write one job's bytes to the printer at address, reconnecting first if a pooled stream was dropped"""
+        entry = self._entry(address)
+        async with entry.lock:
+            await self._connect(address, entry)
+            try:
+                await self._write(entry.writer, data)
+            except (OSError, asyncio.TimeoutError) as e:
+                # Part of the job may have printed, so it is not sent again
+                self._close(entry)
+                raise WriteInterruptedError(e) from e
+            finally:
+                entry.last_used = time.monotonic()
+        return len(data)
+
+    async def query(self, address, command, frames, timeout=DEFAULT_CONNECT_TIMEOUT):
+        """
+        Send a status command such as ~HS over the printer's stream and read
+        back its reply of `frames` <STX>...<ETX> frames. Returns None without
+        waiting long if a job is using the stream.
+        """
+        entry = self._entry(address)
+        try:
+            await asyncio.wait_for(entry.lock.acquire(), timeout)
+        except asyncio.TimeoutError:
+            return None
+        try:
+            await self._connect(address, entry)
+            try:
+                entry.writer.write(command)
+                await asyncio.wait_for(entry.writer.drain(), timeout)
+                response = b""
+                while response.count(b"\x03") < frames:
+                    chunk = await asyncio.wait_for(entry.reader.read(4096), timeout)
+                    if not chunk:
+                        raise ConnectionError("Printer closed the connection")
+                    response += chunk
+            except (OSError, asyncio.TimeoutError):
+                # Don't leave a half-read reply on the stream for the next job
+                self._close(entry)
+                raise
+            finally:
+                entry.last_used = time.monotonic()
+        finally:
+            entry.lock.release()
+        return response
+
+    def close_idle(self):
+        """Close streams that have not been used within the idle timeout"""
+        now = time.monotonic()
+        for address, entry in list(self._connections.items()):
+            if entry.writer is not None and not entry.lock.locked() and now - entry.last_used >= self.idle_timeout:
+                logger.info(f"Closing idle connection to {address[0]}:{address[1]}")
+                self._close(entry)
+
+    def close_all(self):
+        """Close every stream and stop the idle reaper"""
+        if self._reaper is not None:
+            self._reaper.cancel()
+            self._reaper = None
+        for entry in self._connections.values():
+            self._close(entry)
+        self._connections = {}
+
+    def open_count(self):
+        return sum(1 for entry in self._connections.values() if entry.writer is not None)
+
+    def _entry(self, address):
+        entry = self._connections.get(address)
+        if entry is None:
+            entry = self._connections[address] = _AsyncPooledConnection()
+            self._start_reaper()
+        return entry
+
+    async def _connect(self, address, entry):
+        """Open the entry's stream if it has none; called with entry.lock held"""
+        if entry.writer is not None and (entry.writer.is_closing() or entry.reader.at_eof()):
+            # The printer closed the connection since it was last used
+            logger.info(f"Reconnecting to printer at {address[0]}:{address[1]}")
+            self._close(entry)
+        if entry.writer is None:
+            entry.reader, entry.writer = await self._open(address)
+
+    def _start_reaper(self):
+        if self._reaper is None and self.idle_timeout > 0:
+            self._reaper = asyncio.get_running_loop().create_task(self._reap(), name="tcp-printer-reaper")
+
+    async def _reap(self):
+        while True:
+            await asyncio.sleep(max(self.idle_timeout / 2, 1))
+            self.close_idle()
+
+    async def _open(self, address):
+        logger.info(f"Connecting to printer at {address[0]}:{address[1]}")
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(*address), self.connect_timeout)
+        sock = writer.get_extra_info("socket")
+        try:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            enable_keepalive(sock, self.keepalive_idle)
+        except OSError as e:
+            logger.error(f"Could not set socket options for {address[0]}:{address[1]}: {str(e)}")
+        return reader, writer
+
+    async def _write(self, writer, data):
+        writer.write(data)
+        await asyncio.wait_for(writer.drain(), self.write_timeout)
+
+    def _close(self, entry):
+        if entry.writer is not None:
+            entry.writer.close()
+        entry.reader = entry.writer = None
+
+
+# Network printers and their connections, shared by the print servers
+network_printers = NetworkPrinters.from_spec(
+    os.environ.get('NETWORK_PRINTERS', ''),
+    allow_uris=os.environ.get('ALLOW_TCP_URIS', 'False').lower() in ('true', '1', 't')
+)
+connection_pool = TcpConnectionPool(
+    write_timeout=float(os.environ.get('PRINTER_WRITE_TIMEOUT', DEFAULT_WRITE_TIMEOUT)),
+    idle_timeout=int(os.environ.get('PRINTER_CONNECTION_IDLE_TIMEOUT', DEFAULT_IDLE_TIMEOUT))
+)
+
+
+def send_raw(printer_name, data):
+    """Send encoded ZPL bytes to a network printer and return the number of bytes written"""
+    address = network_printers.address(printer_name)
+    if address is None:
+        raise ValueError(f"'{printer_name}' is not a network printer")
+    with print_metrics.stage(printer_name, "write"):
+        return connection_pool.send(address, data)
+
+
+def query(printer_name, command, frames, timeout=DEFAULT_CONNECT_TIMEOUT):
+    """Send a status command to a network printer and return its reply (None if the printer is busy)"""
+    address = network_printers.address(printer_name)
+    if address is None:
+        raise ValueError(f"'{printer_name}' is not a network printer")
+    return connection_pool.query(address, command, frames, timeout)
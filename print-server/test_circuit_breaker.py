@@ -0,0 +1,142 @@
+"""
+Tests for circuit_breaker.CircuitBreakers, with a fake spool function that
+fails on cue and no delay between attempts:
+
+  python -m unittest test_circuit_breaker
+"""
+
+import subprocess
+import unittest
+from circuit_breaker import (CircuitBreakers, RetryPolicy, CircuitOpenError, WriteInterruptedError, is_transient,
+                             CLOSED, OPEN, HALF_OPEN)
+from printer_health import PrinterNotReadyError
+
+
+class FakeSpooler:
+    """Raises the queued errors in turn, then succeeds"""
+
+    def __init__(self, *errors):
+        self.errors = list(errors)
+        self.calls = 0
+
+    def __call__(self, printer_name, data, job):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return f"Print job sent to {printer_name}"
+
+
+class CircuitBreakersTest(unittest.TestCase):
+
+    def make_breakers(self, attempts=3, failure_threshold=2, reset_timeout=30):
+        return CircuitBreakers(RetryPolicy(attempts, base_delay=0), failure_threshold, reset_timeout)
+
+    def spool(self, breakers, spooler, job=None):
+        return breakers.guard(spooler)("Zebra", b"^XA^XZ", job if job is not None else {})
+
+    def test_transient_error_is_retried(self):
+        spooler = FakeSpooler(ConnectionResetError("reset"), TimeoutError("timed out"))
+        job = {}
+
+        self.spool(self.make_breakers(), spooler, job)
+
+        self.assertEqual((spooler.calls, job["attempts"]), (3, 3))
+
+    def test_gives_up_after_the_last_attempt(self):
+        breakers = self.make_breakers(attempts=2)
+        spooler = FakeSpooler(*[ConnectionResetError("reset")] * 3)
+
+        with self.assertRaises(ConnectionResetError):
+            self.spool(breakers, spooler)
+        self.assertEqual(spooler.calls, 2)
+        self.assertEqual(breakers.retry_counts(), {"Zebra": 1})
+
+    def test_interrupted_write_is_not_retried(self):
+        spooler = FakeSpooler(WriteInterruptedError(ConnectionResetError("reset")))
+
+        with self.assertRaises(WriteInterruptedError):
+            self.spool(self.make_breakers(), spooler)
+        self.assertEqual(spooler.calls, 1)
+
+    def test_only_transient_errors_are_retried(self):
+        self.assertTrue(is_transient(ConnectionRefusedError()))
+        self.assertFalse(is_transient(ValueError("bad label")))
+        self.assertFalse(is_transient(PrinterNotReadyError("Zebra", "paper out")))
+        self.assertFalse(is_transient(WriteInterruptedError(subprocess.CalledProcessError(1, "copy /b"))))
+
+    def test_job_counts_once_however_many_attempts_it_took(self):
+        breakers = self.make_breakers(attempts=3, failure_threshold=2)
+
+        with self.assertRaises(ConnectionResetError):
+            self.spool(breakers, FakeSpooler(*[ConnectionResetError("reset")] * 3))
+
+        self.assertEqual(breakers.get("Zebra").failures, 1)
+        self.assertEqual(breakers.get("Zebra").state, CLOSED)
+
+    def test_circuit_opens_after_threshold_failed_jobs(self):
+        breakers = self.make_breakers(attempts=1, failure_threshold=2)
+        for _ in range(2):
+            with self.assertRaises(ValueError):
+                self.spool(breakers, FakeSpooler(ValueError("bad label")))
+
+        self.assertTrue(breakers.is_open("Zebra"))
+        spooler = FakeSpooler()
+        with self.assertRaises(CircuitOpenError):
+            self.spool(breakers, spooler)
+        self.assertEqual(spooler.calls, 0)
+
+    def test_not_ready_printer_does_not_count_towards_the_circuit(self):
+        breakers = self.make_breakers(attempts=3, failure_threshold=1)
+        spooler = FakeSpooler(PrinterNotReadyError("Zebra", "paper out"))
+
+        with self.assertRaises(PrinterNotReadyError):
+            self.spool(breakers, spooler)
+
+        self.assertEqual(spooler.calls, 1)
+        self.assertFalse(breakers.is_open("Zebra"))
+
+    def test_half_open_test_job_closes_the_circuit(self):
+        breakers = self.make_breakers(attempts=1, failure_threshold=1, reset_timeout=0)
+        with self.assertRaises(ValueError):
+            self.spool(breakers, FakeSpooler(ValueError("bad label")))
+
+        self.spool(breakers, FakeSpooler())
+
+        self.assertEqual(breakers.get("Zebra").state, CLOSED)
+
+    def test_failed_test_job_reopens_the_circuit(self):
+        breakers = self.make_breakers(attempts=1, failure_threshold=3, reset_timeout=0)
+        breaker = breakers.get("Zebra")
+        breaker.state, breaker.opened_at = OPEN, 0
+
+        with self.assertRaises(ValueError):
+            self.spool(breakers, FakeSpooler(ValueError("bad label")))
+
+        self.assertEqual(breaker.state, OPEN)
+
+    def test_half_open_lets_one_test_job_through_at_a_time(self):
+        breaker = self.make_breakers(reset_timeout=0).get("Zebra")
+        breaker.state, breaker.opened_at = OPEN, 0
+
+        self.assertTrue(breaker.allow())
+        self.assertEqual(breaker.state, HALF_OPEN)
+        self.assertFalse(breaker.allow())
+
+        # A test job that couldn't be sent gives its slot back
+        breaker.release()
+        self.assertTrue(breaker.allow())
+
+    def test_not_ready_test_job_gives_back_the_half_open_slot(self):
+        breakers = self.make_breakers(reset_timeout=0)
+        breaker = breakers.get("Zebra")
+        breaker.state, breaker.opened_at = OPEN, 0
+
+        with self.assertRaises(PrinterNotReadyError):
+            self.spool(breakers, FakeSpooler(PrinterNotReadyError("Zebra", "paused")))
+
+        self.assertEqual(breaker.state, HALF_OPEN)
+        self.assertTrue(breaker.allow())
+
+
+if __name__ == "__main__":
+    unittest.main()
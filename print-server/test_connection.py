@@ -69,7 +69,7 @@ def test_print_server(server_url, printer_name=None):
             timeout=10
         )
         
-        if test_response.status_code == 200:
+        if test_response.status_code in (200, 202):
             result = test_response.json()
             if result.get('success'):
                 print(f"✅ Test print sent successfully! Job ID: {result.get('job_id')}")
@@ -0,0 +1,98 @@
+"""
+Tests for idempotency.IdempotencyCache and request_keys. A TTL of 0 stands
+in for a window that has run out:
+
+  python -m unittest test_idempotency
+"""
+
+import unittest
+from idempotency import IdempotencyCache, request_keys
+
+LABEL = {"label": {"rx_number": "RX-1001", "patient_name": "JANE DOE"}}
+
+
+class RequestKeysTest(unittest.TestCase):
+
+    def test_client_key_and_rx_key(self):
+        keys = request_keys("abc", LABEL, "Zebra", "^XA^XZ")
+
+        self.assertEqual(keys[0], ("key:abc", False))
+        key, derived = keys[1]
+        self.assertTrue(key.startswith("rx:RX-1001:Zebra:"))
+        self.assertTrue(derived)
+
+    def test_key_in_the_body(self):
+        self.assertEqual(request_keys(None, {"idempotency_key": "abc"}, "Zebra", "^XA^XZ"), [("key:abc", False)])
+
+    def test_rx_key_depends_on_printer_and_zpl(self):
+        key = request_keys(None, LABEL, "Zebra", "^XA^XZ")
+
+        self.assertEqual(request_keys(None, LABEL, "Zebra", b"^XA^XZ"), key)
+        self.assertNotEqual(request_keys(None, LABEL, "Counter", "^XA^XZ"), key)
+        self.assertNotEqual(request_keys(None, LABEL, "Zebra", "^XA^FDx^FS^XZ"), key)
+
+    def test_reprint_drops_the_rx_key(self):
+        self.assertEqual(request_keys("abc", dict(LABEL, reprint=True), "Zebra", "^XA^XZ"), [("key:abc", False)])
+
+    def test_request_without_key_or_rx_number_has_no_keys(self):
+        self.assertEqual(request_keys(None, {"zpl": "^XA^XZ"}, "Zebra", "^XA^XZ"), [])
+
+
+class IdempotencyCacheTest(unittest.TestCase):
+
+    def test_first_claim_wins(self):
+        cache = IdempotencyCache()
+        first, second = {"id": "1"}, {"id": "2"}
+
+        self.assertIsNone(cache.claim([("key:a", False)], first))
+        self.assertIs(cache.claim([("key:a", False)], second), first)
+        self.assertIs(cache.get([("key:a", False)]), first)
+        self.assertEqual(cache.hits, 2)
+
+    def test_any_matching_key_is_a_duplicate(self):
+        cache = IdempotencyCache()
+        job = {"id": "1"}
+        cache.claim([("key:first-click", False), ("rx:1", True)], job)
+
+        # A second click with a new client key but the same label
+        self.assertIs(cache.claim([("key:second-click", False), ("rx:1", True)], {"id": "2"}), job)
+        self.assertIsNone(cache.get([("key:second-click", False)]))
+
+    def test_expired_key_can_be_claimed_again(self):
+        cache = IdempotencyCache(ttl=0)
+        cache.claim([("key:a", False)], {"id": "1"})
+        job = {"id": "2"}
+
+        self.assertIsNone(cache.get([("key:a", False)]))
+        self.assertIsNone(cache.claim([("key:a", False)], job))
+
+    def test_derived_key_expires_before_the_client_key(self):
+        cache = IdempotencyCache(ttl=600, derived_ttl=0)
+        job = {"id": "1"}
+        cache.claim([("key:a", False), ("rx:1", True)], job)
+
+        self.assertIsNone(cache.get([("rx:1", True)]))
+        self.assertIs(cache.get([("key:a", False)]), job)
+
+    def test_failed_job_does_not_count(self):
+        cache = IdempotencyCache()
+        failed = {"id": "1", "status": "failed"}
+        cache.claim([("key:a", False)], failed)
+        retry = {"id": "2"}
+
+        self.assertIsNone(cache.get([("key:a", False)]))
+        self.assertIsNone(cache.claim([("key:a", False)], retry))
+        self.assertIs(cache.get([("key:a", False)]), retry)
+
+    def test_oldest_keys_are_dropped_beyond_capacity(self):
+        cache = IdempotencyCache(capacity=2)
+        for n in range(3):
+            cache.claim([(f"key:{n}", False)], {"id": str(n)})
+
+        self.assertEqual(len(cache), 2)
+        self.assertIsNone(cache.get([("key:0", False)]))
+        self.assertIsNotNone(cache.get([("key:2", False)]))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,90 @@
+"""
+Tests for job_journal.JobJournal queries and keyset paging, against a
+journal in a temporary directory:
+
+  python -m unittest test_job_journal
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+from job_journal import JobJournal
+
+
+class FakeJob(dict):
+    """Stands in for a job_store.JobRecord"""
+
+    def to_dict(self):
+        return dict(self)
+
+
+class JobJournalTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.journal = JobJournal(os.path.join(self.directory, "jobs.db"), flush_interval=0.01)
+
+    def tearDown(self):
+        self.journal.close()
+        connection = getattr(self.journal._readers, "connection", None)
+        if connection is not None:
+            connection.close()
+        shutil.rmtree(self.directory)
+
+    def record(self, *jobs):
+        for job in jobs:
+            self.journal.record(FakeJob(job))
+        # Closing waits for the writer to flush; queries still work afterwards
+        self.journal.close()
+
+    def pages(self, limit, **filters):
+        ids, cursor = [], None
+        while True:
+            jobs, cursor = self.journal.query(limit=limit, cursor=cursor, **filters)
+            ids.append([job["id"] for job in jobs])
+            if cursor is None:
+                return ids
+
+    def test_pages_are_newest_first_without_gaps_or_repeats(self):
+        self.record(*[{"id": f"j{n}", "printer": "Zebra", "status": "done", "timestamp": 1000 + n} for n in range(7)])
+
+        self.assertEqual(self.pages(3), [["j6", "j5", "j4"], ["j3", "j2", "j1"], ["j0"]])
+
+    def test_jobs_with_the_same_timestamp_are_split_across_pages_by_insert_order(self):
+        self.record(*[{"id": f"j{n}", "printer": "Zebra", "status": "done", "timestamp": 1000.5} for n in range(5)])
+
+        self.assertEqual(self.pages(2), [["j4", "j3"], ["j2", "j1"], ["j0"]])
+
+    def test_filters_apply_to_every_page(self):
+        self.record(*[{"id": f"j{n}", "printer": "Zebra" if n % 2 else "Counter", "status": "done",
+                       "timestamp": 1000 + n} for n in range(8)])
+
+        self.assertEqual(self.pages(2, printer="Zebra"), [["j7", "j5"], ["j3", "j1"]])
+        self.assertEqual(self.pages(10, since=1002, until=1005), [["j4", "j3", "j2"]])
+
+    def test_exact_last_page_has_no_cursor(self):
+        self.record(*[{"id": f"j{n}", "status": "done", "timestamp": 1000 + n} for n in range(4)])
+
+        self.assertEqual(self.pages(2), [["j3", "j2"], ["j1", "j0"]])
+
+    def test_later_state_of_a_job_replaces_the_earlier_one(self):
+        self.record({"id": "j1", "status": "queued", "timestamp": 1000},
+                    {"id": "j1", "status": "done", "timestamp": 1000, "success": True})
+
+        jobs, _ = self.journal.query()
+        self.assertEqual([(job["id"], job["status"]) for job in jobs], [("j1", "done")])
+        self.assertEqual(self.journal.query(status="queued"), ([], None))
+        self.assertEqual(self.journal.get("j1")["status"], "done")
+
+    def test_invalid_cursor_is_rejected(self):
+        self.record()
+
+        with self.assertRaises(ValueError):
+            self.journal.query(cursor="not-a-cursor")
+        with self.assertRaisesRegex(ValueError, "Invalid job query"):
+            self.journal.query_args({"cursor": "1000"})
+
+
+if __name__ == "__main__":
+    unittest.main()
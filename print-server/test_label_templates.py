@@ -0,0 +1,131 @@
+"""
+Tests for label_templates: compiling and rendering templates, and turning
+/print/prescription label data into ZPL:
+
+  python -m unittest test_label_templates
+"""
+
+import unittest
+from label_templates import (TemplateCache, TemplateError, render_prescription_labels, split_instructions,
+                             SIG_LINE_LENGTH)
+from print_batch import MAX_BATCH_LABELS
+
+
+def label(**overrides):
+    """Label data shaped like prepareLabelData() output"""
+    data = {
+        "patientName": "JANE DOE",
+        "date": "05/03/25",
+        "rxNumber": "RX1001-00001",
+        "doctor": {"name": "Dr. Smith"},
+        "medicationName": "AMOXICILLIN 500MG",
+        "sig": "TAKE 1 CAPSULE",
+        "quantity": 30,
+        "unit": "capsules",
+        "refills": "NO REFILLS. DR. AUTH REQUIRED",
+    }
+    data.update(overrides)
+    return data
+
+
+class TemplateCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cache = TemplateCache()
+
+    def test_fields_and_sections_are_filled_in(self):
+        template = self.cache.add("^FX name=test version=1\n^XA^FD{{name}}^FS{{#note}}^FD{{note}}^FS{{/note}}^XZ\n")
+
+        self.assertEqual(template.render({"name": "A", "note": "B"}), "^XA^FDA^FS^FDB^FS^XZ\n")
+        self.assertEqual(template.render({"name": "A"}), "^XA^FDA^FS^XZ\n")
+
+    def test_comments_and_blank_lines_are_dropped(self):
+        template = self.cache.add("^FX name=test version=1\n\n^FX a comment\n^XA\n\n^XZ\n")
+
+        self.assertEqual(template.render({}), "^XA\n^XZ\n")
+
+    def test_latest_version_is_the_default(self):
+        self.cache.add("^FX name=test version=1\n^XA^FDold^FS^XZ")
+        self.cache.add("^FX name=test version=2\n^XA^FDnew^FS^XZ")
+
+        self.assertEqual(self.cache.get("test").version, 2)
+        self.assertEqual(self.cache.get("test", 1).render({}), "^XA^FDold^FS^XZ\n")
+        self.assertEqual(self.cache.versions(), {"test": 2})
+
+    def test_malformed_templates_are_rejected(self):
+        for source in ("^XA^XZ",
+                       "^FX name=test version=1\n{{#a}}^XA",
+                       "^FX name=test version=1\n{{#a}}{{/b}}"):
+            with self.assertRaises(TemplateError):
+                self.cache.add(source)
+
+    def test_unknown_template_is_an_error(self):
+        with self.assertRaises(TemplateError):
+            self.cache.get("missing")
+
+
+class SplitInstructionsTest(unittest.TestCase):
+
+    def test_short_sig_stays_on_one_line(self):
+        self.assertEqual(split_instructions("TAKE 1 CAPSULE"), ("TAKE 1 CAPSULE", ""))
+
+    def test_long_sig_breaks_at_a_space(self):
+        first, second = split_instructions("TAKE 1 CAPSULE BY MOUTH TWICE DAILY FOR 7 DAYS")
+
+        self.assertEqual(f"{first} {second}", "TAKE 1 CAPSULE BY MOUTH TWICE DAILY FOR 7 DAYS")
+        self.assertTrue(second)
+
+    def test_sig_without_spaces_is_cut_at_the_line_length(self):
+        sig = "X" * (SIG_LINE_LENGTH + 5)
+        self.assertEqual(split_instructions(sig), (sig[:SIG_LINE_LENGTH], sig[SIG_LINE_LENGTH:]))
+
+
+class RenderPrescriptionLabelsTest(unittest.TestCase):
+
+    def test_labels_are_rendered_in_order(self):
+        accepted, results, formats = render_prescription_labels([label(), label(medicationName="IBUPROFEN")])
+
+        self.assertEqual([index for index, _, _ in accepted], [0, 1])
+        self.assertIn("^FDAMOXICILLIN 500MG^FS", accepted[0][1])
+        self.assertIn("^FDIBUPROFEN^FS", accepted[1][1])
+        self.assertEqual([result["success"] for result in results], [True, True])
+        self.assertEqual(formats, [])
+
+    def test_bad_label_is_reported_and_the_rest_printed(self):
+        accepted, results, _ = render_prescription_labels([label(patientName=""), label()])
+
+        self.assertEqual([index for index, _, _ in accepted], [1])
+        self.assertFalse(results[0]["success"])
+        self.assertIn("patientName", results[0]["error"])
+
+    def test_field_data_cannot_inject_zpl(self):
+        accepted, _, _ = render_prescription_labels([label(patientName="JANE^XZ~JR")])
+        zpl = accepted[0][1]
+
+        self.assertNotIn("JANE^XZ", zpl)
+        self.assertNotIn("~JR", zpl)
+
+    def test_second_sig_line_moves_the_rest_of_the_label_down(self):
+        one_line = render_prescription_labels([label()])[0][0][1]
+        two_lines = render_prescription_labels([label(sig="TAKE 1 CAPSULE BY MOUTH TWICE DAILY FOR 7 DAYS")])[0][0][1]
+
+        self.assertIn("^FO20,235", one_line)
+        self.assertIn("^FO20,270", two_lines)
+
+    def test_stored_format_sends_a_recall(self):
+        accepted, _, formats = render_prescription_labels([label()], stored_format=True)
+
+        # Only the field values are sent, not the fixed parts of the label
+        self.assertTrue(accepted[0][1].startswith("^XA^XF"))
+        self.assertNotIn("Personal Care Pharmacy", accepted[0][1])
+        self.assertIn("Personal Care Pharmacy", render_prescription_labels([label()])[0][0][1])
+        self.assertEqual(len(formats), 1)
+
+    def test_unusable_label_lists_are_rejected(self):
+        for labels in ([], "label", [label()] * (MAX_BATCH_LABELS + 1)):
+            with self.assertRaises(ValueError):
+                render_prescription_labels(labels)
+
+
+if __name__ == "__main__":
+    unittest.main()
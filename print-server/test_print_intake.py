@@ -0,0 +1,138 @@
+"""
+Tests for print_intake.PrintIntake, with the printer registry, groups, health
+monitor and print queue replaced by fakes:
+
+  python -m unittest test_print_intake
+"""
+
+import threading
+import time
+import unittest
+import uuid
+from job_store import JobRegistry
+from print_intake import PrintIntake, PrintRequestError
+
+
+class FakeRegistry:
+    def __init__(self, printers, default=None):
+        self.printers = set(printers)
+        self.default = default
+
+    def lookup(self, printer_name):
+        return printer_name in self.printers
+
+
+class FakeGroups:
+    def __init__(self, groups=None, members=None):
+        self.groups = groups or {}
+        # The member pick() hands out for each group, None if none is available
+        self.members = members or {}
+
+    def __contains__(self, name):
+        return name in self.groups
+
+    def pick(self, group_name, affinity=None):
+        return self.members.get(group_name)
+
+
+class FakeHealth:
+    interval = 5
+
+    def __init__(self, not_ready=None):
+        self.not_ready = not_ready or {}
+
+    def not_ready_reason(self, printer_name):
+        return self.not_ready.get(printer_name)
+
+    def get(self, printer_name):
+        return None
+
+
+class SlowQueue:
+    """Takes a while to accept a job, like a busy print queue"""
+
+    def __init__(self, delay=0.05):
+        self.delay = delay
+        self.jobs = []
+        self._lock = threading.Lock()
+
+    def submit(self, printer_name, zpl, job):
+        time.sleep(self.delay)
+        job["status"] = "queued"
+        with self._lock:
+            self.jobs.append(job)
+            return len(self.jobs)
+
+
+class PrintIntakeTest(unittest.TestCase):
+
+    def make_intake(self, groups=None, health=None, fall_back_to_default=True):
+        self.queue = SlowQueue()
+        return PrintIntake(FakeRegistry(["Zebra", "Counter"], default="Zebra"), groups or FakeGroups(),
+                           health or FakeHealth(), JobRegistry(10), self.queue, fall_back_to_default)
+
+    def keys(self):
+        return [(f"key:{uuid.uuid4()}", False)]
+
+    def test_same_key_sent_twice_at_once_prints_once(self):
+        intake = self.make_intake()
+        keys = self.keys()
+        start = threading.Barrier(2)
+        results = []
+
+        def send():
+            start.wait()
+            job, position = intake.queue("Zebra", "^XA^XZ", keys=keys)
+            # What the server would put in its response right now
+            results.append((job, position, job.get("status")))
+
+        threads = [threading.Thread(target=send) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(self.queue.jobs), 1)
+        (first, first_position, first_status), (second, second_position, second_status) = results
+        self.assertIs(first, second)
+        self.assertEqual({first_position, second_position}, {1, None})
+        # The duplicate can be answered from the record before the queue has taken it
+        self.assertEqual((first_status, second_status), ("queued", "queued"))
+
+    def test_repeated_key_gets_the_original_job(self):
+        intake = self.make_intake()
+        keys = self.keys()
+        job, position = intake.queue("Zebra", "^XA^XZ", keys=keys)
+
+        self.assertEqual(intake.queue("Zebra", "^XA^XZ", keys=keys), (job, None))
+        self.assertEqual(len(self.queue.jobs), 1)
+
+    def test_unknown_printer_falls_back_to_default(self):
+        intake = self.make_intake()
+        job, _ = intake.queue("Nowhere", "^XA^XZ")
+        self.assertEqual(job["printer"], "Zebra")
+
+    def test_unknown_printer_is_404_without_fallback(self):
+        intake = self.make_intake(fall_back_to_default=False)
+        with self.assertRaises(PrintRequestError) as raised:
+            intake.queue("Nowhere", "^XA^XZ")
+        self.assertEqual(raised.exception.status, 404)
+
+    def test_group_with_no_available_member_is_503_with_retry_after(self):
+        intake = self.make_intake(groups=FakeGroups({"counter": ["Zebra", "Counter"]}))
+        with self.assertRaises(PrintRequestError) as raised:
+            intake.queue("counter", "^XA^XZ")
+        self.assertEqual(raised.exception.status, 503)
+        self.assertEqual(raised.exception.headers["Retry-After"], "5")
+        self.assertEqual(self.queue.jobs, [])
+
+    def test_printer_that_is_not_ready_is_503(self):
+        intake = self.make_intake(health=FakeHealth({"Zebra": "paper out"}))
+        with self.assertRaises(PrintRequestError) as raised:
+            intake.queue("Zebra", "^XA^XZ")
+        self.assertEqual(raised.exception.status, 503)
+        self.assertIn("paper out", str(raised.exception))
+
+
+if __name__ == "__main__":
+    unittest.main()
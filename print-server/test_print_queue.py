@@ -0,0 +1,187 @@
+"""
+Tests for print_queue.PrintQueue, its priority lanes and coalesced writes,
+with a fake spool function standing in for the printer:
+
+  python -m unittest test_print_queue
+"""
+
+import threading
+import unittest
+from print_queue import Lanes, PrintQueue, BULK, INTERACTIVE, JOB_DONE, JOB_FAILED
+
+
+def entry(job_id, priority=INTERACTIVE):
+    return b"^XA^XZ", {"id": job_id, "priority": priority}
+
+
+def pop_all(lanes):
+    return [lanes.popleft()[1]["id"] for _ in range(len(lanes))]
+
+
+class FakeSpooler:
+    """
+    Records each write; the first one waits for release() so jobs can pile up
+    behind it. Raises `error` if one is set.
+    """
+
+    def __init__(self, hold_first=False, error=None, attempts=None):
+        self.writes = []
+        self.error = error
+        self.attempts = attempts
+        self.started = threading.Event()
+        self._release = threading.Event()
+        if not hold_first:
+            self._release.set()
+
+    def release(self):
+        self._release.set()
+
+    def __call__(self, printer_name, data, job):
+        self.writes.append((bytes(data), job))
+        self.started.set()
+        self._release.wait(5)
+        if self.attempts:
+            job["attempts"] = self.attempts
+        if self.error:
+            raise self.error
+        return f"Print job sent to {printer_name}"
+
+
+class LanesTest(unittest.TestCase):
+
+    def test_interactive_jobs_go_before_bulk_jobs(self):
+        lanes = Lanes()
+        for job_entry in (entry("b1", BULK), entry("i1"), entry("b2", BULK), entry("i2")):
+            lanes.append(job_entry)
+
+        self.assertEqual(pop_all(lanes), ["i1", "i2", "b1", "b2"])
+
+    def test_job_without_priority_is_interactive(self):
+        lanes = Lanes()
+        lanes.append(entry("b1", BULK))
+        lanes.append(entry("plain", None))
+
+        self.assertEqual(lanes.waiting(INTERACTIVE), 1)
+        self.assertEqual(pop_all(lanes), ["plain", "b1"])
+
+    def test_bulk_job_goes_after_bulk_every_interactive_jobs(self):
+        lanes = Lanes(bulk_every=2)
+        for job_entry in [entry("b1", BULK), entry("b2", BULK)] + [entry(f"i{n}") for n in range(1, 6)]:
+            lanes.append(job_entry)
+
+        self.assertEqual(pop_all(lanes), ["i1", "i2", "b1", "i3", "i4", "b2", "i5"])
+
+    def test_interactive_jobs_with_no_bulk_waiting_dont_count_towards_bulk_every(self):
+        lanes = Lanes(bulk_every=2)
+        for n in range(1, 4):
+            lanes.append(entry(f"i{n}"))
+        self.assertEqual(pop_all(lanes), ["i1", "i2", "i3"])
+
+        for job_entry in (entry("b1", BULK), entry("i4"), entry("i5"), entry("i6")):
+            lanes.append(job_entry)
+
+        self.assertEqual(pop_all(lanes), ["i4", "i5", "b1", "i6"])
+
+    def test_bulk_every_zero_lets_interactive_jobs_go_first_indefinitely(self):
+        lanes = Lanes(bulk_every=0)
+        lanes.append(entry("b1", BULK))
+        for n in range(1, 11):
+            lanes.append(entry(f"i{n}"))
+
+        self.assertEqual(pop_all(lanes), [f"i{n}" for n in range(1, 11)] + ["b1"])
+
+
+class PrintQueueLanesTest(unittest.TestCase):
+
+    def test_walk_in_label_goes_ahead_of_a_waiting_reprint_run(self):
+        spooler = FakeSpooler(hold_first=True)
+        print_queue = PrintQueue(spooler)
+        print_queue.submit("Zebra", "^XA^XZ", {"id": "printing"})
+        self.assertTrue(spooler.started.wait(5))
+
+        bulk_positions = [print_queue.submit("Zebra", "^XA^XZ", {"id": f"b{n}", "priority": BULK})
+                          for n in (1, 2)]
+        walk_in_position = print_queue.submit("Zebra", "^XA^XZ", {"id": "walk-in"})
+        spooler.release()
+        self.assertTrue(print_queue.wait_idle(5))
+
+        self.assertEqual([job["id"] for _, job in spooler.writes], ["printing", "walk-in", "b1", "b2"])
+        self.assertEqual(bulk_positions, [2, 3])
+        # Only the job being printed is ahead of it
+        self.assertEqual(walk_in_position, 2)
+
+    def test_every_job_finishes(self):
+        print_queue = PrintQueue(FakeSpooler())
+        jobs = [{"id": f"j{n}", "priority": BULK if n % 2 else INTERACTIVE} for n in range(6)]
+        for job in jobs:
+            print_queue.submit("Zebra", "^XA^XZ", job)
+
+        self.assertTrue(print_queue.wait_idle(5))
+        self.assertEqual({job["status"] for job in jobs}, {JOB_DONE})
+        self.assertEqual(print_queue.depth("Zebra"), 0)
+
+
+class CoalescingTest(unittest.TestCase):
+
+    def submit(self, print_queue, count, zpl="^XA^XZ"):
+        jobs = [{"id": f"j{n}"} for n in range(1, count + 1)]
+        for job in jobs:
+            print_queue.submit("Zebra", zpl, job)
+        self.assertTrue(print_queue.wait_idle(5))
+        return jobs
+
+    def test_jobs_within_the_window_are_sent_as_one_write(self):
+        spooler = FakeSpooler()
+        jobs = self.submit(PrintQueue(spooler, coalesce_window=0.5), 3)
+
+        self.assertEqual(len(spooler.writes), 1)
+        data, write = spooler.writes[0]
+        self.assertEqual(data, b"^XA^XZ\n^XA^XZ\n^XA^XZ")
+        self.assertEqual(write["id"], "j1+2")
+        self.assertEqual(write["label_count"], 3)
+        for job in jobs:
+            self.assertEqual((job["status"], job["coalesced"]), (JOB_DONE, 3))
+
+    def test_jobs_outside_the_window_are_sent_alone(self):
+        spooler = FakeSpooler()
+        print_queue = PrintQueue(spooler, coalesce_window=0.01)
+        self.submit(print_queue, 1)
+        self.submit(print_queue, 1)
+
+        self.assertEqual([write["id"] for _, write in spooler.writes], ["j1", "j1"])
+
+    def test_without_a_window_each_job_is_its_own_write(self):
+        spooler = FakeSpooler()
+        jobs = self.submit(PrintQueue(spooler), 3)
+
+        self.assertEqual([write for _, write in spooler.writes], jobs)
+        self.assertNotIn("coalesced", jobs[0])
+
+    def test_write_stops_taking_jobs_at_the_byte_limit(self):
+        spooler = FakeSpooler()
+        # Two 8-byte jobs reach the limit, so the third goes in a write of its own
+        self.submit(PrintQueue(spooler, coalesce_window=0.5, coalesce_max_bytes=10), 3, zpl="^XA12^XZ")
+
+        self.assertEqual([write["id"] for _, write in spooler.writes], ["j1+1", "j3"])
+
+    def test_failed_write_fails_every_job_in_it(self):
+        spooler = FakeSpooler(error=ConnectionResetError("Printer dropped the connection"))
+        print_queue = PrintQueue(spooler, coalesce_window=0.5)
+        jobs = self.submit(print_queue, 3)
+
+        self.assertEqual(len(spooler.writes), 1)
+        for job in jobs:
+            self.assertEqual(job["status"], JOB_FAILED)
+            self.assertIs(job["success"], False)
+            self.assertEqual(job["error"], "Printer dropped the connection")
+        self.assertEqual(print_queue.depth("Zebra"), 0)
+
+    def test_write_fields_are_copied_to_every_job(self):
+        spooler = FakeSpooler(attempts=2)
+        jobs = self.submit(PrintQueue(spooler, coalesce_window=0.5), 2)
+
+        self.assertEqual([job["attempts"] for job in jobs], [2, 2])
+
+
+if __name__ == "__main__":
+    unittest.main()
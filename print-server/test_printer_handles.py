@@ -0,0 +1,122 @@
+"""
+Tests for printer_handles.PrinterHandlePool, using a fake win32print module
+so they run without Windows:
+
+  python -m unittest test_printer_handles
+"""
+
+import unittest
+from printer_handles import PrinterHandlePool
+
+
+class FakeWin32Print:
+    """Records OpenPrinter/ClosePrinter calls; GetPrinter fails for handles marked stale"""
+
+    def __init__(self):
+        self.opened = []
+        self.closed = []
+        self.stale = set()
+
+    def OpenPrinter(self, printer_name):
+        handle = (printer_name, len(self.opened) + 1)
+        self.opened.append(handle)
+        return handle
+
+    def ClosePrinter(self, handle):
+        self.closed.append(handle)
+
+    def GetPrinter(self, handle, level):
+        if handle in self.stale:
+            raise OSError("The handle is invalid")
+        return {"Status": 0}
+
+
+class PrinterHandlePoolTest(unittest.TestCase):
+
+    def setUp(self):
+        self.win32print = FakeWin32Print()
+        self.pool = PrinterHandlePool(self.win32print, idle_timeout=60, health_check_after=30)
+
+    def tearDown(self):
+        self.pool.close_all()
+
+    def borrow(self, printer_name="Zebra"):
+        with self.pool.handle(printer_name) as handle:
+            return handle
+
+    def age(self, printer_name, seconds):
+        # Pretend the handle was last used `seconds` ago
+        self.pool._handles[printer_name].last_used -= seconds
+
+    def test_handle_is_reused_between_jobs(self):
+        first = self.borrow()
+        second = self.borrow()
+
+        self.assertEqual(first, second)
+        self.assertEqual(len(self.win32print.opened), 1)
+        self.assertEqual(self.win32print.closed, [])
+        self.assertEqual(self.pool.open_count(), 1)
+
+    def test_each_printer_gets_its_own_handle(self):
+        self.assertNotEqual(self.borrow("Zebra"), self.borrow("Counter"))
+        self.assertEqual(self.pool.open_count(), 2)
+
+    def test_idle_handle_is_closed_and_reopened_on_next_job(self):
+        first = self.borrow()
+        self.age("Zebra", 61)
+
+        self.pool.close_idle()
+
+        self.assertEqual(self.win32print.closed, [first])
+        self.assertEqual(self.pool.open_count(), 0)
+        self.assertNotEqual(self.borrow(), first)
+        self.assertEqual(len(self.win32print.opened), 2)
+
+    def test_recently_used_handle_is_not_closed(self):
+        self.borrow()
+        self.age("Zebra", 30)
+
+        self.pool.close_idle()
+
+        self.assertEqual(self.win32print.closed, [])
+        self.assertEqual(self.pool.open_count(), 1)
+
+    def test_stale_handle_is_replaced_before_reuse(self):
+        first = self.borrow()
+        self.win32print.stale.add(first)
+        self.age("Zebra", 31)
+
+        second = self.borrow()
+
+        self.assertNotEqual(second, first)
+        self.assertEqual(self.win32print.closed, [first])
+        self.assertEqual(self.pool.open_count(), 1)
+
+    def test_handle_is_not_checked_while_in_regular_use(self):
+        first = self.borrow()
+        self.win32print.stale.add(first)
+
+        # Used again within health_check_after, so no GetPrinter round trip
+        self.assertEqual(self.borrow(), first)
+
+    def test_handle_is_dropped_after_a_failed_job(self):
+        with self.assertRaises(RuntimeError):
+            with self.pool.handle("Zebra") as handle:
+                failed = handle
+                raise RuntimeError("WritePrinter failed")
+
+        self.assertEqual(self.win32print.closed, [failed])
+        self.assertEqual(self.pool.open_count(), 0)
+        self.assertNotEqual(self.borrow(), failed)
+
+    def test_close_all_closes_every_handle(self):
+        handles = {self.borrow("Zebra"), self.borrow("Counter")}
+
+        self.pool.close_all()
+
+        self.assertEqual(set(self.win32print.closed), handles)
+        self.assertEqual(self.pool.open_count(), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,71 @@
+"""
+Win32 spooler helpers shared by the Windows print servers.
+Sends raw ZPL bytes to a printer through the win32print RAW datatype.
+"""
+
+import logging
+import os
+import win32print
+from circuit_breaker import WriteInterruptedError
+from printer_handles import PrinterHandlePool, DEFAULT_IDLE_TIMEOUT
+from print_metrics import print_metrics
+
+logger = logging.getLogger(__name__)
+
+# Printer handles stay open between jobs and are closed once idle
+handle_pool = PrinterHandlePool(
+    win32print,
+    idle_timeout=int(os.environ.get('PRINTER_HANDLE_IDLE_TIMEOUT', DEFAULT_IDLE_TIMEOUT))
+)
+
+
+def spool_raw(printer_name, data, doc_name="Prescription Label"):
+    """Send encoded ZPL bytes to a printer as a single RAW spooler job and return the spooler job id"""
+    # Borrow a long-lived handle instead of opening the printer per job
+    with handle_pool.handle(printer_name) as printer_handle:
+        # Start a print job
+        spool_job_id = win32print.StartDocPrinter(printer_handle, 1, (doc_name, None, "RAW"))
+
+        try:
+            win32print.StartPagePrinter(printer_handle)
+
+            # Send the ZPL straight from memory, no temp file round trip
+            with print_metrics.stage(printer_name, "write"):
+                try:
+                    win32print.WritePrinter(printer_handle, data)
+                except Exception as e:
+                    # The spooler may already hold part of the job
+                    raise WriteInterruptedError(e) from e
+
+            win32print.EndPagePrinter(printer_handle)
+        finally:
+            win32print.EndDocPrinter(printer_handle)
+
+    return spool_job_id
+
+
+def enumerate_printers():
+    """Return (printer_names, default_printer) for the local printers"""
+    printers = [printer[2] for printer in win32print.EnumPrinters(win32print.PRINTER_ENUM_LOCAL, None, 1)]
+    return printers, win32print.GetDefaultPrinter()
+
+
+def printer_status(printer_name):
+    """
+    Health flags for a local printer from the spooler's printer status, which
+    the Zebra driver's status monitor keeps up to date from the printer
+    """
+    # A handle of its own, so health polls neither wait for a job's pooled
+    # handle nor keep it from being closed when idle
+    printer_handle = win32print.OpenPrinter(printer_name)
+    try:
+        status = win32print.GetPrinter(printer_handle, 2)["Status"]
+    finally:
+        win32print.ClosePrinter(printer_handle)
+    return {
+        "paper_out": bool(status & (win32print.PRINTER_STATUS_PAPER_OUT | win32print.PRINTER_STATUS_PAPER_JAM)),
+        "paused": bool(status & win32print.PRINTER_STATUS_PAUSED),
+        "head_open": bool(status & win32print.PRINTER_STATUS_DOOR_OPEN),
+        "buffer_full": bool(status & win32print.PRINTER_STATUS_OUT_OF_MEMORY),
+        "offline": bool(status & (win32print.PRINTER_STATUS_OFFLINE | win32print.PRINTER_STATUS_NOT_AVAILABLE)),
+    }
@@ -0,0 +1,61 @@
+"""
+ZPL helpers shared by the Zebra print servers.
+"""
+
+import re
+
+# Encoding used when ZPL text is turned into the bytes sent to the printer
+ZPL_ENCODING = "utf-8"
+
+# Largest quantity a ^PQ command accepts
+MAX_PRINT_QUANTITY = 99999999
+
+_FORMAT_RE = re.compile(r"\^XA.*?\^XZ", re.S | re.I)
+_STORE_FORMAT_RE = re.compile(r"\^DF", re.I)
+_QUANTITY_RE = re.compile(r"\^PQ(\d*)", re.I)
+
+
+def encode_zpl(zpl):
+    """Encode ZPL text once for the printer; bytes pass through untouched"""
+    if isinstance(zpl, (bytes, bytearray, memoryview)):
+        return zpl
+    return zpl.encode(ZPL_ENCODING)
+
+
+def escape_field_data(value):
+    """
+    Make a value safe to place after ^FH^FD. The ZPL control characters are
+    written as _XX hex escapes so patient or drug names can't break the label.
+    """
+    text = "" if value is None else str(value)
+    return text.replace("_", "_5F").replace("^", "_5E").replace("~", "_7E")
+
+
+def set_copies(zpl, copies):
+    """
+    Print each label format in zpl `copies` times by setting its ^PQ
+    quantity, so the printer repeats the label from its own buffer rather
+    than being sent it again. An existing ^PQ quantity is multiplied; formats
+    that only store a layout (^DF) are left alone. Raises ValueError if there
+    is no label to print copies of.
+    """
+    if copies == 1:
+        return zpl
+    rewritten = 0
+
+    def rewrite(match):
+        nonlocal rewritten
+        label = match.group(0)
+        if _STORE_FORMAT_RE.search(label):
+            return label
+        rewritten += 1
+        if _QUANTITY_RE.search(label):
+            return _QUANTITY_RE.sub(
+                lambda pq: f"^PQ{min(int(pq.group(1) or 1) * copies, MAX_PRINT_QUANTITY)}", label)
+        # ^PQ goes just before the closing ^XZ
+        return f"{label[:-3]}^PQ{copies}{label[-3:]}"
+
+    zpl = _FORMAT_RE.sub(rewrite, zpl)
+    if not rewritten:
+        raise ValueError("'copies' needs ZPL with a ^XA...^XZ label format")
+    return zpl
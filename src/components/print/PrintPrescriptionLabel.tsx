@@ -2,7 +2,7 @@ import React, { useRef, useState } from 'react';
 import { useReactToPrint } from 'react-to-print';
 import PrescriptionLabel from './PrescriptionLabel';
 import { Prescription, Patient, Doctor, Medication, PrescriptionMedication } from '@/types/database';
-import { prepareLabelData, printToZebra, checkPrintServerStatus } from '@/utils/printService';
+import { prepareLabelData, printBatchToZebra, waitForPrintJob, checkPrintServerStatus, isUnansweredPrintError } from '@/utils/printService';
 import PrintServerConfigModal from '../modals/PrintServerConfigModal';
 
 interface PrintPrescriptionLabelProps {
@@ -31,9 +31,17 @@ const PrintPrescriptionLabel: React.FC<PrintPrescriptionLabelProps> = ({
 }) => {
   const labelRef = useRef<HTMLDivElement>(null);
   const [isPrinting, setIsPrinting] = useState(false);
-  const [printResult, setPrintResult] = useState<{ success: boolean; message: string } | null>(null);
+  // pending while the labels are queued but not yet printed
+  const [printResult, setPrintResult] = useState<{ success: boolean; pending?: boolean; message: string } | null>(null);
   const [showConfigModal, setShowConfigModal] = useState(false);
   const [serverStatus, setServerStatus] = useState<'unknown' | 'online' | 'offline'>('unknown');
+  // Idempotency key for these labels, kept until the server has answered so a
+  // second click after a timeout can't print them twice
+  const printKeyRef = useRef<string | null>(null);
+  // Stops waiting for a queued job once the dialog is closed
+  const pollAbortRef = useRef<AbortController | null>(null);
+
+  React.useEffect(() => () => pollAbortRef.current?.abort(), []);
 
   // Handler for browser printing
   const handlePrint = useReactToPrint({
@@ -68,35 +76,59 @@ const PrintPrescriptionLabel: React.FC<PrintPrescriptionLabelProps> = ({
     setPrintResult(null);
 
     try {
-      // Print each medication on a separate label
-      let successCount = 0;
-      for (const { medication, prescriptionMedication } of medications) {
-        const labelData = prepareLabelData(
+      // Print each medication on a separate label, sent to the server as one batch
+      const labels = medications.map(({ medication, prescriptionMedication }) =>
+        prepareLabelData(
           prescription,
           patient,
           doctor,
           medication,
           prescriptionMedication,
           PHARMACY_INFO
-        );
+        )
+      );
 
-        const success = await printToZebra(labelData);
-        
-        if (!success) {
-          setPrintResult({
-            success: false,
-            message: `Failed to print label ${successCount + 1} of ${medications.length}`
-          });
-          break;
-        }
-        successCount++;
+      if (!printKeyRef.current) {
+        printKeyRef.current = crypto.randomUUID();
       }
-      
-      if (successCount === medications.length) {
-        setPrintResult({ success: true, message: `Successfully printed ${medications.length} label(s)` });
+      const queued = await printBatchToZebra(labels, printKeyRef.current);
+      // The server answered, so the next click is a new print
+      printKeyRef.current = null;
+
+      const labelCount = medications.length - queued.rejectedLabels;
+      const rejected = queued.rejectedLabels > 0
+        ? ` ${queued.rejectedLabels} label(s) could not be printed.`
+        : '';
+      setPrintResult({ success: true, pending: true, message: `Queued ${labelCount} label(s) on ${queued.printer}.${rejected}` });
+
+      // The server queues the job and answers straight away, so wait for the printer
+      pollAbortRef.current = new AbortController();
+      const job = await waitForPrintJob(queued, pollAbortRef.current.signal);
+      if (pollAbortRef.current.signal.aborted) {
+        return;
+      }
+      if (job.status === 'done') {
+        setPrintResult({
+          success: queued.rejectedLabels === 0,
+          message: `Printed ${labelCount} label(s) on ${job.printer}.${rejected}`
+        });
+      } else if (job.status === 'failed') {
+        setPrintResult({
+          success: false,
+          message: `Failed to print ${labelCount} label(s) on ${job.printer}${job.error ? `: ${job.error}` : ''}`
+        });
+      } else {
+        setPrintResult({
+          success: true,
+          pending: true,
+          message: `${labelCount} label(s) still ${job.status} on ${job.printer}. Check the printer before printing again.`
+        });
       }
     } catch (error) {
       console.error('Print error:', error);
+      if (!isUnansweredPrintError(error)) {
+        printKeyRef.current = null;
+      }
       setPrintResult({
         success: false,
         message: error instanceof Error ? error.message : 'Unknown error occurred'
@@ -156,7 +188,9 @@ const PrintPrescriptionLabel: React.FC<PrintPrescriptionLabelProps> = ({
       {/* Print Result Message */}
       {printResult && (
         <div className={`p-3 rounded-md ${
-          printResult.success ? 'bg-green-50 text-green-800' : 'bg-red-50 text-red-800'
+          printResult.pending
+            ? 'bg-blue-50 text-blue-800'
+            : printResult.success ? 'bg-green-50 text-green-800' : 'bg-red-50 text-red-800'
         }`}>
           <p className="text-sm">{printResult.message}</p>
         </div>
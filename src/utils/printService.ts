@@ -10,7 +10,9 @@ const PRINT_SERVER_CONFIG = {
   endpoints: {
     status: '/status',
     printers: '/printers',
-    print: '/print'
+    print: '/print',
+    printPrescription: '/print/prescription',
+    job: '/job'
   },
   // Default printer - will be overridden by localStorage if available
   selectedPrinter: 'ZDesigner GK420d (Copy 1)'
@@ -187,156 +189,123 @@ export const getAvailablePrinters = async (): Promise<string[]> => {
 };
 
 /**
- * Generate ZPL (Zebra Programming Language) code for a prescription label
- * @param labelData Data for the prescription label
- * @returns string ZPL code
+ * Whether a print request failed without an answer from the print server (a
+ * timeout or a dropped connection), so the labels may or may not have printed.
+ * Send it again with the same idempotency key rather than a new one.
+ * @param error The error thrown by printToZebra or printBatchToZebra
+ * @returns boolean True if the server's answer was never received
  */
-const generateZPL = (labelData: any): string => {
-  // Create a more structured and visually appealing label with ZPL
-  // Optimized for 3" x 2" thermal label on Zebra GK420d printer
-  // Adjusted to start from the left edge of the label with Zebra Font D
-  
-  // Format date as dd/mm/yy
-  const formatDateDDMMYY = (dateStr: string): string => {
-    // If no date provided, use today's date
-    if (!dateStr) {
-      const today = new Date();
-      return `${today.getDate().toString().padStart(2, '0')}/${(today.getMonth() + 1).toString().padStart(2, '0')}/${today.getFullYear().toString().slice(-2)}`;
-    }
-    
-    try {
-      const date = new Date(dateStr);
-      // Check if date is valid
-      if (isNaN(date.getTime())) {
-        // If invalid, use today's date
-        const today = new Date();
-        return `${today.getDate().toString().padStart(2, '0')}/${(today.getMonth() + 1).toString().padStart(2, '0')}/${today.getFullYear().toString().slice(-2)}`;
-      }
-      
-      return `${date.getDate().toString().padStart(2, '0')}/${(date.getMonth() + 1).toString().padStart(2, '0')}/${date.getFullYear().toString().slice(-2)}`;
-    } catch (error) {
-      console.error('Date formatting error:', error);
-      // If error, use today's date
-      const today = new Date();
-      return `${today.getDate().toString().padStart(2, '0')}/${(today.getMonth() + 1).toString().padStart(2, '0')}/${today.getFullYear().toString().slice(-2)}`;
-    }
-  };
-  
-  const formattedDate = formatDateDDMMYY(labelData.date);
-  
-  // Process instructions for multi-line support
-  const processInstructions = (sig: string): { line1: string; line2: string; needsTwoLines: boolean } => {
-    if (!sig) return { line1: '', line2: '', needsTwoLines: false };
-    
-    if (sig.length <= 25) { // Reduced character limit to ensure better word wrapping
-      return { line1: sig, line2: '', needsTwoLines: false };
-    }
-    
-    // Try to find a good breaking point around the middle of the string
-    const midPoint = Math.floor(sig.length / 2);
-    let breakPoint = sig.indexOf(' ', midPoint);
-    
-    // If no space found after midpoint, try to find one before midpoint
-    if (breakPoint === -1) {
-      breakPoint = sig.lastIndexOf(' ', midPoint);
-    }
-    
-    // If still no good breaking point, just split at character 25
-    if (breakPoint === -1) {
-      return {
-        line1: sig.substring(0, 25),
-        line2: sig.substring(25),
-        needsTwoLines: true
-      };
-    }
-    
-    // Split at the found breaking point
-    return {
-      line1: sig.substring(0, breakPoint),
-      line2: sig.substring(breakPoint + 1), // +1 to skip the space
-      needsTwoLines: true
-    };
-  };
-  
-  // Process the instructions
-  const instructionInfo = processInstructions(labelData.sig);
-  
-  // Build the ZPL code based on whether we have one or two lines of instructions
-  let zpl = `^XA
-^PW609
-^LL406
-^LS0
-^LH0,0
-
-^FO10,20^GB589,380,2^FS
-
-^ADN,30,15
-^FO20,40^FD${labelData.patientName}^FS
-
-^ADN,24,12
-^FO400,45^FDDATE: ${formattedDate}^FS
-
-^ADN,26,13
-^FO20,70^FDRx: ${labelData.rxNumber}^FS
-^ADN,26,13
-^FO300,70^FDDr. ${labelData.doctor?.name ? labelData.doctor.name.toUpperCase() : ''}^FS
-
-^FO20,90^GB569,1,2^FS
-
-^ACN,36,20
-^FO20,105^FD${labelData.medicationName}^FS
+export const isUnansweredPrintError = (error: unknown): boolean => {
+  if (error instanceof TypeError) {
+    // fetch rejects with a TypeError when the connection fails
+    return true;
+  }
+  return error instanceof DOMException && (error.name === 'TimeoutError' || error.name === 'AbortError');
+};
 
-^ADN,32,16
-^FO20,150^FD${instructionInfo.line1}^FS
-`;
+/**
+ * A print job as the print server reports it. The server answers a print
+ * request as soon as the job is queued, so a new job is usually still
+ * 'queued'; use waitForPrintJob to find out whether it printed.
+ */
+export interface PrintJob {
+  jobId: string;
+  status: 'queued' | 'spooling' | 'done' | 'failed';
+  printer: string;
+  error?: string;
+  // Labels the server could not render and left out of the job
+  rejectedLabels: number;
+}
 
-  // Add second line of instructions if needed
-  if (instructionInfo.needsTwoLines) {
-    zpl += `^ADN,32,16
-^FO20,185^FD${instructionInfo.line2}^FS
+const FINISHED_JOB_STATUSES = ['done', 'failed'];
 
-^ADN,26,13
-^FO20,220^FDQTY: ${labelData.quantity} ${labelData.unit}^FS
-`;
-  } else {
-    zpl += `^ADN,26,13
-^FO20,185^FDQTY: ${labelData.quantity} ${labelData.unit}^FS
-`;
+/**
+ * Read the job from a print request's response, throwing if it was refused
+ */
+const toPrintJob = async (response: Response): Promise<PrintJob> => {
+  const data = await response.json().catch(() => ({}));
+  if (!response.ok || data.success !== true) {
+    throw new Error(data.error || `Server responded with status: ${response.status}`);
   }
-  
-  // Add refills on the appropriate line based on instruction length
-  const refillsY = instructionInfo.needsTwoLines ? 250 : 215;
-  zpl += `^ADN,26,13
-^FO20,${refillsY}^FD${labelData.refills}^FS
-
-`;
-  
-  // Add the bottom divider and pharmacy information
-  const dividerY = instructionInfo.needsTwoLines ? 270 : 235;
-  zpl += `^FO20,${dividerY}^GB569,1,1^FS
+  const results: { success: boolean }[] = data.results || [];
+  return {
+    jobId: data.job_id,
+    status: data.status,
+    printer: data.printer,
+    rejectedLabels: results.filter(result => !result.success).length
+  };
+};
 
-^ADN,26,13
-^FO20,${dividerY + 20}^FDPersonal Care Pharmacy Ltd^FS
+/**
+ * Get the current state of a print job
+ * @param jobId The job_id the print server answered with
+ * @returns Promise<PrintJob | null> The job, or null if the server no longer knows it
+ */
+export const getPrintJob = async (jobId: string): Promise<PrintJob | null> => {
+  const response = await fetch(`${normalizeUrl(PRINT_SERVER_CONFIG.url)}${PRINT_SERVER_CONFIG.endpoints.job}/${encodeURIComponent(jobId)}`, {
+    method: 'GET',
+    headers: {
+      'Accept': 'application/json'
+    },
+    signal: AbortSignal.timeout(5000), // 5 second timeout
+    mode: 'cors', // Enable CORS
+    credentials: 'omit' // Don't send cookies
+  });
 
-^ADN,26,13
-^FO20,${dividerY + 45}^FD72 Aranguez Main Rd, San Juan^FS
-^ADN,26,13
-^FO20,${dividerY + 70}^FDTel: 638-2889  Whatsapp: 352-2676^FS
+  if (response.status === 404) {
+    return null;
+  }
+  if (!response.ok) {
+    throw new Error(`Server responded with status: ${response.status}`);
+  }
 
-^ADN,28,14
-^FO20,${dividerY + 100}^FDPharmacist: _______________________^FS
+  const data = await response.json();
+  return {
+    jobId: data.id,
+    status: data.status,
+    printer: data.printer,
+    error: data.error || undefined,
+    rejectedLabels: 0
+  };
+};
 
-^XZ`;
-  
-  return zpl;
+/**
+ * Poll a queued print job until it is done or failed
+ * @param job The job returned by printToZebra or printBatchToZebra
+ * @param signal Stops polling early, e.g. when the dialog is closed
+ * @param timeoutMs How long to wait before giving up and returning the job as last seen
+ * @returns Promise<PrintJob> The finished job, or the last state seen if it hasn't finished in time
+ */
+export const waitForPrintJob = async (
+  job: PrintJob,
+  signal?: AbortSignal,
+  timeoutMs: number = 60000
+): Promise<PrintJob> => {
+  const deadline = Date.now() + timeoutMs;
+  let current = job;
+  while (!FINISHED_JOB_STATUSES.includes(current.status) && Date.now() < deadline && !signal?.aborted) {
+    await new Promise(resolve => setTimeout(resolve, 1000));
+    try {
+      const latest = await getPrintJob(job.jobId);
+      if (!latest) {
+        // Dropped from the server's recent history, so its outcome is unknown
+        break;
+      }
+      current = { ...latest, rejectedLabels: job.rejectedLabels };
+    } catch (error) {
+      console.error('Error checking print job:', error);
+    }
+  }
+  return current;
 };
 
 /**
  * Send a print job to the Zebra GK420D printer via the Windows print server
  * @param labelData Data for the prescription label
- * @returns Promise<boolean> True if printing was successful, false otherwise
+ * @param idempotencyKey Key for these labels; reuse it when retrying after isUnansweredPrintError so the server prints them only once
+ * @returns Promise<PrintJob> The queued job (or the original one for a repeated request); throws if the server refused it
  */
-export const printToZebra = async (labelData: any): Promise<boolean> => {
+export const printToZebra = async (labelData: any, idempotencyKey: string = crypto.randomUUID()): Promise<PrintJob> => {
   try {
     // First check if the server is online
     const isServerOnline = await checkPrintServerStatus();
@@ -344,27 +313,25 @@ export const printToZebra = async (labelData: any): Promise<boolean> => {
       throw new Error('Print server is offline. Please check the connection.');
     }
     
-    // Generate ZPL code for the label
-    const zplCode = generateZPL(labelData);
-    
     // Get the selected printer
     const selectedPrinter = getSelectedPrinter();
     
     // Debug log
     console.log('Sending to print server:', {
-      url: `${normalizeUrl(PRINT_SERVER_CONFIG.url)}${PRINT_SERVER_CONFIG.endpoints.print}`,
-      zplCode,
+      url: `${normalizeUrl(PRINT_SERVER_CONFIG.url)}${PRINT_SERVER_CONFIG.endpoints.printPrescription}`,
+      labelData,
       printer: selectedPrinter
     });
     
-    // Send the ZPL code to the print server
-    const response = await fetch(`${normalizeUrl(PRINT_SERVER_CONFIG.url)}${PRINT_SERVER_CONFIG.endpoints.print}`, {
+    // Send the label data to the print server, which renders the ZPL
+    const response = await fetch(`${normalizeUrl(PRINT_SERVER_CONFIG.url)}${PRINT_SERVER_CONFIG.endpoints.printPrescription}`, {
       method: 'POST',
       headers: {
         'Content-Type': 'application/json',
+        'Idempotency-Key': idempotencyKey,
       },
       body: JSON.stringify({
-        zpl: zplCode,
+        label: labelData,
         printer: selectedPrinter // Use the selected printer from configuration
       }),
       // Add a timeout to prevent long waits
@@ -373,14 +340,47 @@ export const printToZebra = async (labelData: any): Promise<boolean> => {
       credentials: 'omit' // Don't send cookies
     });
     
-    if (!response.ok) {
-      throw new Error(`Server responded with status: ${response.status}`);
+    return await toPrintJob(response);
+  } catch (error) {
+    console.error('Error printing to Zebra:', error);
+    throw error; // Re-throw to allow the component to handle the error
+  }
+};
+
+/**
+ * Send several prescription labels to the Zebra printer as a single batch job
+ * @param labelDataList Data for each prescription label, in print order
+ * @param idempotencyKey Key for these labels; reuse it when retrying after isUnansweredPrintError so the server prints them only once
+ * @returns Promise<PrintJob> The queued job (or the original one for a repeated request); throws if the server refused it
+ */
+export const printBatchToZebra = async (labelDataList: any[], idempotencyKey: string = crypto.randomUUID()): Promise<PrintJob> => {
+  try {
+    // First check if the server is online
+    const isServerOnline = await checkPrintServerStatus();
+    if (!isServerOnline) {
+      throw new Error('Print server is offline. Please check the connection.');
     }
     
-    const data = await response.json();
-    return data.success === true;
+    // Send all labels to the print server in one request; the server renders the ZPL
+    const response = await fetch(`${normalizeUrl(PRINT_SERVER_CONFIG.url)}${PRINT_SERVER_CONFIG.endpoints.printPrescription}`, {
+      method: 'POST',
+      headers: {
+        'Content-Type': 'application/json',
+        'Idempotency-Key': idempotencyKey,
+      },
+      body: JSON.stringify({
+        labels: labelDataList,
+        printer: getSelectedPrinter()
+      }),
+      // Add a timeout to prevent long waits
+      signal: AbortSignal.timeout(10000), // 10 second timeout for printing
+      mode: 'cors', // Enable CORS
+      credentials: 'omit' // Don't send cookies
+    });
+    
+    return await toPrintJob(response);
   } catch (error) {
-    console.error('Error printing to Zebra:', error);
+    console.error('Error printing batch to Zebra:', error);
     throw error; // Re-throw to allow the component to handle the error
   }
 };
@@ -468,6 +468,10 @@ export const prepareLabelData = (
 
 export default {
   printToZebra,
+  printBatchToZebra,
+  getPrintJob,
+  waitForPrintJob,
+  isUnansweredPrintError,
   prepareLabelData,
   checkPrintServerStatus,
   getAvailablePrinters,